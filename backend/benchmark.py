@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+Load benchmark of the API against a local data directory.
+
+Starts the server on a data directory (typically one written by
+synthetic_data.py), records the time until it answers its first request, then
+drives each scenario with a number of concurrent clients for a fixed duration
+and reports throughput and latency percentiles. Request parameters are drawn
+from the data itself (viewports around real points, prefixes of real names,
+proteins with predictions, existing structures), so every request does real
+work. Pass ``--url`` to benchmark an already running server instead; the data
+directory is then only used to draw parameters.
+
+Scenarios:
+  points        GET /api/points over random viewports, a third with filters
+  ws_points     viewport queries over /api/ws/points, one socket per client
+  name_search   GET /api/name_search with 3-8 character name prefixes
+  goterm        GET /api/goterm/{protein}
+  autocomplete  GET /api/goterm_autocomplete with 2-6 character word prefixes
+  pdb           GET /api/pdb/{pdb_loc}
+
+Requires httpx and websockets in addition to the server's dependencies
+(``pip install -r requirements-dev.txt``).
+
+usage:
+  python benchmark.py --data DIR [--url URL] [--port N] [--scenarios NAME,...]
+                      [--duration SECONDS] [--concurrency N] [--json FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import websockets
+from loguru import logger
+
+SCENARIOS = ["points", "ws_points", "name_search", "goterm", "autocomplete", "pdb"]
+FILTER_TYPES = ["AFDB light clusters", "AFDB dark clusters", "ESMAtlas clusters", "MIP clusters", "MIP singletons"]
+
+
+class Workload:
+    """Request parameters sampled from a data directory.
+
+    Args:
+        data_dir (str): Directory with the files the server reads
+        samples (int): Number of proteins to draw parameters from
+        seed (int): Random seed
+    """
+
+    def __init__(self, data_dir: str, samples: int = 10000, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        # The first row group is enough to draw from and cheap at any scale
+        data = pq.ParquetFile(os.path.join(data_dir, "data.parquet"))
+        frame = data.read_row_group(0, columns=["x", "y", "pdb_loc"], use_pandas_metadata=True).to_pandas()
+        frame = frame.sample(min(samples, len(frame)), random_state=seed)
+        points = frame.dropna(subset=["x", "y"])
+        self.points = points[["x", "y"]].to_numpy()
+        self.names = [name.replace("AF-", "").replace("-model_v4", "").replace("-F1", "") for name in frame.index]
+        self.pdb_locs = sorted(set(frame["pdb_loc"]))
+
+        predictions_loc = os.path.join(data_dir, "deepfri_predictions_protein_HQ")
+        self.goterm_proteins = []
+        if os.path.isdir(predictions_loc):
+            with os.scandir(predictions_loc) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".csv"):
+                        self.goterm_proteins.append(entry.name[:-len(".csv")])
+                        if len(self.goterm_proteins) == samples:
+                            break
+        gonames = pd.read_csv(os.path.join(data_dir, "gonames.csv"), index_col=0)
+        self.goterm_words = sorted({word for name in gonames["GOname"].dropna() for word in str(name).lower().split() if len(word) > 1})
+
+    def pick(self, values):
+        return values[int(self.rng.integers(len(values)))]
+
+    def viewport(self) -> dict:
+        """A viewport around a real point, from a close zoom to an overview"""
+        x, y = self.points[int(self.rng.integers(len(self.points)))]
+        width = float(np.exp(self.rng.uniform(np.log(0.2), np.log(40))))
+        height = width * float(self.rng.uniform(0.5, 1.5))
+        params = {"x0": x - width / 2, "x1": x + width / 2, "y0": y - height / 2, "y1": y + height / 2}
+        if self.rng.random() < 1 / 3:
+            params["types"] = ",".join(self.rng.choice(FILTER_TYPES, int(self.rng.integers(1, 4)), replace=False))
+            params["lengthRange"] = f"{int(self.rng.integers(0, 300))},{int(self.rng.integers(300, 3000))}"
+        return params
+
+    def ws_viewport(self) -> dict:
+        """A viewport query as WebSocket clients send it, with lists for the
+        filters the HTTP API takes comma separated"""
+        params = self.viewport()
+        if "types" in params:
+            params["types"] = params["types"].split(",")
+            params["lengthRange"] = [int(value) for value in params["lengthRange"].split(",")]
+        return params
+
+    def name_prefix(self) -> str:
+        name = self.pick(self.names)
+        return name[:int(self.rng.integers(3, 9))]
+
+    def goterm_prefix(self) -> str:
+        word = self.pick(self.goterm_words)
+        return word[:int(self.rng.integers(2, 7))]
+
+
+async def http_request(client: httpx.AsyncClient, workload: Workload, scenario: str) -> int:
+    """Send one request of a scenario; returns the response size"""
+    if scenario == "points":
+        response = await client.get("/api/points", params=workload.viewport())
+    elif scenario == "name_search":
+        response = await client.get("/api/name_search", params={"name": workload.name_prefix(), "mode": workload.pick(["prefix", "substring"])})
+    elif scenario == "goterm":
+        response = await client.get(f"/api/goterm/{workload.pick(workload.goterm_proteins)}")
+    elif scenario == "autocomplete":
+        response = await client.get("/api/goterm_autocomplete", params={"goterm": workload.goterm_prefix()})
+    elif scenario == "pdb":
+        response = await client.get(f"/api/pdb/{workload.pick(workload.pdb_locs)}")
+    else:
+        raise ValueError(f"Unknown scenario {scenario}")
+    response.raise_for_status()
+    return len(response.content)
+
+
+async def ws_client(url: str, workload: Workload, deadline: float, latencies: list, errors: list, sizes: list):
+    """Viewport queries over one WebSocket, each awaited until its last message"""
+    async with websockets.connect(url, max_size=None) as socket:
+        query_id = 0
+        while time.perf_counter() < deadline:
+            query_id += 1
+            start = time.perf_counter()
+            try:
+                await socket.send(json.dumps({**workload.ws_viewport(), "id": query_id}))
+                size = 0
+                while True:
+                    message = await socket.recv()
+                    size += len(message)
+                    if isinstance(message, bytes):
+                        # Arrow responses carry their envelope in the schema
+                        # metadata; this client asks for JSON
+                        continue
+                    reply = json.loads(message)
+                    if reply.get("type") == "error":
+                        raise RuntimeError(reply.get("message"))
+                    if reply.get("id") == query_id and reply.get("is_last"):
+                        break
+            except Exception as e:
+                errors.append(repr(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+            sizes.append(size)
+
+
+async def http_client(client: httpx.AsyncClient, workload: Workload, scenario: str, deadline: float, latencies: list, errors: list, sizes: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            size = await http_request(client, workload, scenario)
+        except Exception as e:
+            errors.append(repr(e))
+            continue
+        latencies.append(time.perf_counter() - start)
+        sizes.append(size)
+
+
+async def run_scenario(url: str, workload: Workload, scenario: str, duration: float, concurrency: int) -> dict:
+    """Run one scenario with ``concurrency`` clients for ``duration`` seconds"""
+    latencies, errors, sizes = [], [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    if scenario == "ws_points":
+        ws_url = url.replace("http", "ws", 1) + "/api/ws/points"
+        await asyncio.gather(*(ws_client(ws_url, workload, deadline, latencies, errors, sizes) for _ in range(concurrency)))
+    else:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            await asyncio.gather(*(http_client(client, workload, scenario, deadline, latencies, errors, sizes) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    result = {
+        "scenario": scenario,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies) / elapsed,
+        "mb_per_s": sum(sizes) / elapsed / 1024**2,
+    }
+    for q in (50, 95, 99):
+        result[f"p{q}_ms"] = float(np.percentile(latencies, q)) if len(latencies) else float("nan")
+    if errors:
+        logger.warning(f"{scenario}: {len(errors)} errors, first: {errors[0]}")
+    return result
+
+
+def start_server(data_dir: str, port: int, log_file: str = None, timeout: float = 3600):
+    """Start uvicorn on ``data_dir`` and wait until it answers.
+
+    Returns:
+        tuple: The server process and its startup time in seconds
+    """
+    env = {**os.environ, "DATA_DIR": data_dir}
+    output = open(log_file, "w") if log_file else subprocess.DEVNULL
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=output,
+        stderr=subprocess.STDOUT,
+    )
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/executors", timeout=1).status_code == 200:
+                return process, time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise TimeoutError(f"Server did not start within {timeout}s")
+
+
+def report(results: list, startup: float = None) -> str:
+    lines = []
+    if startup is not None:
+        lines.append(f"Startup: {startup:.2f}s")
+    lines.append(f"{'scenario':<14}{'requests':>10}{'errors':>8}{'req/s':>10}{'MB/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        lines.append(
+            f"{r['scenario']:<14}{r['requests']:>10}{r['errors']:>8}{r['throughput']:>10.1f}{r['mb_per_s']:>9.2f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(args):
+    workload = Workload(args.data, seed=args.seed)
+    scenarios = args.scenarios.split(",")
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {scenario}, expected one of {', '.join(SCENARIOS)}")
+    if "goterm" in scenarios and not workload.goterm_proteins:
+        logger.warning("No per-protein GO term predictions, skipping the goterm scenario")
+        scenarios.remove("goterm")
+
+    process, startup, url = None, None, args.url
+    if url is None:
+        process, startup = start_server(args.data, args.port, args.server_log)
+        url = f"http://127.0.0.1:{args.port}"
+        logger.info(f"Server answered after {startup:.2f}s")
+    try:
+        results = []
+        for scenario in scenarios:
+            logger.info(f"Running {scenario} for {args.duration}s with {args.concurrency} clients")
+            results.append(asyncio.run(run_scenario(url, workload, scenario, args.duration, args.concurrency)))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(report(results, startup))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"startup_s": startup, "concurrency": args.concurrency, "duration_s": args.duration, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the API against a local data directory")
+    parser.add_argument("--data", required=True, help="Data directory the server reads (e.g. from synthetic_data.py)")
+    parser.add_argument("--url", default=None, help="Benchmark a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the started server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated scenarios to run")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per scenario")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for request parameters")
+    parser.add_argument("--server-log", default=None, help="File for the started server's output")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    main(parser.parse_args())
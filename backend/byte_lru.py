@@ -0,0 +1,69 @@
+"""
+Least recently used cache bounded by the size of its values.
+
+The response cache (encoded response bodies) and the point store (decoded row
+groups) both keep recently used values up to a byte budget; ``ByteLRU`` holds
+the bookkeeping they share and takes the size of a value as a function.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ByteLRU:
+    """Thread-safe LRU bounded by the combined size of its values.
+
+    Args:
+        max_bytes (int): Combined size of the values to keep
+        sizeof (callable): Size in bytes of a value
+    """
+
+    def __init__(self, max_bytes: int, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The value of a key (now the most recently used), None if not cached"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache a value, evicting the least recently used ones over the
+        budget; a value larger than the whole budget is not cached. Returns
+        the value."""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= self.sizeof(previous)
+            self._entries[key] = value
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
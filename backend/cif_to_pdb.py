@@ -12,8 +12,11 @@ Requires python BioPython (`pip install biopython`). It should work with recent
 """
 
 import sys
+import re
 import argparse
 import logging
+import numpy as np
+from Bio.Data.IUPACData import atom_weights
 from Bio.PDB.MMCIFParser import MMCIFParser
 from Bio.PDB.PDBParser import PDBParser
 from Bio.PDB import PDBIO
@@ -48,24 +51,23 @@ def int_to_chain(i,base=62):
         return int_to_chain(quot-1,base) + letter
 
 class OutOfChainsError(Exception): pass
-def rename_chains(structure):
-    """Renames chains to be one-letter chains
-    
-    Existing one-letter chains will be kept. Multi-letter chains will be truncated
-    or renamed to the next available letter of the alphabet.
-    
-    If more than 62 chains are present in the structure, raises an OutOfChainsError
-    
-    Returns a map between new and old chain IDs, as well as modifying the input structure
+def rename_chain_ids(chain_ids):
+    """Computes one-letter chain IDs for a list of chain IDs
+
+    Same rules as rename_chains, for callers without a Biopython structure.
+
+    Returns the list of new chain IDs (in input order) and a map between new
+    and old chain IDs
     """
     next_chain = 0 #
     # single-letters stay the same
-    chainmap = {c.id:c.id for c in structure.get_chains() if len(c.id) == 1}
-    for o in structure.get_chains():
-        if len(o.id) != 1:
-            if o.id[0] not in chainmap:
-                chainmap[o.id[0]] = o.id
-                o.id = o.id[0]
+    chainmap = {c:c for c in chain_ids if len(c) == 1}
+    new_ids = []
+    for o in chain_ids:
+        if len(o) != 1:
+            if o[0] not in chainmap:
+                chainmap[o[0]] = o
+                o = o[0]
             else:
                 c = int_to_chain(next_chain)
                 while c in chainmap:
@@ -73,10 +75,173 @@ def rename_chains(structure):
                     c = int_to_chain(next_chain)
                     if next_chain >= 62:
                         raise OutOfChainsError()
-                chainmap[c] = o.id
-                o.id = c
+                chainmap[c] = o
+                o = c
+        new_ids.append(o)
+    return new_ids, chainmap
+
+def rename_chains(structure):
+    """Renames chains to be one-letter chains
+    
+    Existing one-letter chains will be kept. Multi-letter chains will be truncated
+    or renamed to the next available letter of the alphabet.
+    
+    If more than 62 chains are present in the structure, raises an OutOfChainsError
+    
+    Returns a map between new and old chain IDs, as well as modifying the input structure
+    """
+    chains = list(structure.get_chains())
+    new_ids, chainmap = rename_chain_ids([c.id for c in chains])
+    for chain, new_id in zip(chains, new_ids):
+        chain.id = new_id
     return chainmap
 
+class UnsupportedCIFError(Exception): pass
+
+# A CIF value: quoted strings may contain their quote character unless it is
+# followed by whitespace
+CIF_TOKEN = re.compile(r"""'(?:[^']|'(?=\S))*'|"(?:[^"]|"(?=\S))*"|\S+""")
+ATOM_FORMAT = "%s%5i %-4s %3s %c%4i%c   %8.3f%8.3f%8.3f%6.2f%s      %4s%2s  \n"
+TER_FORMAT = "TER   %5i      %3s %c%4i%c                                                      \n"
+ATOM_SITE_FIELDS = ["group_PDB", "type_symbol", "label_atom_id", "label_alt_id", "label_comp_id",
+                    "auth_asym_id", "auth_seq_id", "pdbx_PDB_ins_code", "Cartn_x", "Cartn_y", "Cartn_z",
+                    "occupancy", "B_iso_or_equiv"]
+
+def format_b_factor(value):
+    """Formats a B-factor in at most 6 characters, as PDBIO does"""
+    if value < 1000:
+        return "%6.1f" % value if len("%.2f" % value) > 6 else "%6.2f" % value
+    if value < 10000:
+        return "%6.0f" % value if len("%.1f" % value) > 6 else "%6.1f" % value
+    return "%6d" % min(int(value), 999999)
+
+def read_atom_site(ciffile):
+    """Reads the _atom_site loop of a CIF file without parsing the rest
+
+    Returns the loop's field names and a flat list of its values
+    """
+    fields = []
+    tokens = []
+    with open(ciffile) as f:
+        lines = iter(f)
+        for line in lines:
+            if line.startswith("_atom_site."):
+                fields.append(line.strip()[len("_atom_site."):])
+                break
+        for line in lines:
+            if line.startswith("_atom_site."):
+                fields.append(line.strip()[len("_atom_site."):])
+            else:
+                break
+        else:
+            line = ""
+        while line and not line.startswith(("#", "loop_", "_", "data_")):
+            if line.startswith(";"):
+                raise UnsupportedCIFError("multi-line value in _atom_site")
+            if "'" in line or '"' in line:
+                tokens.extend(t[1:-1] if t[0] in "'\"" and len(t) > 1 else t for t in CIF_TOKEN.findall(line))
+            else:
+                tokens.extend(line.split())
+            line = next(lines, "")
+    if not fields:
+        raise UnsupportedCIFError("no _atom_site loop")
+    if not tokens or len(tokens) % len(fields):
+        raise UnsupportedCIFError("empty or ragged _atom_site loop")
+    return fields, tokens
+
+def stream_cif_to_pdb(ciffile, verbose=False):
+    """Converts the _atom_site loop of a mmCIF file straight to PDB records
+
+    Produces the same output as reading the file with MMCIFParser, renaming
+    chains and writing with PDBIO, without building a Structure. Files this
+    cannot reproduce exactly (several models, alternate locations, discontinuous
+    chains or residues, values that do not fit the PDB format, ...) raise
+    UnsupportedCIFError.
+
+    Returns the PDB file contents
+    """
+    fields, tokens = read_atom_site(ciffile)
+    width = len(fields)
+    try:
+        cols = {name: tokens[fields.index(name)::width] for name in ATOM_SITE_FIELDS}
+    except ValueError as e:
+        raise UnsupportedCIFError(str(e))
+    if "pdbx_PDB_model_num" in fields and len(set(tokens[fields.index("pdbx_PDB_model_num")::width])) > 1:
+        raise UnsupportedCIFError("several models")
+    if set(cols["label_alt_id"]) - {".", "?"}:
+        raise UnsupportedCIFError("alternate locations")
+    if len(cols["group_PDB"]) > 99999:
+        raise UnsupportedCIFError("too many atoms")
+
+    try:
+        # MMCIFParser stores coordinates in single precision
+        coords = np.array([cols["Cartn_x"], cols["Cartn_y"], cols["Cartn_z"]], dtype=float).astype("f").T.tolist()
+        occupancies = [float(v) for v in cols["occupancy"]]
+        bfactors = [format_b_factor(float(v)) for v in cols["B_iso_or_equiv"]]
+        resseqs = [int(v) for v in cols["auth_seq_id"]]
+    except ValueError as e:
+        raise UnsupportedCIFError(str(e))
+
+    # Group atoms into chains and residues the way StructureBuilder does
+    chains = {}
+    current_chain = current_residue = None
+    for i, chain_id in enumerate(cols["auth_asym_id"]):
+        if chain_id != current_chain:
+            if chain_id in chains:
+                raise UnsupportedCIFError("discontinuous chain %s" % chain_id)
+            residues = chains[chain_id] = []
+            seen = set()
+            current_chain = chain_id
+            current_residue = None
+        resname = cols["label_comp_id"][i]
+        if cols["group_PDB"][i] == "HETATM":
+            hetfield = "W" if resname in ("HOH", "WAT") else "H"
+        else:
+            hetfield = " "
+        icode = cols["pdbx_PDB_ins_code"][i]
+        if icode in (".", "?"):
+            icode = " "
+        residue = (hetfield, resseqs[i], icode)
+        if residue != current_residue or resname != residues[-1][1]:
+            if residue in seen or resseqs[i] > 9999:
+                raise UnsupportedCIFError("duplicate or out of range residue %s" % (residue,))
+            seen.add(residue)
+            residues.append((residue, resname, [], set()))
+            current_residue = residue
+        name = cols["label_atom_id"][i]
+        if name in residues[-1][3]:
+            raise UnsupportedCIFError("duplicate atom %s" % name)
+        residues[-1][3].add(name)
+        residues[-1][2].append(i)
+
+    new_ids, chainmap = rename_chain_ids(list(chains))
+    if verbose:
+        for new,old in chainmap.items():
+            if new != old:
+                logging.info("Renaming chain {0} to {1}".format(old,new))
+
+    lines = []
+    serial = 1
+    for chain_id, residues in zip(new_ids, chains.values()):
+        if len(chain_id) != 1:
+            raise UnsupportedCIFError("chain id %s" % chain_id)
+        for (hetfield, resseq, icode), resname, atoms, _ in residues:
+            record = "ATOM  " if hetfield == " " else "HETATM"
+            for i in atoms:
+                element = cols["type_symbol"][i].upper()
+                if element.capitalize() not in atom_weights:
+                    raise UnsupportedCIFError("element %s" % element)
+                name = cols["label_atom_id"][i]
+                if len(name) < 4 and name[:1].isalpha() and len(element) < 2:
+                    name = " " + name
+                x, y, z = coords[i]
+                lines.append(ATOM_FORMAT % (record, serial, name, resname, chain_id, resseq, icode,
+                                            x, y, z, occupancies[i], bfactors[i], " ", element))
+                serial += 1
+        lines.append(TER_FORMAT % (serial, resname, chain_id, resseq, icode))
+    lines.append("END   \n")
+    return "".join(lines)
+
 def cif_to_pdb(ciffile: str, pdbfile: str, verbose: bool = False) -> None:
     """Convert mmCIF file to PDB format
     
@@ -85,6 +250,19 @@ def cif_to_pdb(ciffile: str, pdbfile: str, verbose: bool = False) -> None:
         pdbfile (str): Path to output PDB file
         verbose (bool): If True, print detailed information
     """
+    # Plain single-model files are converted without Biopython
+    try:
+        pdb = stream_cif_to_pdb(ciffile, verbose)
+    except UnsupportedCIFError as e:
+        logging.info("Falling back to Biopython conversion ({0})".format(e))
+    except OutOfChainsError:
+        logging.error("Too many chains to represent in PDB format")
+        sys.exit(1)
+    else:
+        with open(pdbfile, "w") as f:
+            f.write(pdb)
+        return
+
     #Not sure why biopython needs this to read a cif file
     strucid = ciffile[:4] if len(ciffile)>4 else "1xxx"
 
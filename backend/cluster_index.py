@@ -0,0 +1,84 @@
+"""
+Cluster membership in compressed sparse row form.
+
+The members of all clusters are one array grouped by cluster, so cluster ``c``
+owns the contiguous member ids ``offsets[c]:offsets[c + 1]``. Alongside it the
+index keeps the cluster of every member and the row of every member's protein
+in the row table, and finds clusters by name with a binary search, so a page of
+members, the cluster of a search hit and the row of a member all cost the same
+whatever the size of the cluster or of the table.
+"""
+
+import numpy as np
+
+from row_lookup import RowLookup
+
+
+class ClusterIndex:
+    """Member ranges of clusters, with the cluster and row of every member.
+
+    Member ids are positions into ``members`` (as returned by the name index
+    built over them); rows are positions into the row table the index was
+    built against.
+
+    Args:
+        names (np.ndarray): Cluster names (the representatives)
+        offsets (np.ndarray): ``len(names) + 1`` offsets into ``members``
+        members (np.ndarray): Member protein names, grouped by cluster
+        member_rows (np.ndarray): Row of every member, -1 for members the
+            row table does not have
+    """
+
+    def __init__(self, names: np.ndarray, offsets: np.ndarray, members: np.ndarray, member_rows: np.ndarray):
+        self.names = names
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.members = members
+        self.member_rows = np.asarray(member_rows, dtype=np.int64)
+        dtype = np.int32 if len(names) < 2**31 else np.int64
+        self.member_clusters = np.repeat(np.arange(len(names), dtype=dtype), np.diff(self.offsets))
+        self.lookup = RowLookup.build(names, np.arange(len(names)))
+
+    def arrays(self) -> dict:
+        """State needed to restore the index with ``from_arrays`` (names excluded)"""
+        return {
+            "offsets": self.offsets,
+            "member_clusters": self.member_clusters,
+            "member_rows": self.member_rows,
+            "keys": self.lookup.keys,
+            "positions": self.lookup.positions,
+        }
+
+    @classmethod
+    def from_arrays(cls, names: np.ndarray, members: np.ndarray, arrays: dict) -> "ClusterIndex":
+        """Rebuild an index from ``arrays()`` output without sorting the names again"""
+        index = cls.__new__(cls)
+        index.names = names
+        index.members = members
+        index.offsets = arrays["offsets"]
+        index.member_clusters = arrays["member_clusters"]
+        index.member_rows = arrays["member_rows"]
+        index.lookup = RowLookup(arrays["keys"], arrays["positions"])
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def cluster_id(self, name: str):
+        """Id of a cluster by name, None if there is no such cluster"""
+        return self.lookup.get(name)
+
+    def size(self, cluster: int) -> int:
+        return int(self.offsets[cluster + 1] - self.offsets[cluster])
+
+    def member_ids(self, cluster: int, offset: int = 0, limit: int = None) -> range:
+        """Ids of a page of the members of a cluster"""
+        start = int(self.offsets[cluster])
+        stop = int(self.offsets[cluster + 1])
+        start = min(start + offset, stop)
+        if limit is not None:
+            stop = min(start + limit, stop)
+        return range(start, stop)
+
+    def cluster_of(self, member_ids) -> np.ndarray:
+        """Cluster ids of members"""
+        return self.member_clusters[np.asarray(member_ids, dtype=np.int64)]
@@ -0,0 +1,165 @@
+"""
+Binned point counts over the 2D embedding.
+
+A fine grid of counts is kept for every combination of a few categorical
+columns (origin and taxonomy) as a summed-area table, so the number of points
+in any grid-aligned rectangle of any category costs four lookups. A heatmap of
+a viewport interpolates the tables at its bin edges, whatever the number of
+points underneath. Viewports too small for the fine grid, or filters the
+tables cannot express, are counted exactly from the rows instead.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class DensityGrid:
+    """Per-category summed-area tables over x/y.
+
+    Args:
+        x (np.ndarray): X coordinates, one per row (no NaNs)
+        y (np.ndarray): Y coordinates, one per row (no NaNs)
+        frame (pd.DataFrame): Table holding the category columns, row-aligned
+            with x and y
+        columns (list): Categorical columns counts can be split or filtered by
+        resolution (int): Cells of the fine grid along each axis
+    """
+
+    def __init__(self, x, y, frame: pd.DataFrame, columns=("origin", "taxonomy"), resolution: int = 512):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.columns = list(columns)
+        self.resolution = resolution
+        n = len(self.x)
+
+        # One code per distinct combination of the category columns
+        combos = pd.MultiIndex.from_frame(frame[self.columns].astype(object).where(frame[self.columns].notna(), None))
+        codes, uniques = combos.factorize()
+        self.codes = codes.astype(np.int16)
+        self.labels = [list(values) for values in uniques]
+
+        if n:
+            self.xmin, self.xmax = float(self.x.min()), float(self.x.max())
+            self.ymin, self.ymax = float(self.y.min()), float(self.y.max())
+        else:
+            self.xmin = self.xmax = self.ymin = self.ymax = 0.0
+        self.cell_w = max(self.xmax - self.xmin, 1e-12) / resolution
+        self.cell_h = max(self.ymax - self.ymin, 1e-12) / resolution
+
+        cx = np.clip(((self.x - self.xmin) / self.cell_w).astype(np.int64), 0, resolution - 1)
+        cy = np.clip(((self.y - self.ymin) / self.cell_h).astype(np.int64), 0, resolution - 1)
+        counts = np.bincount(
+            (self.codes.astype(np.int64) * resolution + cy) * resolution + cx,
+            minlength=len(self.labels) * resolution * resolution,
+        ).reshape(len(self.labels), resolution, resolution)
+        # Leading zero row and column, so table[k, j, i] counts cells [0, j) x [0, i)
+        self.tables = np.zeros((len(self.labels), resolution + 1, resolution + 1), dtype=np.int32 if n < 2**31 else np.int64)
+        np.cumsum(np.cumsum(counts, axis=1), axis=2, out=self.tables[:, 1:, 1:])
+
+    def arrays(self) -> dict:
+        """State needed to restore the grid with ``from_arrays`` (coordinates excluded)"""
+        return {
+            "codes": self.codes,
+            "tables": self.tables,
+            "columns": self.columns,
+            "labels": self.labels,
+            "bounds": [self.xmin, self.xmax, self.ymin, self.ymax, self.cell_w, self.cell_h],
+        }
+
+    @classmethod
+    def from_arrays(cls, x, y, arrays: dict) -> "DensityGrid":
+        """Rebuild a grid from ``arrays()`` output without recounting the rows"""
+        grid = cls.__new__(cls)
+        grid.x = np.asarray(x)
+        grid.y = np.asarray(y)
+        grid.codes = arrays["codes"]
+        grid.tables = arrays["tables"]
+        grid.columns = arrays["columns"]
+        grid.labels = arrays["labels"]
+        grid.resolution = grid.tables.shape[1] - 1
+        grid.xmin, grid.xmax, grid.ymin, grid.ymax, grid.cell_w, grid.cell_h = arrays["bounds"]
+        return grid
+
+    def categories(self, **filters) -> np.ndarray:
+        """Category codes whose values pass the filters (column name to a list
+        of accepted values; empty or None entries are ignored)"""
+        keep = np.ones(len(self.labels), dtype=bool)
+        for column, accepted in filters.items():
+            if accepted is None or len(accepted) == 0:
+                continue
+            j = self.columns.index(column)
+            accepted = set(accepted)
+            keep &= np.array([label[j] in accepted for label in self.labels], dtype=bool)
+        return np.flatnonzero(keep)
+
+    def _edges(self, lo: float, hi: float, bins: int, origin: float, cell: float):
+        """Bin edges in fine-grid units: the grid line left of each edge and
+        the fraction of the next cell the edge lies at"""
+        position = np.clip((np.linspace(lo, hi, bins + 1) - origin) / cell, 0, self.resolution)
+        left = np.minimum(np.floor(position).astype(np.int64), self.resolution - 1)
+        return left, position - left
+
+    def cells_per_bin(self, x0: float, x1: float, y0: float, y1: float, bins_x: int, bins_y: int) -> float:
+        """How many fine cells the narrower side of a bin spans"""
+        return min((x1 - x0) / bins_x / self.cell_w, (y1 - y0) / bins_y / self.cell_h)
+
+    def table_counts(self, x0: float, x1: float, y0: float, y1: float, bins_x: int, bins_y: int, categories=None) -> np.ndarray:
+        """Counts per category and bin from the summed-area tables.
+
+        Bin edges falling inside a fine cell take the matching fraction of its
+        points (bilinear interpolation of the tables), i.e. points are assumed
+        spread evenly within a cell, so counts are estimates.
+
+        Returns:
+            np.ndarray: ``(len(categories), bins_y, bins_x)`` counts
+        """
+        if categories is None:
+            categories = np.arange(len(self.labels))
+        ix, fx = self._edges(x0, x1, bins_x, self.xmin, self.cell_w)
+        iy, fy = self._edges(y0, y1, bins_y, self.ymin, self.cell_h)
+        side = self.resolution + 1
+        flat = self.tables.reshape(len(self.tables), side * side)
+        fx = fx[None, :]
+        fy = fy[:, None]
+        # Interpolation weights of the four table entries around every edge crossing
+        corners = [
+            ((iy[:, None] + dy) * side + ix[None, :] + dx, (fy if dy else 1 - fy) * (fx if dx else 1 - fx))
+            for dy in (0, 1) for dx in (0, 1)
+        ]
+        corners = np.stack([
+            sum(np.take(flat[category], index) * weight for index, weight in corners)
+            for category in np.asarray(categories).tolist()
+        ]) if len(categories) else np.zeros((0, len(iy), len(ix)))
+        counts = corners[:, 1:, 1:] - corners[:, :-1, 1:] - corners[:, 1:, :-1] + corners[:, :-1, :-1]
+        return np.rint(np.maximum(counts, 0)).astype(np.int64)
+
+    def row_counts(self, rows: np.ndarray, x0: float, x1: float, y0: float, y1: float, bins_x: int, bins_y: int, categories=None) -> np.ndarray:
+        """Exact counts per category and bin of the given rows (positions into
+        x and y); same layout as ``table_counts``"""
+        if categories is None:
+            categories = np.arange(len(self.labels))
+        categories = np.asarray(categories)
+        slot = np.full(len(self.labels), -1, dtype=np.int64)
+        slot[categories] = np.arange(len(categories))
+
+        rows = rows[slot[self.codes[rows]] >= 0]
+        x = self.x[rows]
+        y = self.y[rows]
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        rows, x, y = rows[inside], x[inside], y[inside]
+        bx = np.minimum(((x - x0) / max(x1 - x0, 1e-12) * bins_x).astype(np.int64), bins_x - 1)
+        by = np.minimum(((y - y0) / max(y1 - y0, 1e-12) * bins_y).astype(np.int64), bins_y - 1)
+        flat = (slot[self.codes[rows]] * bins_y + by) * bins_x + bx
+        return np.bincount(flat, minlength=len(categories) * bins_y * bins_x).reshape(len(categories), bins_y, bins_x)
+
+    def split(self, counts: np.ndarray, categories, column: str = None) -> dict:
+        """Sum per-category counts into one grid per value of ``column`` (or a
+        single ``"all"`` grid)"""
+        if column is None:
+            return {"all": counts.sum(axis=0)}
+        j = self.columns.index(column)
+        grids = {}
+        for category, grid in zip(np.asarray(categories).tolist(), counts):
+            label = self.labels[category][j]
+            grids[label] = grids[label] + grid if label in grids else grid
+        return grids
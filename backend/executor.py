@@ -0,0 +1,107 @@
+"""
+Bounded execution of blocking work outside the event loop.
+
+Endpoints are ``async`` but their work (pandas queries, structure conversion) is
+synchronous; running it inline blocks every other request and WebSocket on the
+same worker. ``BoundedExecutor`` hands such calls to a thread or process pool,
+caps how many run at once, rejects new calls once too many are waiting and
+stops waiting for a call after a timeout.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+
+
+class ExecutorBusy(Exception):
+    """Raised when the executor's wait queue is full"""
+
+
+class BoundedExecutor:
+    """Pool with a concurrency limit, a bounded wait queue and a timeout.
+
+    Args:
+        name (str): Used in error messages and stats
+        workers (int): Calls allowed to run at the same time
+        max_queue (int): Calls allowed to wait for a free worker
+        timeout (float): Seconds to wait for a result before giving up
+        processes (bool): Use a process pool instead of threads (the function
+            and its arguments must then be picklable)
+    """
+
+    def __init__(self, name: str, workers: int = 4, max_queue: int = 64, timeout: float = 30.0, processes: bool = False):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        pool_class = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+        self.pool = pool_class(max_workers=workers)
+        # Created in the event loop that uses it (see _semaphore)
+        self._slots = None
+        self._loop = None
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """The semaphore of the running event loop. Executors are created at
+        import time, and before Python 3.10 a semaphore binds to the loop
+        current when it is created, not the one the server runs."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._loop = loop
+        return self._slots
+
+    def _release(self, slots, future):
+        if not future.cancelled():
+            # Mark the outcome as seen even if the caller timed out
+            future.exception()
+        self.running -= 1
+        self.completed += 1
+        slots.release()
+
+    async def run(self, fn, *args, timeout: float = None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` in the pool and return its result.
+
+        Raises:
+            ExecutorBusy: If ``max_queue`` calls are already waiting
+            asyncio.TimeoutError: If the call does not finish in time. The call
+                keeps its worker until it actually returns, so a stuck call
+                cannot push the pool over its limit.
+        """
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name} executor is busy ({self.queued} requests waiting)")
+
+        slots = self._semaphore()
+        self.queued += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        future = asyncio.get_running_loop().run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+        future.add_done_callback(functools.partial(self._release, slots))
+        try:
+            # shield: a timeout or a disconnected client must not cancel the
+            # future, its callback is what frees the slot
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
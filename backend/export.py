@@ -0,0 +1,95 @@
+"""
+Streaming encodings for bulk exports of point tables.
+
+An export is produced as a sequence of row chunks and encoded chunk by chunk,
+so a response of any size holds one chunk in memory at a time: CSV with a
+single header line, newline-delimited JSON (one record per line, missing
+values as null) or a Parquet file with one row group per chunk, whose footer
+follows the last chunk.
+"""
+
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that hands out what has been written since the last
+    ``take``; the position keeps counting, as the Parquet writer expects"""
+
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_table(chunk: pd.DataFrame, schema: pa.Schema = None) -> pa.Table:
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    if schema is None:
+        # Columns that are all missing in the first chunk are text in the rest
+        schema = pa.schema([
+            field.with_type(pa.large_string()) if pa.types.is_null(field.type) else field
+            for field in table.schema
+        ])
+    return table.cast(schema)
+
+
+def encode_export(chunks, format: str):
+    """Encode row chunks as one streamed file.
+
+    Args:
+        chunks: Iterable of frames with the same columns (the index is
+            dropped); there must be at least one, possibly empty, so that
+            the header or schema is known
+        format (str): One of ``EXPORT_MEDIA_TYPES``
+
+    Yields:
+        bytes: Consecutive parts of the file
+    """
+    if format == "csv":
+        for i, chunk in enumerate(chunks):
+            yield chunk.to_csv(index=False, header=i == 0).encode("utf-8")
+    elif format == "ndjson":
+        for chunk in chunks:
+            if len(chunk):
+                lines = chunk.to_json(orient="records", lines=True, double_precision=15)
+                yield (lines if lines.endswith("\n") else lines + "\n").encode("utf-8")
+    elif format == "parquet":
+        sink = _ChunkSink()
+        writer = None
+        for chunk in chunks:
+            table = _arrow_table(chunk, writer.schema if writer is not None else None)
+            if writer is None:
+                # No pandas metadata: the file is for any Parquet reader
+                writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), table.schema.remove_metadata())
+            if len(table):
+                writer.write_table(table.replace_schema_metadata())
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+    else:
+        raise ValueError(f"Unknown export format {format}")
@@ -0,0 +1,156 @@
+"""
+Bitmap indexes for the categorical and range filters of the point table.
+
+Every value of a categorical column gets a packed bitset over the rows, and
+every range column is kept as a sorted permutation so a range turns into one
+contiguous slice of row ids. A filter combination is answered by OR-ing the
+bitsets of the selected values, AND-ing the columns together and testing the
+candidate rows against the result. Combined masks are cached, so panning with
+the same filters only pays for the bit tests.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+def _pack(bools: np.ndarray) -> np.ndarray:
+    return np.packbits(bools, bitorder="little")
+
+
+class FilterIndex:
+    """Precomputed filter masks over the rows of a frame.
+
+    Args:
+        frame (pd.DataFrame): Table to index; row ids are positions in it
+        categorical (list): Columns filtered by value membership
+        ranges (list): Numeric columns filtered by an inclusive [lo, hi] range
+        always_pass (dict): Per range column, a sentinel value whose rows pass
+            every range on that column (e.g. -1 for a missing pLDDT)
+        cache_size (int): Number of filter combinations to keep masks for
+    """
+
+    def __init__(self, frame: pd.DataFrame, categorical=(), ranges=(), always_pass=None, cache_size: int = 256):
+        self.size = len(frame)
+        self.bitsets = {}
+        for column in categorical:
+            codes, values = pd.factorize(frame[column], use_na_sentinel=True)
+            self.bitsets[column] = {
+                value: _pack(codes == code) for code, value in enumerate(values)
+            }
+
+        self.sorted = {}
+        self.sentinels = {}
+        for column in ranges:
+            values = frame[column].to_numpy(dtype=np.float64)
+            order = np.argsort(values, kind="stable")
+            self.sorted[column] = (values[order], order.astype(np.int32 if self.size < 2**31 else np.int64))
+            if always_pass and column in always_pass:
+                self.sentinels[column] = _pack(values == always_pass[column])
+
+        self._cached_mask = lru_cache(maxsize=cache_size)(self._build_mask)
+
+    def arrays(self) -> dict:
+        """State needed to restore the index with ``from_arrays``"""
+        arrays = {"size": self.size, "categorical": list(self.bitsets), "ranges": list(self.sorted)}
+        for column, bitsets in self.bitsets.items():
+            arrays[f"values_{column}"] = list(bitsets)
+            arrays[f"bitsets_{column}"] = np.stack(list(bitsets.values())) if bitsets else np.zeros((0, len(self._empty())), dtype=np.uint8)
+        for column, (values, order) in self.sorted.items():
+            arrays[f"sorted_{column}"] = values
+            arrays[f"order_{column}"] = order
+        for column, bits in self.sentinels.items():
+            arrays[f"sentinel_{column}"] = bits
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, cache_size: int = 256) -> "FilterIndex":
+        """Rebuild an index from ``arrays()`` output without rescanning the table"""
+        index = cls.__new__(cls)
+        index.size = int(arrays["size"])
+        index.bitsets = {
+            column: dict(zip(arrays[f"values_{column}"], arrays[f"bitsets_{column}"]))
+            for column in arrays["categorical"]
+        }
+        index.sorted = {
+            column: (arrays[f"sorted_{column}"], arrays[f"order_{column}"])
+            for column in arrays["ranges"]
+        }
+        index.sentinels = {
+            column: arrays[f"sentinel_{column}"]
+            for column in arrays["ranges"] if f"sentinel_{column}" in arrays
+        }
+        index._cached_mask = lru_cache(maxsize=cache_size)(index._build_mask)
+        return index
+
+    def _empty(self) -> np.ndarray:
+        return np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def rows_mask(self, rows: np.ndarray) -> np.ndarray:
+        """Mask with exactly the given rows set"""
+        hits = np.zeros(self.size, dtype=bool)
+        hits[rows] = True
+        return _pack(hits)
+
+    def categorical_mask(self, column: str, values) -> np.ndarray:
+        """Rows whose value in a categorical column is one of the given values"""
+        mask = self._empty()
+        for value in values:
+            bits = self.bitsets[column].get(value)
+            if bits is not None:
+                mask |= bits
+        return mask
+
+    def range_mask(self, column: str, lo: float, hi: float) -> np.ndarray:
+        """Rows with lo <= value <= hi, plus the column's sentinel rows"""
+        values, order = self.sorted[column]
+        start = np.searchsorted(values, lo, side="left")
+        end = np.searchsorted(values, hi, side="right")
+        mask = self.rows_mask(order[start:end])
+        if column in self.sentinels:
+            mask |= self.sentinels[column]
+        return mask
+
+    def _build_mask(self, key) -> np.ndarray:
+        mask = None
+        for column, spec in key:
+            if column in self.sorted:
+                bits = self.range_mask(column, *spec)
+            else:
+                bits = self.categorical_mask(column, spec)
+            mask = bits if mask is None else mask & bits
+        return mask
+
+    def mask(self, **filters):
+        """Combined mask for a set of filters.
+
+        Args:
+            **filters: Column name to a list of accepted values (categorical
+                columns) or a (lo, hi) pair (range columns). Empty or None
+                entries are ignored.
+
+        Returns:
+            np.ndarray | None: Packed bitset of passing rows, or None if no
+            filter applies
+        """
+        key = []
+        for column, spec in filters.items():
+            if spec is None or len(spec) == 0:
+                continue
+            if column in self.sorted:
+                key.append((column, (float(spec[0]), float(spec[1]))))
+            elif column in self.bitsets:
+                key.append((column, tuple(sorted(set(spec)))))
+            else:
+                raise KeyError(f"Column {column} is not indexed")
+        if not key:
+            return None
+        return self._cached_mask(tuple(sorted(key)))
+
+    @staticmethod
+    def select(rows: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Keep the rows whose bit is set in the mask (all rows if mask is None)"""
+        if mask is None:
+            return rows
+        return rows[((mask[rows >> 3] >> (rows & 7)) & 1).astype(bool)]
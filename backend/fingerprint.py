@@ -0,0 +1,61 @@
+"""
+Fingerprints of the source files compiled artifacts are built from.
+
+Every compiled artifact (snapshot, point store, GO-term index and store)
+records what it was built from and is only used while that still matches.
+``files_fingerprint`` stats every file of a tree and so catches any change, but
+on trees of millions of files it takes as long as a build; artifacts record it
+for the offline ``--check`` of their build script and compare the cheap
+``directory_mtimes`` on startup instead.
+"""
+
+import hashlib
+import os
+
+
+def source_fingerprint(data_path: str) -> dict:
+    """Identify a single source file by size and modification time"""
+    stat = os.stat(data_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def files_fingerprint(root: str, suffix: str = ".csv") -> dict:
+    """Identify a tree of input files by the name, size and modification time
+    of every file in it, so that a file rewritten in place is noticed as well
+    as one added or removed (one scandir pass per directory)"""
+    digest = hashlib.sha1()
+    files = size = 0
+    directories = [root]
+    while directories:
+        path = directories.pop()
+        with os.scandir(path) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_dir():
+                directories.append(entry.path)
+            elif entry.name.endswith(suffix):
+                stat = entry.stat()
+                digest.update(f"{os.path.relpath(entry.path, root)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+                files += 1
+                size += stat.st_size
+    return {"files": files, "size": size, "digest": digest.hexdigest()}
+
+
+def directory_mtimes(root: str, depth: int = 0) -> dict:
+    """Modification times of a directory and its subdirectories up to
+    ``depth`` levels down, by relative path.
+
+    A directory's mtime changes when a file in it is added, removed or
+    replaced by a rename (as most writers do), so this notices those changes
+    with a handful of stats; only listing the directories above ``depth``
+    touches their entries. Files rewritten in place go unnoticed.
+    """
+    mtimes = {}
+    directories = [(root, 0)]
+    while directories:
+        path, level = directories.pop()
+        mtimes[os.path.relpath(path, root)] = os.stat(path).st_mtime_ns
+        if level < depth:
+            with os.scandir(path) as entries:
+                directories.extend((entry.path, level + 1) for entry in entries if entry.is_dir())
+    return mtimes
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Compiled GO-term membership index.
+
+Packs every DeepFRI prediction file ``<goterms>/<ontology>/<GO term>.csv`` into
+one directory holding a single array of row positions (into data.parquet, in
+file order) plus a JSON table of contents mapping ontology and GO term to a
+slice of that array. The array is memory-mapped, so looking up a term costs a
+dictionary access and a slice instead of a CSV parse. The index records
+fingerprints of data.parquet and of the GO-term directories and is only used
+while both match; ``--check`` compares the fingerprint of every CSV file, which
+also notices files rewritten in place.
+
+usage:
+  python goterm_index.py [--goterms DIR] [--data PARQUET] [--out DIR] [--check]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from tqdm import tqdm
+
+from fingerprint import directory_mtimes, files_fingerprint, source_fingerprint
+
+TERMS_FILE = "terms.json"
+POSITIONS_FILE = "positions.npy"
+
+
+class GOTermIndex:
+    """Read side of the compiled index.
+
+    Args:
+        path (str): Directory written by ``build_index``
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, TERMS_FILE)) as f:
+            meta = json.load(f)
+        self.source = meta["source"]
+        self.goterms = meta.get("goterms")
+        self.directories = meta.get("directories")
+        self.terms = meta["terms"]
+        self.positions = np.load(os.path.join(path, POSITIONS_FILE), mmap_mode="r")
+
+    def is_fresh(self, data_path: str, goterm_loc: str) -> bool:
+        """Whether the index was built from this data.parquet and these GO-term
+        directories; a few stats, cheap enough for every server start"""
+        return self.source == source_fingerprint(data_path) and self.directories == directory_mtimes(goterm_loc, depth=1)
+
+    def matches_files(self, goterm_loc: str) -> bool:
+        """Whether every GO-term CSV file is the one the index was built from
+        (stats all of them)"""
+        return self.goterms == files_fingerprint(goterm_loc)
+
+    def lookup(self, ontology: str, goterm: str):
+        """Sorted data.parquet row positions annotated with a GO term, or None if
+        the term has no prediction file"""
+        span = self.terms.get(ontology, {}).get(goterm)
+        if span is None:
+            return None
+        return self.positions[span[0]:span[1]]
+
+
+def build_index(goterm_loc: str, data_path: str, out_path: str) -> None:
+    """Compile all GO-term CSV files into a single index directory.
+
+    Args:
+        goterm_loc (str): Directory with one sub-directory of CSVs per ontology
+        data_path (str): data.parquet whose row order the positions refer to
+        out_path (str): Output directory
+    """
+    start_time = time.time()
+    # Fingerprint before reading so a file replaced mid-build marks the index stale
+    source = source_fingerprint(data_path)
+    goterms = files_fingerprint(goterm_loc)
+    directories = directory_mtimes(goterm_loc, depth=1)
+    proteins = pd.read_parquet(data_path, columns=[]).index
+    logger.info(f"Loaded {len(proteins)} protein ids in {time.time() - start_time:.2f}s")
+
+    terms = {}
+    chunks = []
+    offset = 0
+    for ontology in sorted(os.listdir(goterm_loc)):
+        ontology_dir = os.path.join(goterm_loc, ontology)
+        if not os.path.isdir(ontology_dir):
+            continue
+        terms[ontology] = {}
+        files = sorted(f for f in os.listdir(ontology_dir) if f.endswith(".csv"))
+        for name in tqdm(files, desc=f"Compiling {ontology} GO terms"):
+            members = pd.read_csv(os.path.join(ontology_dir, name), usecols=["Protein"])["Protein"]
+            positions = proteins.get_indexer(members)
+            positions = np.unique(positions[positions >= 0])
+            terms[ontology][name[:-len(".csv")]] = [offset, offset + len(positions)]
+            chunks.append(positions)
+            offset += len(positions)
+
+    dtype = np.int32 if len(proteins) < 2**31 else np.int64
+    positions = np.concatenate(chunks).astype(dtype) if chunks else np.empty(0, dtype=dtype)
+
+    os.makedirs(out_path, exist_ok=True)
+    # Write the table of contents last so a reader never sees it without
+    # its positions
+    np.save(os.path.join(out_path, POSITIONS_FILE), positions)
+    tmp = os.path.join(out_path, TERMS_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"source": source, "goterms": goterms, "directories": directories, "terms": terms}, f)
+    os.replace(tmp, os.path.join(out_path, TERMS_FILE))
+    logger.info(f"Compiled {sum(len(t) for t in terms.values())} GO terms ({len(positions)} entries) in {time.time() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile DeepFRI GO-term files into a single index")
+    parser.add_argument("--goterms", default="/mnt/data/deepfri_predictions_HQ", help="GO-term prediction directory")
+    parser.add_argument("--data", default="/mnt/data/data.parquet", help="Point table the positions refer to")
+    parser.add_argument("--out", default="/mnt/data/goterm_index", help="Output directory")
+    parser.add_argument("--check", action="store_true", help="Only check whether the index is up to date (exit status 1 if not)")
+    args = parser.parse_args()
+
+    if args.check:
+        index = GOTermIndex(args.out) if os.path.exists(os.path.join(args.out, TERMS_FILE)) else None
+        fresh = index is not None and index.is_fresh(args.data, args.goterms) and index.matches_files(args.goterms)
+        logger.info(f"GO term index at {args.out} is {'up to date' if fresh else 'stale, rebuild it'}")
+        sys.exit(0 if fresh else 1)
+    build_index(args.goterms, args.data, args.out)
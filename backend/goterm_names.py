@@ -0,0 +1,132 @@
+"""
+Autocomplete index over GO term names and IDs.
+
+Names are split into lowercase word tokens once at startup; the distinct
+tokens are kept sorted so every query word becomes a binary search for the
+tokens it prefixes. Matches are ranked exact match first, then names (or IDs)
+starting with the query, then names where every query word starts a word, and
+only when those do not fill the result a plain substring match, found through
+the trigram postings of a ``NameIndex`` over the names rather than a scan.
+Results are cached per query, so repeated keystrokes cost a dictionary lookup.
+"""
+
+import bisect
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from name_index import NameIndex
+
+WORD = re.compile(r"[a-z0-9]+")
+
+# Rank tiers, best first
+EXACT, PREFIX, WORD_START, SUBSTRING = range(4)
+# Distinct names containing the query looked at for the substring tier
+SUBSTRING_CANDIDATES = 256
+
+
+class GOTermNames:
+    """Ranked lookup of GO terms by name or ID.
+
+    Args:
+        goterms (pd.DataFrame): ``GOterm`` and ``GOname`` columns
+        ontologies (dict): Ontology (e.g. ``"MF"``) to the collection of GO
+            terms with predictions in it, used to filter results
+        cache_size (int): Number of queries to keep results for
+    """
+
+    def __init__(self, goterms: pd.DataFrame, ontologies: dict = None, cache_size: int = 4096):
+        self.ids = goterms["GOterm"].astype(str).tolist()
+        self.names = goterms["GOname"].fillna("").astype(str).tolist()
+        self.lower = [name.lower() for name in self.names]
+        self.lower_ids = [go_id.lower() for go_id in self.ids]
+        # Shorter names first, then by ID, within a rank tier
+        self.order = np.lexsort((np.arange(len(self.ids)), [len(name) for name in self.names]))
+        self.position = np.empty(len(self.ids), dtype=np.int64)
+        self.position[self.order] = np.arange(len(self.ids))
+
+        postings = {}
+        for i, (name, go_id) in enumerate(zip(self.lower, self.lower_ids)):
+            # "GO:0008150" is also reachable as "0008150"
+            for token in set(WORD.findall(name)) | set(WORD.findall(go_id)):
+                postings.setdefault(token, []).append(i)
+        self.tokens = sorted(postings)
+        self.postings = [np.array(postings[token], dtype=np.int64) for token in self.tokens]
+
+        # Every trigram is indexed (there are few names), so a substring lookup
+        # never falls back to scanning them; terms sharing a name are grouped
+        distinct, inverse = np.unique(np.array(self.lower, dtype=object), return_inverse=True)
+        self.substrings = NameIndex(distinct, max_postings=len(distinct))
+        self.name_terms = np.argsort(inverse, kind="stable")
+        self.name_starts = np.zeros(len(distinct) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(inverse, minlength=len(distinct)), out=self.name_starts[1:])
+
+        self.ontologies = {
+            ontology: np.array([go_id in members for go_id in self.ids])
+            for ontology, members in (ontologies or {}).items()
+        }
+        self._cached_search = lru_cache(maxsize=cache_size)(self._search)
+
+    def _word_starts(self, word: str) -> np.ndarray:
+        """Terms with a token starting with ``word``"""
+        lo = bisect.bisect_left(self.tokens, word)
+        hi = bisect.bisect_left(self.tokens, word + "￿")
+        if lo == hi:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(self.postings[lo:hi]))
+
+    def _search(self, query: str, ontology: str, limit: int) -> tuple:
+        words = WORD.findall(query)
+        if not words:
+            return ()
+
+        # Terms where every query word starts a word of the name or ID
+        candidates = self._word_starts(words[0])
+        for word in words[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, self._word_starts(word), assume_unique=True)
+        if ontology is not None:
+            candidates = candidates[self.ontologies[ontology][candidates]]
+
+        tiers = []
+        for i in candidates.tolist():
+            if query == self.lower[i] or query == self.lower_ids[i]:
+                tiers.append(EXACT)
+            elif self.lower[i].startswith(query) or self.lower_ids[i].startswith(query):
+                tiers.append(PREFIX)
+            else:
+                tiers.append(WORD_START)
+        ranked = candidates[np.lexsort((self.position[candidates], tiers))][:limit].tolist()
+
+        if len(ranked) < limit and len(query) >= 3:
+            # Substring matches only when the better tiers left room; queries
+            # shorter than a trigram are served by the word tiers alone
+            names = self.substrings.search(query, "substring", SUBSTRING_CANDIDATES)
+            terms = np.concatenate(
+                [self.name_terms[self.name_starts[i]:self.name_starts[i + 1]] for i in names.tolist()]
+                or [np.empty(0, dtype=np.int64)]
+            )
+            terms = terms[~np.isin(terms, candidates)]
+            if ontology is not None:
+                terms = terms[self.ontologies[ontology][terms]]
+            ranked += terms[np.argsort(self.position[terms])][:limit - len(ranked)].tolist()
+        return tuple(ranked)
+
+    def search(self, query: str, ontology: str = None, limit: int = 10) -> list:
+        """Best matching GO terms for a (partial) name or ID.
+
+        Args:
+            query (str): Text typed so far
+            ontology (str): Only return terms with predictions in this ontology
+            limit (int): Maximum number of results
+
+        Returns:
+            list: ``{"GOterm", "GOname"}`` records, best match first
+        """
+        if ontology is not None and ontology not in self.ontologies:
+            return []
+        matches = self._cached_search(query.strip().lower(), ontology, limit)
+        return [{"GOterm": self.ids[i], "GOname": self.names[i]} for i in matches]
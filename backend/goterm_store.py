@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Compiled per-protein GO-term prediction store.
+
+Packs every DeepFRI prediction file ``<predictions>/<protein>.csv`` (columns
+``GO-term``, ``Ontology``, ``Score``) into one directory of column arrays: the
+predictions of all proteins back to back, sorted by descending score within a
+protein, with GO terms and ontologies stored as codes into a small vocabulary.
+The sorted protein names and their offsets into the columns turn a lookup into
+a binary search and a slice of memory-mapped arrays instead of opening a file.
+
+The store is used while the mtime of the prediction directory matches the one
+it was built from, a single stat however many files there are; ``--check``
+compares the fingerprint of every file, which also notices files rewritten in
+place.
+
+usage:
+  python goterm_store.py [--predictions DIR] [--out DIR] [--check]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+
+from fingerprint import directory_mtimes, files_fingerprint
+
+VOCABULARY_FILE = "vocabulary.json"
+COLUMNS = ["proteins", "offsets", "goterms", "ontologies", "scores"]
+
+
+class GOPredictionStore:
+    """Read side of the compiled store.
+
+    Args:
+        path (str): Directory written by ``build_store``
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, VOCABULARY_FILE)) as f:
+            meta = json.load(f)
+        self.source = meta["source"]
+        self.directories = meta.get("directories")
+        self.goterms = meta["goterms"]
+        self.ontologies = meta["ontologies"]
+        for name in COLUMNS:
+            setattr(self, f"_{name}", np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def is_fresh(self, predictions_loc: str) -> bool:
+        """Whether no prediction file was added, removed or replaced since the
+        build; one stat, cheap enough for every server start"""
+        return self.directories == directory_mtimes(predictions_loc)
+
+    def matches_files(self, predictions_loc: str) -> bool:
+        """Whether every prediction file is the one the store was built from
+        (stats all of them)"""
+        return self.source == files_fingerprint(predictions_loc)
+
+    def __len__(self):
+        return len(self._proteins)
+
+    def lookup(self, protein: str):
+        """Predictions of a protein as ``(goterms, ontologies, scores)`` lists
+        sorted by descending score, or None if it has no prediction file"""
+        key = protein.encode("utf-8")
+        i = int(np.searchsorted(self._proteins, key))
+        if i == len(self._proteins) or self._proteins[i] != key:
+            return None
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return (
+            [self.goterms[code] for code in self._goterms[start:end].tolist()],
+            [self.ontologies[code] for code in self._ontologies[start:end].tolist()],
+            self._scores[start:end].tolist(),
+        )
+
+
+def read_predictions(protein_file: str):
+    """GO terms, ontologies and scores of one prediction file, in file order"""
+    with open(protein_file, newline="") as f:
+        rows = list(csv.DictReader(f))
+    return (
+        [row["GO-term"] for row in rows],
+        [row["Ontology"] for row in rows],
+        [float(row["Score"]) for row in rows],
+    )
+
+
+def build_store(predictions_loc: str, out_path: str) -> None:
+    """Compile all per-protein prediction files into a single store directory.
+
+    Args:
+        predictions_loc (str): Directory with one CSV per protein
+        out_path (str): Output directory
+    """
+    start_time = time.time()
+    # Fingerprint before listing so a file added mid-build marks the store stale
+    source = files_fingerprint(predictions_loc)
+    directories = directory_mtimes(predictions_loc)
+    # Sorted by protein name (not file name) for the binary search on lookup
+    proteins = sorted(name[:-len(".csv")].encode("utf-8") for name in os.listdir(predictions_loc) if name.endswith(".csv"))
+
+    goterm_codes, ontology_codes = {}, {}
+    offsets = np.zeros(len(proteins) + 1, dtype=np.int64)
+    goterms, ontologies, scores = [], [], []
+    for i, protein in enumerate(tqdm(proteins, desc="Compiling protein GO terms")):
+        protein_file = os.path.join(predictions_loc, protein.decode("utf-8") + ".csv")
+        protein_goterms, protein_ontologies, protein_scores = read_predictions(protein_file)
+        # Stable, so equal scores keep their file order
+        for j in sorted(range(len(protein_scores)), key=lambda j: protein_scores[j], reverse=True):
+            goterms.append(goterm_codes.setdefault(protein_goterms[j], len(goterm_codes)))
+            ontologies.append(ontology_codes.setdefault(protein_ontologies[j], len(ontology_codes)))
+            scores.append(protein_scores[j])
+        offsets[i + 1] = len(scores)
+
+    os.makedirs(out_path, exist_ok=True)
+    np.save(os.path.join(out_path, "proteins.npy"), np.array(proteins, dtype=bytes) if proteins else np.empty(0, dtype="S1"))
+    np.save(os.path.join(out_path, "offsets.npy"), offsets)
+    np.save(os.path.join(out_path, "goterms.npy"), np.array(goterms, dtype=np.int32))
+    np.save(os.path.join(out_path, "ontologies.npy"), np.array(ontologies, dtype=np.uint8))
+    np.save(os.path.join(out_path, "scores.npy"), np.array(scores, dtype=np.float64))
+    # Write the vocabulary last so a reader never sees it without its columns
+    tmp = os.path.join(out_path, VOCABULARY_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"source": source, "directories": directories, "goterms": list(goterm_codes), "ontologies": list(ontology_codes)}, f)
+    os.replace(tmp, os.path.join(out_path, VOCABULARY_FILE))
+    logger.info(f"Compiled GO terms of {len(proteins)} proteins ({len(scores)} predictions) in {time.time() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile per-protein DeepFRI GO-term files into a single store")
+    parser.add_argument("--predictions", default="/mnt/data/deepfri_predictions_protein_HQ", help="Per-protein prediction directory")
+    parser.add_argument("--out", default="/mnt/data/goterm_store", help="Output directory")
+    parser.add_argument("--check", action="store_true", help="Only check whether the store is up to date (exit status 1 if not)")
+    args = parser.parse_args()
+
+    if args.check:
+        store = GOPredictionStore(args.out) if os.path.exists(os.path.join(args.out, VOCABULARY_FILE)) else None
+        fresh = store is not None and store.is_fresh(args.predictions) and store.matches_files(args.predictions)
+        logger.info(f"GO term store at {args.out} is {'up to date' if fresh else 'stale, rebuild it'}")
+        sys.exit(0 if fresh else 1)
+    build_store(args.predictions, args.out)
@@ -0,0 +1,143 @@
+"""
+Memory accounting of the structures the server keeps.
+
+``structure_bytes`` estimates how much memory a table, index or lookup holds,
+split into bytes on the heap and bytes of memory-mapped snapshot files (which
+only count towards RSS once touched and are shared between workers).
+``log_memory_report`` logs that for every named structure at startup, next to
+the process RSS, so the effect of a layout change is visible in the logs.
+"""
+
+import mmap
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# Python containers larger than this are measured on a sample of their items
+_SAMPLE = 1000
+
+
+def _is_mapped(array: np.ndarray) -> bool:
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, "base", None)
+    return False
+
+
+def _file_mappings() -> list:
+    """``(start, end)`` address ranges of the files mapped into the process
+    (empty without /proc)"""
+    ranges = []
+    try:
+        with open("/proc/self/maps") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 6 and fields[5].startswith("/"):
+                    start, end = fields[0].split("-")
+                    ranges.append((int(start, 16), int(end, 16)))
+    except OSError:
+        pass
+    return ranges
+
+
+def _arrow_bytes(value) -> tuple:
+    """``(heap, mapped)`` bytes of the buffers of an Arrow-backed array"""
+    mappings = _file_mappings()
+    heap = mapped = 0
+    for chunk in value.__arrow_array__().chunks:
+        for buffer in chunk.buffers():
+            if buffer is None:
+                continue
+            if any(start <= buffer.address < end for start, end in mappings):
+                mapped += buffer.size
+            else:
+                heap += buffer.size
+    return heap, mapped
+
+
+def _items_bytes(items: list, total: int) -> int:
+    """Size of Python objects, extrapolated from the first ``_SAMPLE``"""
+    sample = items[:_SAMPLE]
+    if not sample:
+        return 0
+    return int(sum(sys.getsizeof(item) for item in sample) * total / len(sample))
+
+
+def structure_bytes(value) -> tuple:
+    """Estimated ``(heap, mapped)`` bytes held by a value.
+
+    Frames count their buffers and string objects (mapped Arrow buffers are
+    counted as heap), arrays their data (Arrow-backed ones split by whether
+    their buffers lie in a mapped file), objects with an ``arrays()`` method
+    (the query indexes) the arrays it returns and any other arrays they hold
+    (such as the names a cluster index keeps but does not store), dicts and
+    lists their items.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return sys.getsizeof(value) + _items_bytes(value[:_SAMPLE].tolist(), len(value)), 0
+        return (0, value.nbytes) if _is_mapped(value) else (value.nbytes, 0)
+    if isinstance(value, pd.api.extensions.ExtensionArray):
+        return _arrow_bytes(value) if hasattr(value, "__arrow_array__") else (value.nbytes, 0)
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage), 0
+    if hasattr(value, "arrays"):
+        heap = mapped = 0
+        # By identity, so an array also kept as an attribute counts once
+        items = {id(item): item for item in [*value.arrays().values(), *vars(value).values()]}
+        for item in items.values():
+            if isinstance(item, (np.ndarray, pd.api.extensions.ExtensionArray)):
+                item_heap, item_mapped = structure_bytes(item)
+                heap += item_heap
+                mapped += item_mapped
+        return heap, mapped
+    if isinstance(value, dict):
+        keys = list(value.keys())[:_SAMPLE]
+        items = keys + [value[key] for key in keys]
+        return sys.getsizeof(value) + _items_bytes(items, 2 * len(value)), 0
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + _items_bytes(list(value[:_SAMPLE]), len(value)), 0
+    return sys.getsizeof(value), 0
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak on systems without /proc)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _format(size: int) -> str:
+    return f"{size / 1024**2:,.1f} MiB"
+
+
+def log_memory_report(structures: dict) -> dict:
+    """Log the estimated size of every structure, largest first.
+
+    Args:
+        structures (dict): Name to structure
+
+    Returns:
+        dict: Name to ``(heap, mapped)`` bytes
+    """
+    sizes = {name: structure_bytes(value) for name, value in structures.items()}
+    lines = [
+        f"  {name:<32}{_format(heap):>14} heap{_format(mapped):>14} mapped"
+        for name, (heap, mapped) in sorted(sizes.items(), key=lambda item: -sum(item[1]))
+    ]
+    heap = sum(size[0] for size in sizes.values())
+    mapped = sum(size[1] for size in sizes.values())
+    logger.info(
+        f"Memory: {_format(rss_bytes())} RSS, structures {_format(heap)} heap + {_format(mapped)} mapped\n"
+        + "\n".join(lines)
+    )
+    return sizes
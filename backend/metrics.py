@@ -0,0 +1,387 @@
+"""
+Request and stage metrics in the Prometheus text format.
+
+A few counters and latency histograms, recorded in memory under a lock and
+rendered on demand for ``/api/metrics``, replace per-request timing logs:
+recording a sample is a bucket search and two additions instead of formatting
+and writing a log line. ``StageTimer`` times named stages of a request into a
+histogram and writes the old style log line for a random sample of them, so
+individual slow stages can still be inspected without logging every one.
+
+Each server worker records its own metrics. With several workers, a
+``Registry`` given a shared directory also writes its state to a file there
+(every few seconds and on every scrape) and renders the sum over all the
+workers' files, so a scrape answered by any worker reports the whole server and
+counters never go backwards. The files of one launch go to a subdirectory named
+after the process that started the workers, each named after its worker; both
+names pair the pid with the process start time, so a pid reused after a restart
+starts afresh. Counts of workers that exited are kept; their gauges are dropped.
+A worker starting up removes the subdirectories of launches that are over.
+"""
+
+import bisect
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from loguru import logger
+
+# Seconds, from a cache hit to a slow conversion
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per combination of label values.
+
+    Args:
+        name (str): Metric name, conventionally ending in ``_total``
+        documentation (str): Help text
+        labels (list): Label names
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self) -> list:
+        """Current values as ``[label values, value]`` pairs"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(states) -> list:
+        """Sum of the states of several processes"""
+        totals = {}
+        for state in states:
+            for key, value in state:
+                totals[tuple(key)] = totals.get(tuple(key), 0) + value
+        return [[list(key), value] for key, value in totals.items()]
+
+    def samples(self, state: list = None):
+        for key, value in self.state() if state is None else state:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Distribution of observed values per combination of label values.
+
+    Args:
+        name (str): Metric name, conventionally ending in ``_seconds``
+        documentation (str): Help text
+        labels (list): Label names
+        buckets (tuple): Increasing upper bounds of the buckets (``+Inf`` is
+            added)
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Label values to (per-bucket counts, sum); counts are not cumulative
+        # until rendered
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def state(self) -> list:
+        """Current values as ``[label values, bucket counts, sum]`` triples"""
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(states) -> list:
+        """Sum of the states of several processes"""
+        totals = {}
+        for state in states:
+            for key, counts, total in state:
+                entry = totals.get(tuple(key))
+                if entry is None:
+                    totals[tuple(key)] = [list(counts), total]
+                else:
+                    entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                    entry[1] += total
+        return [[list(key), counts, total] for key, (counts, total) in totals.items()]
+
+    def samples(self, state: list = None):
+        for key, counts, total in self.state() if state is None else state:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Callback:
+    """Values read from elsewhere (e.g. executor or cache stats) when rendered.
+
+    Args:
+        name (str): Metric name
+        documentation (str): Help text
+        kind (str): ``"gauge"`` or ``"counter"``
+        labels (list): Label names
+        read (callable): Returns a dict of label value tuples to values
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, labels, read):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.read = read
+
+    def state(self) -> list:
+        return [[list(key), value] for key, value in self.read().items()]
+
+    merge = staticmethod(Counter.merge)
+
+    def samples(self, state: list = None):
+        for key, value in self.state() if state is None else state:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+def process_token(pid: int):
+    """``<pid>-<start time>`` of a running process (just the pid without
+    procfs), None if no such process runs"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the command name, which may hold spaces; the start
+            # time is the 22nd field
+            return f"{pid}-{f.read().rsplit(')', 1)[1].split()[19]}"
+    except FileNotFoundError:
+        if os.path.isdir("/proc"):
+            return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return str(pid)
+
+
+def _running(token: str) -> bool:
+    try:
+        return process_token(int(token.split("-")[0])) == token
+    except ValueError:
+        return False
+
+
+class Registry:
+    """Collection of metrics rendered together.
+
+    Args:
+        shared_dir (str): Directory shared by the workers of a server to
+            render the metrics of all of them (see module docs); None for
+            this process only
+        flush_interval (float): Seconds between writes of this process's
+            state to ``shared_dir``
+    """
+
+    def __init__(self, shared_dir: str = None, flush_interval: float = 5.0):
+        self._metrics = []
+        self.shared_dir = shared_dir
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+            for name in os.listdir(shared_dir):
+                if not _running(name):
+                    # A launch that is over (or files of an older layout)
+                    path = os.path.join(shared_dir, name)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+            self.launch_dir = os.path.join(shared_dir, process_token(os.getppid()))
+            self.token = process_token(os.getpid())
+            os.makedirs(self.launch_dir, exist_ok=True)
+            self.flush_interval = flush_interval
+            threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.shared_dir}: {e}")
+
+    def flush(self) -> None:
+        """Write the state of this process to the shared directory"""
+        path = os.path.join(self.launch_dir, f"{self.token}.json")
+        state = {metric.name: metric.state() for metric in self._metrics}
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def _shared_states(self) -> list:
+        """``(process token, state)`` of every worker of this launch"""
+        states = []
+        for name in os.listdir(self.launch_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.launch_dir, name)) as f:
+                    states.append((name[:-len(".json")], json.load(f)))
+            except (OSError, ValueError):
+                # Replaced or removed while listing
+                continue
+        return states
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str, labels, read) -> Callback:
+        return self._register(Callback(name, documentation, kind, labels, read))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format, summed over
+        the workers sharing the directory if there is one"""
+        states = None
+        if self.shared_dir:
+            self.flush()
+            states = self._shared_states()
+            running = {token for token, _ in states if _running(token)}
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if states is None:
+                lines.extend(metric.samples())
+            else:
+                lines.extend(metric.samples(metric.merge(
+                    state[metric.name] for token, state in states
+                    if metric.name in state and (metric.kind != "gauge" or token in running)
+                )))
+        return "\n".join(lines) + "\n"
+
+
+class Stage:
+    """A running stage; set ``note`` to add detail to its sampled log line"""
+
+    __slots__ = ("name", "note")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.note = None
+
+
+class StageTimer:
+    """Times stages of request handling into a histogram labelled by stage.
+
+    Args:
+        histogram (Histogram): Histogram with a ``stage`` label
+        log_sample (float): Fraction of stages that are also logged
+    """
+
+    def __init__(self, histogram: Histogram, log_sample: float = 0.0):
+        self.histogram = histogram
+        self.log_sample = log_sample
+
+    @contextmanager
+    def __call__(self, name: str):
+        stage = Stage(name)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            self.histogram.observe(elapsed, stage=name)
+            if self.log_sample and random.random() < self.log_sample:
+                logger.info(f"Stage {name} took {elapsed:.3f}s" + (f" ({stage.note})" if stage.note else ""))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency of every HTTP request by method,
+    route template (not the raw path, to keep the label set small) and status.
+
+    Args:
+        app: The wrapped ASGI application
+        histogram (Histogram): Histogram with ``method``, ``route`` and
+            ``status`` labels
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            self.histogram.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
@@ -0,0 +1,228 @@
+"""
+Name index for protein search.
+
+The lowercase names are kept as one sorted byte-string array, so prefix and
+exact lookups are two binary searches. Substring lookups go through posting
+lists of the trigrams of every name: the query's rarest trigrams select a few
+candidates which are then checked directly. Trigrams shared by a large fraction
+of the names (``af-``, ``_v4``, ...) select nothing and are not stored; a query
+made only of those (or shorter than three characters) falls back to a scan
+that stops at the first matches. Every lookup checks at most a fixed number of
+names, whatever the user types; ``find`` tells when that limit left names
+unchecked, so matches may be missing.
+"""
+
+import numpy as np
+import pandas as pd
+
+MODES = ("prefix", "substring", "exact")
+
+
+def _trigram_codes(names: np.ndarray, column: int):
+    """Trigram starting at byte ``column`` of every name as a 24-bit code, and
+    whether the name is long enough to have one"""
+    mat = names.view(np.uint8).reshape(len(names), names.dtype.itemsize)
+    codes = (
+        mat[:, column].astype(np.uint32) << 16
+        | mat[:, column + 1].astype(np.uint32) << 8
+        | mat[:, column + 2]
+    )
+    return codes, mat[:, column + 2] != 0
+
+
+def _query_codes(query: bytes) -> np.ndarray:
+    return np.unique([query[i] << 16 | query[i + 1] << 8 | query[i + 2] for i in range(len(query) - 2)]).astype(np.uint32)
+
+
+class NameIndex:
+    """Sorted names plus trigram posting lists.
+
+    Search results are positions into the ``names`` the index was built from;
+    names that only differ in case are indexed once.
+
+    Args:
+        names (array-like): Names to index
+        max_postings (int): Trigrams found in more names than this are not
+            stored (defaults to 1% of the names, at least 10000)
+        max_verify (int): Upper bound on the names checked per lookup
+    """
+
+    def __init__(self, names, max_postings: int = None, max_verify: int = 200_000):
+        lower = pd.Series(names, dtype=object).str.lower()
+        encoded = np.array(lower.str.encode("utf-8").tolist(), dtype=bytes) if len(lower) else np.empty(0, dtype="S1")
+        self.names, first = np.unique(encoded, return_index=True)
+        self.ids = first.astype(np.int32 if len(encoded) < 2**31 else np.int64)
+        self.max_verify = max_verify
+        n = len(self.names)
+        if max_postings is None:
+            max_postings = max(10_000, n // 100)
+
+        # Count every (trigram, name) pair, then lay the postings out by trigram.
+        # Positions refer to the sorted names; a trigram repeated inside one
+        # name is listed twice and deduplicated at query time.
+        width = self.names.dtype.itemsize
+        counts = np.zeros(1 << 24, dtype=np.int64)
+        for column in range(width - 2):
+            codes, valid = _trigram_codes(self.names, column)
+            if n < 1 << 20:
+                # Sorting a few codes beats adding up a histogram of every trigram
+                grams, gram_counts = np.unique(codes[valid], return_counts=True)
+                counts[grams] += gram_counts
+            else:
+                counts += np.bincount(codes[valid], minlength=1 << 24)
+
+        self.common = np.flatnonzero(counts > max_postings).astype(np.uint32)
+        counts[self.common] = 0
+        self.grams = np.flatnonzero(counts).astype(np.uint32)
+        self.starts = np.zeros(len(self.grams) + 1, dtype=np.int64)
+        np.cumsum(counts[self.grams], out=self.starts[1:])
+
+        position_dtype = np.int32 if n < 2**31 else np.int64
+        self.postings = np.empty(self.starts[-1], dtype=position_dtype)
+        fill = np.zeros(1 << 24, dtype=np.int64)
+        fill[self.grams] = self.starts[:-1]
+        positions = np.arange(n, dtype=position_dtype)
+        for column in range(width - 2):
+            codes, valid = _trigram_codes(self.names, column)
+            keep = valid & (counts[codes] > 0)
+            codes, rows = codes[keep], positions[keep]
+            if len(codes) == 0:
+                continue
+            order = np.argsort(codes, kind="stable")
+            codes, rows = codes[order], rows[order]
+            # Rank of every entry inside its run of equal trigrams
+            run_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            run_lengths = np.diff(np.r_[run_starts, len(codes)])
+            rank = np.arange(len(codes)) - np.repeat(run_starts, run_lengths)
+            self.postings[fill[codes] + rank] = rows
+            fill[codes[run_starts]] += run_lengths
+
+    def arrays(self) -> dict:
+        """State needed to restore the index with ``from_arrays``"""
+        return {
+            "names": self.names,
+            "ids": self.ids,
+            "common": self.common,
+            "grams": self.grams,
+            "starts": self.starts,
+            "postings": self.postings,
+            "max_verify": self.max_verify,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "NameIndex":
+        """Rebuild an index from ``arrays()`` output without re-sorting the names"""
+        index = cls.__new__(cls)
+        for name in ["names", "ids", "common", "grams", "starts", "postings"]:
+            setattr(index, name, arrays[name])
+        index.max_verify = int(arrays["max_verify"])
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def _range(self, query: bytes, prefix: bool):
+        """Span of the sorted names equal to (or starting with) the query"""
+        if len(query) > self.names.dtype.itemsize:
+            return 0, 0
+        lo = int(np.searchsorted(self.names, query, side="left"))
+        if prefix:
+            # Every name starting with the query sorts before query + 0xff
+            hi = int(np.searchsorted(self.names, query + b"\xff", side="left"))
+        else:
+            hi = int(np.searchsorted(self.names, query, side="right"))
+        return lo, hi
+
+    def _postings(self, code) -> np.ndarray:
+        i = np.searchsorted(self.grams, code)
+        if i == len(self.grams) or self.grams[i] != code:
+            return None
+        return self.postings[self.starts[i]:self.starts[i + 1]]
+
+    def _scan(self, query: bytes, limit: int):
+        """Names containing the query, checked in order until ``limit`` are
+        found; for queries too short or too common for the trigram lists.
+        Also tells whether every name was checked."""
+        hits = []
+        end = min(len(self.names), self.max_verify)
+        for start in range(0, end, 4096):
+            names = self.names[start:start + 4096].tolist()
+            hits.extend(start + i for i, name in enumerate(names) if query in name)
+            if len(hits) >= limit:
+                end = min(start + 4096, end)
+                break
+        return np.asarray(hits, dtype=np.int64), end == len(self.names)
+
+    def _substring_candidates(self, query: bytes):
+        """Names that contain every trigram of the query, or None when all of
+        them are too common to be indexed; the candidates beyond
+        ``max_verify`` are dropped"""
+        lists = []
+        for code in _query_codes(query):
+            postings = self._postings(code)
+            if postings is not None:
+                lists.append(postings)
+            elif not np.isin(code, self.common):
+                # A trigram no name contains
+                return np.empty(0, dtype=np.int64)
+        if not lists:
+            return None
+
+        lists.sort(key=len)
+        candidates = np.unique(lists[0])
+        for postings in lists[1:]:
+            if len(candidates) <= 64:
+                break
+            candidates = np.intersect1d(candidates, postings)
+        return candidates
+
+    def search(self, query: str, mode: str = "substring", limit: int = 10) -> np.ndarray:
+        """Positions of the names matching a query (see ``find``)"""
+        return self.find(query, mode, limit)[0]
+
+    def find(self, query: str, mode: str = "substring", limit: int = 10):
+        """Find names matching a query, case-insensitively.
+
+        Substring matches are ranked by where the query occurs (prefix matches
+        first), then by name length, then alphabetically; prefix matches are
+        returned in alphabetical order, so an exact match always comes first.
+
+        Args:
+            query (str): Text to look for
+            mode (str): ``"prefix"``, ``"substring"`` or ``"exact"``
+            limit (int): Maximum number of results
+
+        Returns:
+            tuple: ``(positions, complete)``: positions into the indexed names,
+            best match first, and whether every matching name was ranked.
+            False when a substring lookup left names unchecked (a scan that
+            stopped at ``limit`` matches or ``max_verify`` names, or more
+            trigram candidates than ``max_verify``), so matches, possibly
+            better ranked ones, may be missing
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {MODES}")
+        query = query.strip().lower().encode("utf-8")
+        if not query or limit <= 0:
+            return np.empty(0, dtype=np.int64), True
+
+        if mode != "substring":
+            lo, hi = self._range(query, prefix=mode == "prefix")
+            return np.asarray(self.ids[lo:min(hi, lo + limit)], dtype=np.int64), True
+
+        candidates = self._substring_candidates(query) if len(query) >= 3 else None
+        if candidates is None:
+            candidates, complete = self._scan(query, limit)
+        else:
+            complete = len(candidates) <= self.max_verify
+            candidates = candidates[:self.max_verify]
+        # Prefix matches rank first, make sure a capped candidate set has them
+        lo, hi = self._range(query, prefix=True)
+        candidates = np.union1d(np.arange(lo, min(hi, lo + limit)), candidates)
+        names = self.names[candidates].tolist()
+        found = np.fromiter((name.find(query) for name in names), dtype=np.int64, count=len(names))
+        hits = found >= 0
+        candidates, found = candidates[hits], found[hits]
+        lengths = np.fromiter((len(name) for name in self.names[candidates].tolist()), dtype=np.int64, count=len(candidates))
+        best = np.lexsort((candidates, lengths, found))[:limit]
+        return np.asarray(self.ids[candidates[best]], dtype=np.int64), complete
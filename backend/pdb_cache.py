@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+Persistent cache of CIF-to-PDB conversions.
+
+Converted files are stored under the SHA-256 of the source CIF, so a structure
+is converted once no matter how often or by how many workers it is requested.
+Concurrent conversions of the same structure are deduplicated with a per-entry
+file lock (which works across threads and processes), results are written to a
+temporary file and renamed into place, and the least recently used entries are
+evicted once the cache grows past its size limit.
+
+A conversion may run in another process than the one serving lookups:
+``convert_entry`` only touches the cache directory and returns what it did,
+and ``record`` applies that to the in-memory bookkeeping (known source digests
+and the cache size) of the serving process.
+
+The command line pre-converts the most requested structures, counted from
+access logs or plain lists of structure paths:
+
+usage:
+  python pdb_cache.py [--top N] [--workers N] LOG_OR_LIST [LOG_OR_LIST ...]
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import fcntl
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+from cif_to_pdb import cif_to_pdb
+
+PDB_REQUEST = re.compile(r"/api/pdb/(\S+?\.cif)\b")
+
+
+class ConversionCache:
+    """Content-addressed directory of converted PDB files.
+
+    Args:
+        cache_dir (str): Directory holding the converted files
+        max_bytes (int): Size above which least recently used entries are evicted
+        max_digests (int): Number of source digests to remember
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 5 * 1024**3, max_digests: int = 100_000):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_digests = max_digests
+        os.makedirs(cache_dir, exist_ok=True)
+        # (path, size, mtime_ns) -> digest, so warm hits skip re-hashing the
+        # source; least recently used first
+        self._digests = collections.OrderedDict()
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".pdb"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def _key(ciffile: str) -> tuple:
+        stat = os.stat(ciffile)
+        return ciffile, stat.st_size, stat.st_mtime_ns
+
+    def digest(self, ciffile: str, key: tuple = None) -> str:
+        """SHA-256 of a source file; not read again if it was recorded before"""
+        digest = self._digests.get(key or self._key(ciffile))
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(ciffile, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+        return digest
+
+    def _remember(self, key: tuple, digest: str) -> None:
+        self._digests[key] = digest
+        self._digests.move_to_end(key)
+        while len(self._digests) > self.max_digests:
+            self._digests.popitem(last=False)
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], digest + ".pdb")
+
+    def lookup(self, ciffile: str):
+        """Path of the cached conversion if the source was hashed before and its
+        entry is still present, otherwise None (without reading the source)"""
+        try:
+            key = self._key(ciffile)
+        except FileNotFoundError:
+            return None
+        digest = self._digests.get(key)
+        if digest is not None and self._touch(self.path_for(digest)):
+            self._digests.move_to_end(key)
+            return self.path_for(digest)
+        return None
+
+    def convert(self, ciffile: str) -> str:
+        """Return the path of the PDB version of a CIF file, converting it if
+        it is not cached yet.
+
+        Args:
+            ciffile (str): Path to the source CIF file
+
+        Returns:
+            str: Path to the converted file inside the cache
+        """
+        entry = self.convert_entry(ciffile)
+        if self.record(entry):
+            self.evict()
+        return entry[0]
+
+    def record(self, entry: tuple) -> bool:
+        """Take the outcome of ``convert_entry`` into account.
+
+        Returns:
+            bool: Whether the cache may have outgrown its size limit, i.e.
+            ``evict`` should run
+        """
+        _, key, digest, added = entry
+        self._remember(key, digest)
+        self._size += added
+        return self._size > self.max_bytes
+
+    def convert_entry(self, ciffile: str) -> tuple:
+        """Convert a CIF file if it is not cached yet, without changing this
+        object, so that it can run on a copy in a worker process.
+
+        Returns:
+            tuple: ``(pdbfile, key, digest, added)`` for ``record``, where
+            added is the number of bytes the conversion added to the cache
+        """
+        key = self._key(ciffile)
+        digest = self.digest(ciffile, key)
+        pdbfile = self.path_for(digest)
+        if self._touch(pdbfile):
+            return pdbfile, key, digest, 0
+
+        os.makedirs(os.path.dirname(pdbfile), exist_ok=True)
+        with open(pdbfile + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Whoever held the lock before us may have converted it already
+            if self._touch(pdbfile):
+                return pdbfile, key, digest, 0
+
+            start_time = time.time()
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(pdbfile), suffix=".tmp")
+            os.close(fd)
+            try:
+                cif_to_pdb(ciffile, tmp)
+                os.replace(tmp, pdbfile)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            logger.info(f"CIF to PDB conversion of {ciffile} took {time.time() - start_time:.2f}s")
+
+        return pdbfile, key, digest, os.path.getsize(pdbfile)
+
+    def _touch(self, pdbfile: str) -> bool:
+        """Mark an entry as recently used; False if it is not cached"""
+        try:
+            os.utime(pdbfile)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def evict(self, target: float = 0.9) -> None:
+        """Remove least recently used entries until the cache is below
+        ``target`` of its size limit, if it is over the limit.
+
+        The size is measured on disk rather than trusted from the running
+        count, which other processes sharing the directory do not update.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        if size <= self.max_bytes:
+            self._size = size
+            return
+        for path, entry_size, _ in entries:
+            if size <= self.max_bytes * target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+                # A converter still holding the old lock only duplicates work,
+                # its result is renamed into place atomically all the same
+                os.remove(path + ".lock")
+            except FileNotFoundError:
+                pass
+        self._size = size
+
+
+def _convert(cache: ConversionCache, ciffile: str):
+    try:
+        cache.convert(ciffile)
+        return ciffile, None
+    except BaseException as e:  # cif_to_pdb exits on structures with too many chains
+        return ciffile, repr(e)
+
+
+def most_requested(sources, top: int) -> list:
+    """Count structure paths in access logs or lists and return the top ones"""
+    counts = collections.Counter()
+    for source in sources:
+        with (sys.stdin if source == "-" else open(source)) as f:
+            for line in f:
+                matches = PDB_REQUEST.findall(line)
+                if matches:
+                    counts.update(matches)
+                elif line.strip().endswith(".cif"):
+                    counts[line.strip()] += 1
+    return [path for path, _ in counts.most_common(top)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-convert the most requested structures into the PDB cache")
+    parser.add_argument("sources", nargs="+", help="Access logs or lists of structure paths ('-' for stdin)")
+    parser.add_argument("--struct-dir", default="/mnt/data/mip-follow-up_clusters/struct/", help="Directory the structure paths are relative to")
+    parser.add_argument("--cache-dir", default="/mnt/data/pdb_cache", help="Conversion cache directory")
+    parser.add_argument("--max-bytes", type=int, default=5 * 1024**3, help="Cache size limit")
+    parser.add_argument("--top", type=int, default=1000, help="Number of structures to convert")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parallel conversions")
+    args = parser.parse_args()
+
+    cache = ConversionCache(args.cache_dir, args.max_bytes)
+    paths = [os.path.join(args.struct_dir, p.replace("..", "")) for p in most_requested(args.sources, args.top)]
+    logger.info(f"Pre-converting {len(paths)} structures with {args.workers} workers")
+
+    start_time = time.time()
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for ciffile, error in pool.map(_convert, [cache] * len(paths), paths, chunksize=8):
+            if error:
+                failed += 1
+                logger.warning(f"Could not convert {ciffile}: {error}")
+    logger.info(f"Converted {len(paths) - failed} structures in {time.time() - start_time:.2f}s ({failed} failed)")
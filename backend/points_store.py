@@ -0,0 +1,504 @@
+#!/usr/bin/env python
+"""
+Out-of-core point table: data.parquet rewritten in spatial order.
+
+Serving from the store instead of the in-memory row tables lets the server
+handle datasets larger than RAM; only the query indexes of the snapshot (which
+are memory-mapped) and a bounded cache of decoded row groups stay resident.
+
+The points are split into levels by rank (their position in DATA, which is in
+shuffled order): level 0 holds the first ``row_group_size`` ranks and every
+further level as many as all levels before it. Within a level the rows are
+sorted along a Hilbert curve over x/y and written in small row groups, so each
+row group covers a compact patch of the map and its column statistics give a
+tight bounding box. A viewport query reads only the row groups whose boxes
+overlap the viewport, a level at a time, and stops after the first level that
+completes ``limit`` matches: every row of a later level ranks after them, so the
+answer is the first matches in DATA order, the rows the server's spatial scan
+of the in-memory table returns, while zoomed out views only touch the small
+coarse levels. The server answers most viewports from the tile pyramid of the
+snapshot in either mode and only fetches the sampled rows from the store
+(``take``); ``query`` stands in for the spatial scan where the pyramid falls
+short.
+
+Filters run as Arrow compute expressions on the decoded row groups (the range
+filters also skip row groups by their statistics). Rows without coordinates
+follow the levels, so the name lookups (``pdb_loc``, ``url``) need no table
+either.
+
+Rewriting is an external sort: only a few arrays the length of the table are
+held in memory, the rows themselves pass through temporary bucket files.
+
+usage:
+  python points_store.py [--data PARQUET] [--out DIR] [--row-group-size N]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from loguru import logger
+
+from byte_lru import ByteLRU
+from fingerprint import source_fingerprint
+from snapshot import AFDB_ORIGINS, RENAMED_COLUMNS, RowLookup, clean_names, point_order
+
+# Bump whenever write_store changes what it produces
+STORE_VERSION = 1
+META_FILE = "meta.json"
+POINTS_FILE = "points.parquet"
+
+ROW_GROUP_SIZE = 16384
+# Rows per temporary bucket of the external sort
+BUCKET_ROWS = 4_000_000
+HILBERT_ORDER = 16
+# Columns whose row group statistics prune queries
+_STATISTICS = ["x", "y", "length", "afdb_pLDDT"]
+
+
+def hilbert_keys(x: np.ndarray, y: np.ndarray, bounds, order: int = HILBERT_ORDER) -> np.ndarray:
+    """Distance along a Hilbert curve of points snapped to a 2**order grid.
+
+    Args:
+        x, y (np.ndarray): Finite coordinates
+        bounds (tuple): ``(xmin, xmax, ymin, ymax)`` the grid spans
+        order (int): Bits per axis
+
+    Returns:
+        np.ndarray: int64 keys in ``[0, 4**order)``
+    """
+    side = 1 << order
+    xmin, xmax, ymin, ymax = bounds
+    qx = np.clip(np.floor((x - xmin) / max(xmax - xmin, 1e-12) * side), 0, side - 1).astype(np.int64)
+    qy = np.clip(np.floor((y - ymin) / max(ymax - ymin, 1e-12) * side), 0, side - 1).astype(np.int64)
+    keys = np.zeros(len(qx), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (qx & s) > 0
+        ry = (qy & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve continues into the next one
+        flip = ~ry & rx
+        qx = np.where(flip, side - 1 - qx, qx)
+        qy = np.where(flip, side - 1 - qy, qy)
+        qx, qy = np.where(~ry, qy, qx), np.where(~ry, qx, qy)
+        s >>= 1
+    return keys
+
+
+def level_starts(points: int, row_group_size: int) -> np.ndarray:
+    """First rank of every level, followed by the number of points"""
+    starts = [0]
+    size = row_group_size
+    while starts[-1] + size < points:
+        starts.append(starts[-1] + size)
+        size = starts[-1]
+    return np.array(starts + [points], dtype=np.int64)
+
+
+def _index_column(schema: pa.Schema):
+    """The column holding the protein names, which pandas stored as the
+    index, and the name of that index"""
+    metadata = schema.pandas_metadata or {}
+    columns = [column for column in metadata.get("index_columns", []) if isinstance(column, str)]
+    if not columns:
+        raise ValueError("data.parquet has no stored index of protein names")
+    names = {column.get("field_name"): column.get("name") for column in metadata.get("columns", [])}
+    return columns[0], names.get(columns[0], columns[0])
+
+
+def _point_columns(table: pa.Table, index_column: str) -> pa.Table:
+    """Rows of data.parquet with the columns DATA has: renamed, pLDDT only for
+    the AFDB origins and the names last as ``protein``"""
+    columns = {}
+    for name in table.column_names:
+        if name not in ("afdb_hq", index_column):
+            columns[RENAMED_COLUMNS.get(name, name)] = table.column(name)
+    plddt = columns["afdb_pLDDT"]
+    columns["afdb_pLDDT"] = pc.if_else(
+        pc.is_in(columns["origin"], value_set=pa.array(AFDB_ORIGINS, type=columns["origin"].type)),
+        plddt,
+        pa.scalar(-1, type=plddt.type),
+    )
+    columns["protein"] = table.column(index_column)
+    return pa.table(columns)
+
+
+def write_store(data_loc: str, out_path: str, row_group_size: int = ROW_GROUP_SIZE, bucket_rows: int = BUCKET_ROWS) -> None:
+    """Rewrite data.parquet into a store directory.
+
+    Args:
+        data_loc (str): Path to data.parquet
+        out_path (str): Output directory
+        row_group_size (int): Rows per row group
+        bucket_rows (int): Rows per temporary bucket file (the peak number of
+            rows in memory)
+    """
+    start_time = time.time()
+    # Fingerprint before reading so a file replaced mid-build marks the store stale
+    fingerprint = source_fingerprint(data_loc)
+    source = pq.ParquetFile(data_loc)
+    index_column, index_name = _index_column(source.schema_arrow)
+
+    coordinates = source.read(columns=["x", "y"])
+    x = coordinates.column("x").to_numpy()
+    y = coordinates.column("y").to_numpy()
+    has_coordinates = ~(np.isnan(x) | np.isnan(y))
+    full_positions, full_to_data = point_order(has_coordinates)
+    points, rows = len(full_positions), len(has_coordinates)
+
+    # Sort by level, then along the curve; rows without coordinates go last
+    starts = level_starts(points, row_group_size)
+    bounds = [float(x[has_coordinates].min()), float(x[has_coordinates].max()), float(y[has_coordinates].min()), float(y[has_coordinates].max())] if points else [0.0, 1.0, 0.0, 1.0]
+    levels = np.searchsorted(starts[:-1], full_to_data, side="right") - 1
+    levels[~has_coordinates] = len(starts) - 1
+    keys = levels << (2 * HILBERT_ORDER)
+    keys[has_coordinates] += hilbert_keys(x[has_coordinates], y[has_coordinates], bounds)
+    del coordinates, x, y, levels
+    order = np.argsort(keys, kind="stable")
+    del keys
+    destination = np.empty(rows, dtype=np.int64)
+    destination[order] = np.arange(rows)
+    logger.info(f"Sorting {rows} rows ({points} points in {len(starts) - 1} levels) took {time.time() - start_time:.2f}s")
+
+    # Buckets start at every level (and a whole number of row groups into
+    # one), so no row group spans two levels
+    bucket = max(row_group_size, bucket_rows // row_group_size * row_group_size)
+    boundaries = np.unique(np.concatenate([np.arange(a, b, bucket) for a, b in zip(np.append(starts[:-1], points), np.append(starts[1:], rows)) if b > a] + [[rows]]))
+
+    tmp_path = out_path.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    start_time = time.time()
+    writers = {}
+    offset = 0
+    for batch in source.iter_batches(batch_size=256 * 1024):
+        table = _point_columns(pa.Table.from_batches([batch]), index_column)
+        positions = np.arange(offset, offset + len(table))
+        offset += len(table)
+        table = table.append_column("rank", pa.array(full_to_data[positions]))
+        table = table.append_column("_destination", pa.array(destination[positions]))
+        buckets = np.searchsorted(boundaries, destination[positions], side="right") - 1
+        by_bucket = np.argsort(buckets, kind="stable")
+        table = table.take(by_bucket)
+        buckets = buckets[by_bucket]
+        splits = np.flatnonzero(np.diff(buckets)) + 1
+        for a, b in zip(np.append(0, splits), np.append(splits, len(buckets))):
+            part = table.slice(a, b - a)
+            writer = writers.get(buckets[a])
+            if writer is None:
+                writer = writers[buckets[a]] = pq.ParquetWriter(os.path.join(tmp_path, f"bucket_{buckets[a]}.parquet"), part.schema)
+            writer.write_table(part)
+    for writer in writers.values():
+        writer.close()
+    logger.info(f"Splitting rows into {len(writers)} buckets took {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    writer = None
+    for i in range(len(boundaries) - 1):
+        bucket_loc = os.path.join(tmp_path, f"bucket_{i}.parquet")
+        part = pq.read_table(bucket_loc)
+        part = part.take(np.argsort(part.column("_destination").to_numpy())).drop_columns(["_destination"])
+        if writer is None:
+            writer = pq.ParquetWriter(os.path.join(tmp_path, POINTS_FILE), part.schema)
+        writer.write_table(part, row_group_size=row_group_size)
+        os.remove(bucket_loc)
+    writer.close()
+    logger.info(f"Writing {POINTS_FILE} took {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    names = source.read(columns=[index_column]).column(0).to_pylist()
+    lookup = RowLookup.build(names, destination)
+    del names
+    np.save(os.path.join(tmp_path, "name_keys.npy"), lookup.keys)
+    np.save(os.path.join(tmp_path, "name_positions.npy"), lookup.positions)
+    # Rank of every stored row, and the stored row of every rank
+    np.save(os.path.join(tmp_path, "ranks.npy"), full_to_data[order])
+    np.save(os.path.join(tmp_path, "positions.npy"), destination[full_positions])
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump({
+            "version": STORE_VERSION,
+            "source": fingerprint,
+            "index_name": index_name,
+            "points": points,
+            "level_starts": starts.tolist(),
+            "bounds": bounds,
+        }, f)
+    logger.info(f"Writing lookups took {time.time() - start_time:.2f}s")
+
+    old_path = out_path.rstrip("/") + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(out_path):
+        os.rename(out_path, old_path)
+    os.rename(tmp_path, out_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class RowGroupCache(ByteLRU):
+    """Thread-safe LRU of decoded row groups bounded by their Arrow size.
+
+    Args:
+        max_bytes (int): Combined size of the row groups to keep
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024**2):
+        super().__init__(max_bytes, lambda table: table.nbytes)
+
+
+class PointStore:
+    """Read side of a store written by ``write_store``.
+
+    Args:
+        path (str): Directory written by ``write_store``
+        cache_bytes (int): Size of the decoded row groups to keep in memory
+    """
+
+    def __init__(self, path: str, cache_bytes: int = 512 * 1024**2):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.version = meta["version"]
+        self.source = meta["source"]
+        self.index_name = meta["index_name"]
+        self.points = meta["points"]
+        self.level_starts = np.array(meta["level_starts"], dtype=np.int64)
+        self.file_loc = os.path.join(path, POINTS_FILE)
+
+        metadata = pq.ParquetFile(self.file_loc).metadata
+        self.schema = metadata.schema.to_arrow_schema()
+        groups = metadata.num_row_groups
+        self.group_starts = np.zeros(groups + 1, dtype=np.int64)
+        np.cumsum([metadata.row_group(i).num_rows for i in range(groups)], out=self.group_starts[1:])
+        # Level of every row group, -1 for the rows without coordinates
+        self.group_levels = np.searchsorted(self.level_starts[:-1], self.group_starts[:-1], side="right") - 1
+        self.group_levels[self.group_starts[:-1] >= self.points] = -1
+        # Per column, the minimum and maximum of every row group (NaN if unknown)
+        self.statistics = {}
+        for column in _STATISTICS:
+            i = self.schema.get_field_index(column)
+            if i < 0:
+                continue
+            bounds = np.full((2, groups), np.nan)
+            for group in range(groups):
+                statistics = metadata.row_group(group).column(i).statistics
+                if statistics is not None and statistics.has_min_max:
+                    bounds[:, group] = statistics.min, statistics.max
+            self.statistics[column] = bounds
+
+        self.positions = np.load(os.path.join(path, "positions.npy"), mmap_mode="r")
+        self.ranks = np.load(os.path.join(path, "ranks.npy"), mmap_mode="r")
+        self.names = RowLookup(
+            np.load(os.path.join(path, "name_keys.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "name_positions.npy"), mmap_mode="r"),
+        )
+        self.cache = RowGroupCache(cache_bytes)
+        # Every thread reads through its own file handle
+        self._files = threading.local()
+
+    def is_fresh(self, data_path: str) -> bool:
+        return self.version == STORE_VERSION and self.source == source_fingerprint(data_path)
+
+    def __len__(self):
+        return self.points
+
+    def arrays(self) -> dict:
+        return {
+            "positions": self.positions,
+            "ranks": self.ranks,
+            "name_keys": self.names.keys,
+            "name_positions": self.names.positions,
+        }
+
+    def row_group(self, group: int) -> pa.Table:
+        """A decoded row group, from the cache if possible"""
+        table = self.cache.get(group)
+        if table is None:
+            file = getattr(self._files, "file", None)
+            if file is None:
+                file = self._files.file = pq.ParquetFile(self.file_loc)
+            table = self.cache.put(group, file.read_row_group(group))
+        return table
+
+    def _overlaps(self, column: str, lo: float, hi: float) -> np.ndarray:
+        """Row groups that may hold values in [lo, hi]; groups without
+        statistics are kept"""
+        if column not in self.statistics:
+            return np.ones(len(self.group_levels), dtype=bool)
+        mins, maxs = self.statistics[column]
+        return ~((maxs < lo) | (mins > hi))
+
+    def candidate_groups(self, x0: float, x1: float, y0: float, y1: float, lengthRange: list = None, pLDDT: list = None) -> np.ndarray:
+        """Row groups of points whose statistics overlap the viewport and the
+        range filters, in level order"""
+        keep = (self.group_levels >= 0) & self._overlaps("x", x0, x1) & self._overlaps("y", y0, y1)
+        if lengthRange:
+            keep &= self._overlaps("length", *lengthRange)
+        if pLDDT:
+            # -1 marks the rows pLDDT filters let through
+            keep &= self._overlaps("afdb_pLDDT", *pLDDT) | self._overlaps("afdb_pLDDT", -1, -1)
+        return np.flatnonzero(keep)
+
+    @staticmethod
+    def expression(
+        x0: float,
+        x1: float,
+        y0: float,
+        y1: float,
+        types: list = None,
+        lengthRange: list = None,
+        pLDDT: list = None,
+        supercog: list = None,
+        taxonomy: list = None,
+    ) -> ds.Expression:
+        """The viewport and filters (as ``filter_rows`` takes them) as an Arrow
+        expression"""
+        expression = (ds.field("x") >= x0) & (ds.field("x") <= x1) & (ds.field("y") >= y0) & (ds.field("y") <= y1)
+        if types:
+            expression &= ds.field("origin").isin(types)
+        if lengthRange:
+            expression &= (ds.field("length") >= lengthRange[0]) & (ds.field("length") <= lengthRange[1])
+        if pLDDT:
+            plddt = ds.field("afdb_pLDDT")
+            expression &= ((plddt >= pLDDT[0]) & (plddt <= pLDDT[1])) | (plddt == -1)
+        if supercog:
+            expression &= ds.field("superCOG_v10").isin(supercog)
+        if taxonomy:
+            expression &= ds.field("taxonomy").isin(taxonomy)
+        return expression
+
+    def query(self, x0: float, x1: float, y0: float, y1: float, limit: int, goterm: np.ndarray = None, **filters) -> pd.DataFrame:
+        """The first ``limit`` points (in DATA order) inside a viewport that
+        pass the filters.
+
+        Args:
+            x0, x1, y0, y1 (float): Inclusive viewport bounds
+            limit (int): Maximum number of points
+            goterm (np.ndarray): Packed mask over DATA rows the points must be in
+            **filters: ``types``, ``lengthRange``, ``pLDDT``, ``supercog`` and
+                ``taxonomy`` as ``filter_rows`` takes them
+
+        Returns:
+            pd.DataFrame: Points in the shape of DATA rows, in DATA order
+        """
+        groups = self.candidate_groups(x0, x1, y0, y1, filters.get("lengthRange"), filters.get("pLDDT"))
+        expression = self.expression(x0, x1, y0, y1, **filters)
+        parts, found, level = [], 0, None
+        for group in groups:
+            if self.group_levels[group] != level:
+                # Every later level ranks after the points found so far
+                if found >= limit:
+                    break
+                level = self.group_levels[group]
+            part = self._matches(group, expression, goterm)
+            parts.append(part)
+            found += len(part)
+
+        table = pa.concat_tables(parts) if parts else self.schema.empty_table()
+        table = table.sort_by("rank").slice(0, limit)
+        return self._frame(table)
+
+    def scan(self, x0: float, x1: float, y0: float, y1: float, chunk_rows: int, goterm: np.ndarray = None, **filters):
+        """Every point inside a viewport that passes the filters, in chunks.
+
+        Takes the arguments of ``query``, but reads all overlapping row groups
+        and yields the points in store order rather than DATA order.
+
+        Yields:
+            pd.DataFrame: Chunks of about ``chunk_rows`` points in the shape of
+            DATA rows; at least one, possibly empty
+        """
+        groups = self.candidate_groups(x0, x1, y0, y1, filters.get("lengthRange"), filters.get("pLDDT"))
+        expression = self.expression(x0, x1, y0, y1, **filters)
+        parts, found, empty = [], 0, True
+        for group in groups:
+            part = self._matches(group, expression, goterm)
+            parts.append(part)
+            found += len(part)
+            if found >= chunk_rows:
+                yield self._frame(pa.concat_tables(parts))
+                parts, found, empty = [], 0, False
+        if found or empty:
+            yield self._frame(pa.concat_tables(parts) if parts else self.schema.empty_table())
+
+    def _matches(self, group: int, expression: ds.Expression, goterm: np.ndarray = None) -> pa.Table:
+        """Rows of a row group matching a filter expression and GO term mask"""
+        part = self.row_group(group).filter(expression)
+        if goterm is not None and len(part):
+            ranks = part.column("rank").to_numpy()
+            part = part.filter(pa.array(((goterm[ranks >> 3] >> (ranks & 7)) & 1).astype(bool)))
+        return part
+
+    def _take(self, positions: np.ndarray) -> pa.Table:
+        """Stored rows by position, in the given order"""
+        groups = np.searchsorted(self.group_starts, positions, side="right") - 1
+        order = np.argsort(groups, kind="stable")
+        parts = []
+        for members in np.split(order, np.flatnonzero(np.diff(groups[order])) + 1):
+            if len(members) == 0:
+                continue
+            group = groups[members[0]]
+            parts.append(self.row_group(group).take(positions[members] - self.group_starts[group]))
+        if not parts:
+            return self.schema.empty_table()
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        return pa.concat_tables(parts).take(inverse)
+
+    def take(self, rows) -> pd.DataFrame:
+        """Points by DATA row position, in the shape of DATA rows"""
+        return self._frame(self._take(self.positions[np.asarray(rows, dtype=np.int64)]))
+
+    def lookup(self, name: str, column: str):
+        """A column of a protein's row (with or without coordinates), None if
+        there is no such protein"""
+        position = self.names.get(name)
+        if position is None:
+            return None
+        group = int(np.searchsorted(self.group_starts, position, side="right")) - 1
+        return self.row_group(group).column(column)[position - int(self.group_starts[group])].as_py()
+
+    def lookup_many(self, names, column: str) -> list:
+        """A column of the rows of several proteins, None for unknown ones"""
+        positions = self.names.positions_of(names)
+        found = np.flatnonzero(positions >= 0)
+        values = [None] * len(positions)
+        for i, value in zip(found, self._take(positions[found]).column(column).to_pylist()):
+            values[i] = value
+        return values
+
+    def ranks_of(self, names) -> np.ndarray:
+        """DATA row positions of proteins, -1 for unknown proteins and those
+        without coordinates"""
+        positions = self.names.positions_of(names)
+        return np.where(positions >= 0, self.ranks[positions], -1)
+
+    def _frame(self, table: pa.Table) -> pd.DataFrame:
+        """Stored rows as DATA has them: indexed by name, with the name columns"""
+        frame = table.drop_columns(["rank"]).to_pandas()
+        frame.index = pd.Index(frame["protein"].to_numpy(), name=self.index_name)
+        frame["clean_name"] = clean_names(frame.index).to_numpy()
+        frame["representative"] = frame["clean_name"]
+        frame["clean_name_lower"] = frame["clean_name"].str.lower()
+        return frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rewrite the point table in spatial order for out-of-core serving")
+    parser.add_argument("--data", default="/mnt/data/data.parquet", help="Point table")
+    parser.add_argument("--out", default="/mnt/data/points_store", help="Output directory")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE, help="Rows per row group")
+    parser.add_argument("--bucket-rows", type=int, default=BUCKET_ROWS, help="Rows per temporary bucket of the sort")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    write_store(args.data, args.out, args.row_group_size, args.bucket_rows)
+    logger.info(f"Wrote point store v{STORE_VERSION} to {args.out} in {time.time() - start_time:.2f}s")
@@ -0,0 +1,51 @@
+"""
+Cache of encoded query responses.
+
+Responses are stored as the exact bytes sent to clients, plain and gzipped,
+under a key built from normalized request parameters, so a repeated query costs
+a dictionary lookup instead of a query, a serialization and a compression. Each
+entry carries an ETag derived from its body for conditional requests. The cache
+holds at most ``max_bytes`` of responses and drops the least recently used.
+"""
+
+import gzip
+import hashlib
+import math
+
+from byte_lru import ByteLRU
+
+
+class CachedResponse:
+    """Encoded response body with its gzipped form and ETag"""
+
+    __slots__ = ("body", "gzipped", "media_type", "etag")
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=6)
+        self.media_type = media_type
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+    def __len__(self):
+        return len(self.body) + len(self.gzipped)
+
+
+class ResponseCache(ByteLRU):
+    """Thread-safe LRU of ``CachedResponse`` bounded by total size.
+
+    Args:
+        max_bytes (int): Combined size of plain and gzipped bodies to keep
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024**2):
+        super().__init__(max_bytes, len)
+
+
+def quantize_range(lo: float, hi: float, steps: int = 256):
+    """Widen [lo, hi] outwards to multiples of a power-of-two fraction of its
+    span, so nearly identical viewports share one cache key"""
+    span = hi - lo
+    if not span > 0 or not math.isfinite(span):
+        return lo, hi
+    quantum = 2.0 ** math.floor(math.log2(span / steps))
+    return math.floor(lo / quantum) * quantum, math.ceil(hi / quantum) * quantum
@@ -0,0 +1,65 @@
+"""
+Compact name to row lookups.
+
+Maps of millions of names kept as Python dicts cost far more than the names
+themselves; a ``RowLookup`` keeps them as one sorted byte-string array (which
+can be memory-mapped from a snapshot) and answers lookups by binary search.
+"""
+
+import numpy as np
+
+
+class RowLookup:
+    """Read-only map from names to row positions, stored as sorted UTF-8 keys
+    and aligned positions rather than a dict of Python strings.
+
+    Args:
+        keys (np.ndarray): Sorted unique byte strings
+        positions (np.ndarray): Row position of every key
+    """
+
+    def __init__(self, keys: np.ndarray, positions: np.ndarray):
+        self.keys = keys
+        self.positions = positions
+
+    @classmethod
+    def build(cls, names, positions) -> "RowLookup":
+        """Lookup from unsorted names; of repeated names the last one wins, as
+        when building a dict"""
+        keys = np.array([name.encode("utf-8") for name in names], dtype=bytes) if len(names) else np.empty(0, dtype="S1")
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True) if len(keys) else np.empty(0, dtype=bool)
+        return cls(keys[last], np.asarray(positions, dtype=np.int64)[order][last])
+
+    def _find(self, name: str) -> int:
+        key = name.encode("utf-8")
+        i = int(np.searchsorted(self.keys, key))
+        return i if i < len(self.keys) and self.keys[i] == key else -1
+
+    def __contains__(self, name: str) -> bool:
+        return self._find(name) >= 0
+
+    def __getitem__(self, name: str) -> int:
+        i = self._find(name)
+        if i < 0:
+            raise KeyError(name)
+        return int(self.positions[i])
+
+    def get(self, name: str, default=None):
+        i = self._find(name)
+        return default if i < 0 else int(self.positions[i])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions_of(self, names) -> np.ndarray:
+        """Row positions of many names at once, -1 for unknown names"""
+        keys = np.array([name.encode("utf-8") for name in names], dtype=bytes) if len(names) else np.empty(0, dtype="S1")
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[i] == keys, self.positions[i], -1)
+
+    def arrays(self) -> dict:
+        return {"keys": self.keys, "positions": self.positions}
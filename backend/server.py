@@ -1,107 +1,331 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, APIRouter
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, APIRouter, Header, Query, Body
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 import uvicorn
 import pandas as pd
 from loguru import logger
-from cif_to_pdb import cif_to_pdb
+from executor import BoundedExecutor, ExecutorBusy
+from export import EXPORT_MEDIA_TYPES, encode_export
+from goterm_index import GOTermIndex, TERMS_FILE
+from goterm_names import GOTermNames
+from goterm_store import GOPredictionStore, VOCABULARY_FILE, read_predictions
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, Registry, StageTimer
+from memory import log_memory_report
+from pdb_cache import ConversionCache
+from points_store import META_FILE as POINTS_STORE_META, PointStore
+from snapshot import SnapshotOutOfDate, cluster_mappings, expand_rows, load_tables, snapshot_id
+from response_cache import CachedResponse, ResponseCache, quantize_range
+from wire_format import ARROW_MEDIA_TYPE, encode_arrow, parse_columns, project, wants_arrow
 import numpy as np
 import json
 import asyncio
+import hashlib
 import traceback
 import os
+import tempfile
 import time
 import concurrent.futures
 from functools import lru_cache
-import re
-import tqdm
+from typing import Literal
 
 
-start_time = time.time()
-DATA_FULL = pd.read_parquet(
-    "/mnt/data/data.parquet"
-).drop(columns=["afdb_hq"])
-DATA_FULL["protein"] = list(DATA_FULL.index)
-DATA = DATA_FULL.dropna(subset=["x", "y"])
-DATA = DATA.rename(columns={"origin": "taxonomy_name", "database": "origin"})
+# Worker processes; the uvicorn CLI reads this variable too
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+
+def serve(target):
+    uvicorn.run(
+        target,
+        workers=WEB_CONCURRENCY,
+        host="0.0.0.0",
+        port=8000,
+        ws_max_size=1024 * 1024 * 10,  # 10MB max message size
+        ws_ping_interval=None,  # Disable ping/pong
+        ws_ping_timeout=None,
+    )
+
+
+if __name__ == "__main__" and WEB_CONCURRENCY > 1:
+    # Every worker imports this module on its own and maps the shared
+    # snapshot files; the process starting them loads nothing
+    serve("server:app")
+    raise SystemExit
 
-logger.info(f"Taxonomy: {DATA['taxonomy'].value_counts()}")
 
-logger.info(f"Loading main data took {time.time() - start_time:.2f}s ({len(DATA)} points)")
+# Everything the server reads lives under one directory (e.g. a synthetic
+# dataset from synthetic_data.py when benchmarking)
+DATA_DIR = os.environ.get("DATA_DIR", "/mnt/data")
+DATA_LOC = os.path.join(DATA_DIR, "data.parquet")
+CLUSTERS_LOC = os.path.join(DATA_DIR, "all_clusters_nf.parquet")
+SNAPSHOT_LOC = os.path.join(DATA_DIR, "snapshot")
+# One compact row table (categoricals, float32 coordinates, no derived name
+# columns) instead of DATA_FULL and DATA; see snapshot.py
+COMPACT_TABLES = os.environ.get("COMPACT_TABLES", "0") == "1"
+# Serve the rows from data.parquet rewritten in spatial order (see
+# points_store.py) instead of keeping the row tables in memory, for data
+# larger than RAM; the query indexes still come from the snapshot
+OUT_OF_CORE = os.environ.get("OUT_OF_CORE", "0") == "1"
+POINTS_STORE_LOC = os.path.join(DATA_DIR, "points_store")
 
-logger.info(f"Columns: {DATA.columns}")
-logger.info(f"Data: {DATA.iloc[0]}")
+# Out of core nothing falls back to building tables from the raw files, which
+# would hold the whole table in memory; stale files stop the server instead
+POINTS_STORE = None
+if OUT_OF_CORE:
+    if os.path.exists(os.path.join(POINTS_STORE_LOC, POINTS_STORE_META)):
+        POINTS_STORE = PointStore(POINTS_STORE_LOC, cache_bytes=int(os.environ.get("POINTS_CACHE_BYTES", 512 * 1024**2)))
+    if POINTS_STORE is None or not POINTS_STORE.is_fresh(DATA_LOC):
+        logger.error(f"Point store at {POINTS_STORE_LOC} is missing or older than {DATA_LOC}; rebuild it offline with `python points_store.py` to serve out of core")
+        raise SystemExit(1)
+
+try:
+    TABLES = load_tables(DATA_LOC, CLUSTERS_LOC, SNAPSHOT_LOC, compact=COMPACT_TABLES, rows=not OUT_OF_CORE)
+except SnapshotOutOfDate as e:
+    logger.error(f"{e}; rebuild it offline with `python snapshot.py` to serve out of core")
+    raise SystemExit(1)
+# Both None when the rows come from POINTS_STORE
+DATA_FULL = TABLES["data_full"]
+# With compact tables, the leading rows of DATA_FULL
+DATA = TABLES["data"]
+# Position in data.parquet of every DATA row, and the inverse
+FULL_POSITIONS = TABLES["full_positions"]
+FULL_TO_DATA = TABLES["full_to_data"]
+if DATA is not None:
+    logger.info(f"Data: {DATA.iloc[0]}")
+
+SPATIAL_INDEX = TABLES["spatial_index"]
+TILE_PYRAMID = TABLES["tile_pyramid"]
+FILTER_INDEX = TABLES["filter_index"]
+DENSITY_GRID = TABLES["density_grid"]
+# Positions in NAME_INDEX are member ids of CLUSTER_INDEX
+NAME_INDEX = TABLES["name_index"]
+
+PDB_LOC = os.path.join(DATA_DIR, "mip-follow-up_clusters/struct/")
+PDB_CACHE = ConversionCache(
+    os.environ.get("PDB_CACHE_LOC", os.path.join(DATA_DIR, "pdb_cache")),
+    max_bytes=int(os.environ.get("PDB_CACHE_MAX_BYTES", 5 * 1024**3)),
+)
+GOTERM_LOC = os.path.join(DATA_DIR, "deepfri_predictions_HQ")
+PROTEIN_GOTERM_LOC = os.path.join(DATA_DIR, "deepfri_predictions_protein_HQ")
+GOTERM_INDEX_LOC = os.path.join(DATA_DIR, "goterm_index")
+GOTERM_STORE_LOC = os.path.join(DATA_DIR, "goterm_store")
+GOTERM_BATCH_LIMIT = 1000
+# Members listed with every name search hit; the rest are paged through
+# /cluster/{cluster}/members
+NAME_SEARCH_MEMBERS = 100
+CLUSTER_MEMBERS_LIMIT = 1000
 
-DATA = DATA.sample(frac=1, random_state=42)
-DATA.loc[
-    (DATA["origin"] != "AFDB light clusters") & (DATA["origin"] != "AFDB dark clusters"),
-    "afdb_pLDDT",
-] = -1
-DATA["clean_name"] = DATA["protein"].str.replace("AF-", "").str.replace("-model_v4", "").str.replace("-F1", "")
-DATA["representative"] = DATA["clean_name"]
+GOTERM_INDEX = None
+if os.path.exists(os.path.join(GOTERM_INDEX_LOC, TERMS_FILE)):
+    GOTERM_INDEX = GOTermIndex(GOTERM_INDEX_LOC)
+    if not GOTERM_INDEX.is_fresh(DATA_LOC, GOTERM_LOC):
+        logger.warning(f"GO term index at {GOTERM_INDEX_LOC} is older than {DATA_LOC} or {GOTERM_LOC}, reading GO term CSV files instead")
+        GOTERM_INDEX = None
+if GOTERM_INDEX is None:
+    logger.warning("No compiled GO term index, build one with `python goterm_index.py`")
 
-PDB_LOC = "/mnt/data/mip-follow-up_clusters/struct/"
-GOTERM_LOC = "/mnt/data/deepfri_predictions_HQ"
-PROTEIN_GOTERM_LOC = "/mnt/data/deepfri_predictions_protein_HQ"
+GOTERM_STORE = None
+if os.path.exists(os.path.join(GOTERM_STORE_LOC, VOCABULARY_FILE)):
+    GOTERM_STORE = GOPredictionStore(GOTERM_STORE_LOC)
+    if not GOTERM_STORE.is_fresh(PROTEIN_GOTERM_LOC):
+        logger.warning(f"GO term store at {GOTERM_STORE_LOC} is older than {PROTEIN_GOTERM_LOC}, reading protein CSV files instead")
+        GOTERM_STORE = None
+if GOTERM_STORE is None:
+    logger.warning("No compiled protein GO term store, build one with `python goterm_store.py`")
 
 start_time = time.time()
 GOTERMS_NAME = pd.read_csv(
-    "/mnt/data/gonames.csv", index_col=0
+    os.path.join(DATA_DIR, "gonames.csv"), index_col=0
 ).rename(columns={"index": "GOterm"})
+# First name wins, as the old row-by-row lookup did
+GOTERM_NAME_MAP = dict(GOTERMS_NAME.drop_duplicates("GOterm")[["GOterm", "GOname"]].itertuples(index=False))
 logger.info(f"Loading GO terms names took {time.time() - start_time:.2f}s")
 
 start_time = time.time()
-REPRESENTATIVE_MAPPING = pd.read_parquet(
-    "/mnt/data/all_clusters_nf.parquet"
-)
-logger.info(f"Loading representative mapping took {time.time() - start_time:.2f}s")
-REPRESENTATIVE_MAPPING["Protein"] = REPRESENTATIVE_MAPPING["Protein"].map(lambda x: json.loads(x))
+if GOTERM_INDEX is not None:
+    GOTERM_ONTOLOGIES = {ontology: terms.keys() for ontology, terms in GOTERM_INDEX.terms.items()}
+else:
+    GOTERM_ONTOLOGIES = {
+        ontology: {name[:-len(".csv")] for name in os.listdir(os.path.join(GOTERM_LOC, ontology))}
+        for ontology in os.listdir(GOTERM_LOC)
+        if os.path.isdir(os.path.join(GOTERM_LOC, ontology))
+    }
+GOTERM_NAMES = GOTermNames(GOTERMS_NAME, GOTERM_ONTOLOGIES)
+logger.info(f"Building GO term name index took {time.time() - start_time:.2f}s")
 
 start_time = time.time()
-REVERSE_REPRESENTATIVE_MAPPING = REPRESENTATIVE_MAPPING.explode("Protein")
-REVERSE_REPRESENTATIVE_MAPPING = pd.DataFrame.from_dict([
-    {"Protein": protein, "Cluster": cluster}
-    for protein, cluster in zip(REVERSE_REPRESENTATIVE_MAPPING["Protein"], REVERSE_REPRESENTATIVE_MAPPING.index)
-]).set_index("Protein")
-logger.info(f"Creating reverse mapping took {time.time() - start_time:.2f}s")
-
-# Replace the slow initialization with a vectorized approach
-start_time = time.time()
-# Create dictionary mapping lowercase protein names to original indices
-PROTEIN_INDEX_MAP = {name.lower(): name for name in REVERSE_REPRESENTATIVE_MAPPING.index}
-
-# Create a precomputed lowercase version once
-DATA['clean_name_lower'] = DATA['clean_name'].str.lower()
-
-# Create mapping using a single vectorized operation
-# Get all unique clusters in lowercase
-unique_clusters = set(cluster.lower() for cluster in REPRESENTATIVE_MAPPING.index)
-
-# Create lookup dict using vectorized operations
-CLUSTER_TO_DATA = {}
-# Get all matching rows in one operation
-matching_mask = DATA['clean_name_lower'].isin(unique_clusters)
-matching_data = DATA[matching_mask]
-# Create the mapping dict directly
-from tqdm import tqdm
-CLUSTER_TO_DATA = {row['clean_name_lower']: row for _, row in tqdm(matching_data.iterrows(), desc="Building cluster to data mapping", total=len(matching_data))}
-
-logger.info(f"Building search indices took {time.time() - start_time:.2f}s")
-
-@lru_cache(maxsize=1000)
-def search_proteins(search_term):
-    """Cache protein name searches for better performance"""
-    search_term_lower = search_term.lower()
-    pattern = re.compile(search_term_lower)
-    # Fast regex-based search through keys
-    matching_keys = [key for key in PROTEIN_INDEX_MAP.keys() 
-                     if pattern.search(key)]
-    return matching_keys[:100]  # Limit to 100 matching proteins
-
-GOTERMS_CACHE = {}
+CLUSTER_INDEX, CLUSTER_TO_DATA, PROTEIN_ROWS = cluster_mappings(TABLES)
+logger.info(f"Creating cluster mappings took {time.time() - start_time:.2f}s")
+
+if POINTS_STORE is not None:
+    row_tables = {"POINTS_STORE": POINTS_STORE}
+elif COMPACT_TABLES:
+    # DATA is a slice of DATA_FULL, counted there
+    row_tables = {"DATA_FULL": DATA_FULL}
+else:
+    row_tables = {"DATA_FULL": DATA_FULL, "DATA": DATA}
+log_memory_report({
+    **row_tables,
+    "FULL_POSITIONS": FULL_POSITIONS,
+    "FULL_TO_DATA": FULL_TO_DATA,
+    "SPATIAL_INDEX": SPATIAL_INDEX,
+    "TILE_PYRAMID": TILE_PYRAMID,
+    "FILTER_INDEX": FILTER_INDEX,
+    "DENSITY_GRID": DENSITY_GRID,
+    "NAME_INDEX": NAME_INDEX,
+    "CLUSTER_INDEX": CLUSTER_INDEX,
+    "CLUSTER_TO_DATA": CLUSTER_TO_DATA,
+    "PROTEIN_ROWS": PROTEIN_ROWS,
+    "GOTERM_NAME_MAP": GOTERM_NAME_MAP,
+})
+
+
+def as_points(subset: pd.DataFrame) -> pd.DataFrame:
+    """DATA rows in the shape the endpoints return them; compact tables get
+    their plain strings and name columns back"""
+    return expand_rows(subset) if COMPACT_TABLES else subset
+
+
+def point_rows(rows) -> pd.DataFrame:
+    """DATA rows by position in the shape the endpoints return them, read
+    from the point store when serving out of core"""
+    if POINTS_STORE is not None:
+        return POINTS_STORE.take(rows)
+    return as_points(DATA.iloc[rows])
+
+
+def protein_value(protein: str, column: str):
+    """A column of a protein's row (with or without coordinates), None if
+    there is no such protein"""
+    if POINTS_STORE is not None:
+        return POINTS_STORE.lookup(protein, column)
+    row = PROTEIN_ROWS.get(protein)
+    return None if row is None else DATA_FULL[column].iloc[row]
+
+
+def member_values(member_ids: range, column: str) -> list:
+    """A column of the rows of cluster members, None for members without one"""
+    if POINTS_STORE is not None:
+        return POINTS_STORE.lookup_many(CLUSTER_INDEX.members[member_ids.start:member_ids.stop], column)
+    rows = CLUSTER_INDEX.member_rows[member_ids.start:member_ids.stop]
+    found = np.flatnonzero(rows >= 0)
+    values = [None] * len(rows)
+    for i, value in zip(found, DATA_FULL[column].iloc[rows[found]].tolist()):
+        values[i] = value
+    return values
+
+
+def cluster_member_records(cluster: int, offset: int = 0, limit: int = None) -> list:
+    """Names and urls of a page of the members of a cluster"""
+    member_ids = CLUSTER_INDEX.member_ids(cluster, offset, limit)
+    names = CLUSTER_INDEX.members[member_ids.start:member_ids.stop].tolist()
+    return [{"name": name, "url": url} for name, url in zip(names, member_values(member_ids, "url"))]
+
+@lru_cache(maxsize=32)
+def goterm_mask(ontology: str, goterm: str):
+    """Packed mask of the DATA rows predicted to have a GO term, None if the term has no predictions"""
+    with STAGE("goterm_load") as stage:
+        stage.note = f"{ontology}/{goterm}"
+        if GOTERM_INDEX is not None:
+            positions = GOTERM_INDEX.lookup(ontology, goterm)
+            if positions is None:
+                return None
+            rows = FULL_TO_DATA[positions]
+        else:
+            goterm_loc = f"{GOTERM_LOC}/{ontology}/{goterm}.csv"
+            if not os.path.exists(goterm_loc):
+                return None
+            proteins = pd.read_csv(goterm_loc, usecols=["Protein"])["Protein"]
+            rows = POINTS_STORE.ranks_of(proteins) if POINTS_STORE is not None else DATA.index.get_indexer(proteins)
+        return FILTER_INDEX.rows_mask(rows[rows >= 0])
+
+# Blocking work runs off the event loop so one slow query cannot stall every
+# other request and WebSocket on this worker
+QUERY_EXECUTOR = BoundedExecutor(
+    "query",
+    workers=int(os.environ.get("QUERY_WORKERS", 4)),
+    max_queue=int(os.environ.get("QUERY_QUEUE", 64)),
+    timeout=float(os.environ.get("QUERY_TIMEOUT", 30)),
+)
+CONVERSION_EXECUTOR = BoundedExecutor(
+    "conversion",
+    workers=int(os.environ.get("CONVERSION_WORKERS", 2)),
+    max_queue=int(os.environ.get("CONVERSION_QUEUE", 32)),
+    timeout=float(os.environ.get("CONVERSION_TIMEOUT", 60)),
+    processes=os.environ.get("CONVERSION_POOL", "thread") == "process",
+)
+
+# Encoded /points, /points_init and WebSocket init responses; the data does not
+# change while the server runs, so entries never go stale
+RESPONSE_CACHE = ResponseCache(max_bytes=int(os.environ.get("RESPONSE_CACHE_BYTES", 256 * 1024**2)))
+CACHE_MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", 3600))
+# A tile only changes with the snapshot, so clients keep tiles for longer and
+# revalidate them against an ETag derived from the snapshot's sources (rows
+# out of core are those of the non-compact tables)
+TILE_MAX_AGE = int(os.environ.get("TILE_MAX_AGE", 86400))
+TILES_VERSION = snapshot_id(DATA_LOC, CLUSTERS_LOC, COMPACT_TABLES and not OUT_OF_CORE)
+
+# Served at /api/metrics; STAGE_LOG_SAMPLE is the fraction of timed stages
+# that are also logged. With several workers (WEB_CONCURRENCY, which the
+# uvicorn CLI reads too) each one writes its metrics to METRICS_DIR and a
+# scrape sums those of the workers of its launch
+METRICS_DIR = os.environ.get("METRICS_DIR") or (
+    os.path.join(tempfile.gettempdir(), "pointvis-metrics") if WEB_CONCURRENCY > 1 else None
+)
+METRICS = Registry(METRICS_DIR)
+REQUEST_SECONDS = METRICS.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+STAGE_SECONDS = METRICS.histogram("stage_duration_seconds", "Time spent in each stage of request handling", ["stage"])
+STAGE = StageTimer(STAGE_SECONDS, log_sample=float(os.environ.get("STAGE_LOG_SAMPLE", 0)))
+WEBSOCKET_MESSAGES = METRICS.counter("websocket_messages_total", "WebSocket messages received by type", ["type"])
+WEBSOCKET_QUERIES = METRICS.counter("websocket_queries_total", "WebSocket viewport queries by outcome", ["outcome"])
+PDB_CACHE_LOOKUPS = METRICS.counter("pdb_cache_lookups_total", "Structure requests answered from the conversion cache", ["result"])
+METRICS.callback(
+    "response_cache_lookups_total", "Response cache lookups", "counter", ["result"],
+    lambda: {("hit",): RESPONSE_CACHE.hits, ("miss",): RESPONSE_CACHE.misses},
+)
+METRICS.callback(
+    "response_cache_bytes", "Size of the cached responses", "gauge", [],
+    lambda: {(): RESPONSE_CACHE.size},
+)
+if POINTS_STORE is not None:
+    METRICS.callback(
+        "points_store_cache_lookups_total", "Point store row group cache lookups", "counter", ["result"],
+        lambda: {("hit",): POINTS_STORE.cache.hits, ("miss",): POINTS_STORE.cache.misses},
+    )
+    METRICS.callback(
+        "points_store_cache_bytes", "Size of the cached point store row groups", "gauge", [],
+        lambda: {(): POINTS_STORE.cache.size},
+    )
+METRICS.callback(
+    "executor_tasks", "Calls running in or waiting for an executor", "gauge", ["executor", "state"],
+    lambda: {
+        (executor.name, state): executor.stats()[state]
+        for executor in (QUERY_EXECUTOR, CONVERSION_EXECUTOR)
+        for state in ("running", "queued")
+    },
+)
+METRICS.callback(
+    "executor_calls_total", "Finished executor calls by outcome", "counter", ["executor", "outcome"],
+    lambda: {
+        (executor.name, outcome): executor.stats()[outcome]
+        for executor in (QUERY_EXECUTOR, CONVERSION_EXECUTOR)
+        for outcome in ("completed", "rejected", "timed_out")
+    },
+)
 
 app = FastAPI()
+
+
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"error": str(exc)})
+
+
+@app.exception_handler(asyncio.TimeoutError)
+async def executor_timeout_handler(request, exc):
+    return JSONResponse(status_code=504, content={"error": "Request timed out"})
 origins = ["*"]
 
 app.add_middleware(
@@ -110,109 +334,203 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Search-Truncated"],
 )
 
 app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Added last so it is outermost and times the whole request
+app.add_middleware(MetricsMiddleware, histogram=REQUEST_SECONDS)
 
 api_router = APIRouter(prefix="/api")
 
+@lru_cache(maxsize=1)
 def get_initial_points():
-    start_time = time.time()
-    subset_orig = DATA.sample(10000, random_state=42)
-    logger.info(f"Initial points sampling took {time.time() - start_time:.2f}s")
-    return subset_orig.to_dict(orient="records")
+    with STAGE("initial_sample"):
+        if POINTS_STORE is not None:
+            # DATA is shuffled, so its leading rows are a random sample too,
+            # and they sit in the first row groups of the store
+            return point_rows(np.arange(min(10000, len(POINTS_STORE))))
+        return as_points(DATA.sample(10000, random_state=42))
 
 
-def get_points(
-    x0: float = -15,
-    x1: float = 15,
-    y0: float = -25,
-    y1: float = 15,
+def encode_points(subset: pd.DataFrame, accept: str = "", columns: str = ""):
+    """Return points as JSON records, or as an Arrow stream if the client accepts it"""
+    subset = project(subset, columns)
+    if wants_arrow(accept):
+        return Response(encode_arrow(subset), media_type=ARROW_MEDIA_TYPE)
+    return subset.to_dict(orient="records")
+
+
+def encode_cached(subset: pd.DataFrame, arrow: bool, columns: str = "", metadata: dict = None, envelope: dict = None) -> CachedResponse:
+    """Encode points once for the response cache: an Arrow stream, or JSON
+    records (wrapped in ``envelope`` under "points" if given)"""
+    with STAGE("serialize") as stage:
+        stage.note = f"{len(subset)} points"
+        subset = project(subset, columns)
+        if arrow:
+            return CachedResponse(encode_arrow(subset, metadata), ARROW_MEDIA_TYPE)
+        records = subset.to_dict(orient="records")
+        content = records if envelope is None else {**envelope, "points": records}
+        # Same encoding as FastAPI's JSONResponse
+        body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        return CachedResponse(body, "application/json")
+
+
+def cached_response(entry: CachedResponse, accept_encoding: str = "", if_none_match: str = "") -> Response:
+    """Serve a cached entry, gzipped if the client takes it, or as 304 if the
+    client already has it"""
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"public, max-age={CACHE_MAX_AGE}",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in accept_encoding:
+        return Response(entry.gzipped, media_type=entry.media_type, headers={**headers, "Content-Encoding": "gzip"})
+    return Response(entry.body, media_type=entry.media_type, headers=headers)
+
+
+def normalize_list(value: str) -> str:
+    """Comma separated filter values in a canonical order"""
+    return ",".join(sorted(set(value.split(",")))) if value else ""
+
+
+POINTS_LIMIT = 1000
+
+
+def filter_rows(
+    rows: np.ndarray,
+    types: list = None,
+    lengthRange: list = None,
+    pLDDT: list = None,
+    supercog: list = None,
+    taxonomy: list = None,
+    goterm: np.ndarray = None,
+):
+    """Keep the rows (positions into DATA) that pass every given filter"""
+    mask = FILTER_INDEX.mask(
+        origin=types,
+        length=lengthRange,
+        afdb_pLDDT=pLDDT,
+        superCOG_v10=supercog,
+        taxonomy=taxonomy,
+    )
+    rows = FILTER_INDEX.select(rows, mask)
+    return FILTER_INDEX.select(rows, goterm)
+
+
+def parse_filters(
     types: str = "",
     lengthRange: str = "",
     pLDDT: str = "",
     supercog: str = "",
     goterm: str = "",
-    ontology: str="",
-    taxonomy: str=""
+    ontology: str = "",
+    taxonomy: str = "",
 ):
-    total_start_time = time.time()
-    conditions = []
+    """Turn the comma separated filter parameters into ``filter_rows`` keyword
+    arguments; None if the GO term has no predictions, i.e. nothing passes"""
+    filters = {}
     if len(types) > 0:
-        types = types.split(",")
-        conditions.append(DATA["origin"].isin(types))
+        filters["types"] = types.split(",")
     
     if lengthRange:
         lengthRange = lengthRange.split(",")
-        lengthRange = [int(lengthRange[0]), int(lengthRange[1])]
-        conditions.append(
-            (DATA.length >= lengthRange[0]) & (DATA.length <= lengthRange[1])
-        )
+        filters["lengthRange"] = [int(lengthRange[0]), int(lengthRange[1])]
 
     if pLDDT:
         pLDDT = pLDDT.split(",")
-        pLDDT = [int(pLDDT[0]), int(pLDDT[1])]
-        minus_one = DATA["afdb_pLDDT"] == -1
-        larger = DATA["afdb_pLDDT"] <= pLDDT[1]
-        smaller = DATA["afdb_pLDDT"] >= pLDDT[0]
-
-        conditions.append((minus_one | (larger & smaller)))
+        filters["pLDDT"] = [int(pLDDT[0]), int(pLDDT[1])]
 
     if supercog:
-        supercog = supercog.split(",")
-        conditions.append(DATA["superCOG_v10"].isin(supercog))
+        filters["supercog"] = supercog.split(",")
         
     if taxonomy:
-        taxonomy_split = taxonomy.split(",")
-        conditions.append(DATA["taxonomy"].isin(taxonomy_split))
+        filters["taxonomy"] = taxonomy.split(",")
         
-    logger.info(f"Goterm: {goterm}, ontology: {ontology}, taxonomy: {taxonomy}")
     if goterm:
-        start_time = time.time()
-        
         if not ontology:
             ontology = "BP"
         
-        goterm_loc = f"{GOTERM_LOC}/{ontology}/{goterm}.csv"
-        if not os.path.exists(goterm_loc):
-            logger.info(f"File check took {time.time() - start_time:.2f}s")
-            return []
-        
-        cache_time = time.time()
-        if goterm not in GOTERMS_CACHE:
-            goterm_df = pd.read_csv(goterm_loc)
-            GOTERMS_CACHE[goterm] = set(goterm_df["Protein"].tolist())
-            logger.info(f"Loading GO term data took {time.time() - cache_time:.2f}s")
-            
-        intersect_time = time.time()
-        names = set(DATA["protein"])
-        names = names.intersection(GOTERMS_CACHE[goterm])
-        conditions.append(DATA["protein"].isin(names))
-        logger.info(f"Intersection took {time.time() - intersect_time:.2f}s")
-        logger.info(f"Total GO term processing took {time.time() - start_time:.2f}s")
-        
-    filter_start_time = time.time()
-    mask = ((DATA.x >= x0) & (DATA.x <= x1) & (DATA.y >= y0) & (DATA.y <= y1))
+        filters["goterm"] = goterm_mask(ontology, goterm)
+        if filters["goterm"] is None:
+            return None
+    return filters
 
-    # Add all other conditions to the mask at once
-    if conditions:
-        for cond in conditions:
-            mask &= cond
-        
-    subset = DATA[mask]
-    logger.info(f"Initial spatial filtering took {time.time() - filter_start_time:.2f}s")
-    
-    if len(subset) > 1000:
-        # get only top 1000
-        subset = subset[:1000]
-        
-    logger.info(f"Total get_points processing took {time.time() - total_start_time:.2f}s with {len(subset)} results")
-    return subset.to_dict(orient="records")
+
+def get_points(
+    x0: float = -15,
+    x1: float = 15,
+    y0: float = -25,
+    y1: float = 15,
+    types: str = "",
+    lengthRange: str = "",
+    pLDDT: str = "",
+    supercog: str = "",
+    goterm: str = "",
+    ontology: str="",
+    taxonomy: str=""
+):
+    with STAGE("points_query") as total:
+        filters = parse_filters(types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy)
+        if filters is None:
+            return point_rows(np.empty(0, dtype=np.int64))
+
+        rows = None
+        if not goterm:
+            # Answer from the tile pyramid; step one level finer if the filters
+            # leave too few of the sampled rows, and scan the viewport if that
+            # still is not enough (GO terms are too selective for the samples).
+            # The pyramid and filter index are mapped from the snapshot out of
+            # core too, so both modes sample the same rows
+            with STAGE("tile_lookup") as stage:
+                level = TILE_PYRAMID.level_for(x0, x1, y0, y1)
+                for z in (level, level + 1):
+                    lod = TILE_PYRAMID.query(x0, x1, y0, y1, z)
+                    if lod is None:
+                        break
+                    rows, complete = lod
+                    rows = filter_rows(rows, **filters)
+                    if complete or len(rows) >= POINTS_LIMIT:
+                        stage.note = f"zoom {z}"
+                        break
+                    rows = None
+
+        if rows is None and POINTS_STORE is not None:
+            # The first matches in DATA order, as the scan below returns them,
+            # from the row groups overlapping the viewport, coarse levels first
+            with STAGE("store_query"):
+                subset = POINTS_STORE.query(x0, x1, y0, y1, POINTS_LIMIT, **filters)
+            total.note = f"{len(subset)} results"
+            return subset
+
+        if rows is None:
+            with STAGE("spatial_filter") as stage:
+                rows = SPATIAL_INDEX.query(x0, x1, y0, y1)
+                rows = filter_rows(rows, **filters)
+                stage.note = f"{len(rows)} rows"
+
+        if len(rows) > POINTS_LIMIT:
+            rows = rows[:POINTS_LIMIT]
+        subset = point_rows(rows)
+        total.note = f"{len(subset)} results"
+        return subset
 
 
 @api_router.get("/points_init")
-async def points():
-    return get_initial_points()
+async def points(
+    columns: str = "",
+    accept: str = Header(""),
+    accept_encoding: str = Header(""),
+    if_none_match: str = Header(""),
+):
+    arrow = wants_arrow(accept)
+    key = ("points_init", tuple(parse_columns(columns)), arrow)
+    entry = RESPONSE_CACHE.get(key)
+    if entry is None:
+        entry = RESPONSE_CACHE.put(key, await QUERY_EXECUTOR.run(lambda: encode_cached(get_initial_points(), arrow, columns)))
+    return cached_response(entry, accept_encoding, if_none_match)
 
 
 @api_router.get("/points")
@@ -227,17 +545,261 @@ async def points(
     supercog: str = "",
     goterm: str = "",
     ontology: str = "",
-    taxonomy: str = ""
+    taxonomy: str = "",
+    columns: str = "",
+    accept: str = Header(""),
+    accept_encoding: str = Header(""),
+    if_none_match: str = Header(""),
+):
+    # Nearly identical viewports and reordered filter lists share an entry;
+    # the query runs with the normalized parameters so the entry is exact
+    x0, x1 = quantize_range(x0, x1)
+    y0, y1 = quantize_range(y0, y1)
+    types, supercog, taxonomy = normalize_list(types), normalize_list(supercog), normalize_list(taxonomy)
+    lengthRange, pLDDT = lengthRange.replace(" ", ""), pLDDT.replace(" ", "")
+    if not goterm:
+        ontology = ""
+    elif not ontology:
+        ontology = "BP"
+    arrow = wants_arrow(accept)
+    key = ("points", x0, x1, y0, y1, types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy, tuple(parse_columns(columns)), arrow)
+
+    entry = RESPONSE_CACHE.get(key)
+    if entry is None:
+        entry = RESPONSE_CACHE.put(key, await QUERY_EXECUTOR.run(
+            lambda: encode_cached(
+                get_points(x0, x1, y0, y1, types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy),
+                arrow,
+                columns,
+            )
+        ))
+    return cached_response(entry, accept_encoding, if_none_match)
+
+@api_router.get("/tiles/{z:int}/{tx:int}/{ty:int}")
+async def tile(z: int, tx: int, ty: int, columns: str = "", accept: str = Header(""), if_none_match: str = Header("")):
+    key = f"{TILES_VERSION}/{z}/{tx}/{ty}/{wants_arrow(accept)}/{','.join(parse_columns(columns))}"
+    etag = '"' + hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest() + '"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={TILE_MAX_AGE}",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    def encode():
+        encoded = encode_points(point_rows(TILE_PYRAMID.tile(z, tx, ty)), accept, columns)
+        return encoded if isinstance(encoded, Response) else JSONResponse(encoded)
+
+    # Out of core the rows come from row groups read from disk
+    response = await QUERY_EXECUTOR.run(encode)
+    response.headers.update(headers)
+    return response
+
+
+def get_nearest(
+    x: float,
+    y: float,
+    k: int = 1,
+    radius: float = None,
+    types: str = "",
+    lengthRange: str = "",
+    pLDDT: str = "",
+    supercog: str = "",
+    goterm: str = "",
+    ontology: str = "",
+    taxonomy: str = "",
+):
+    """The k points closest to (x, y) that pass the filters of /points (and
+    are at most ``radius`` away), closest first, with their ``distance``"""
+    with STAGE("nearest_query") as stage:
+        filters = parse_filters(types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy)
+        if filters is None:
+            rows, distances = np.empty(0, dtype=np.int64), np.empty(0)
+        else:
+            keep = (lambda rows: filter_rows(rows, **filters)) if filters else None
+            rows, distances = SPATIAL_INDEX.nearest(x, y, k, radius, keep)
+        stage.note = f"{len(rows)} results"
+    return point_rows(rows).assign(distance=distances)
+
+
+@api_router.get("/nearest")
+async def nearest(
+    x: float,
+    y: float,
+    k: int = Query(1, ge=1, le=POINTS_LIMIT),
+    radius: float = Query(None, ge=0),
+    types: str = "",
+    lengthRange: str = "",
+    pLDDT: str = "",
+    supercog: str = "",
+    goterm: str = "",
+    ontology: str = "",
+    taxonomy: str = "",
+    columns: str = "",
+    accept: str = Header(""),
+):
+    """Exact picking: the points nearest to (x, y) among every point that
+    passes the filters, not just those a client holds"""
+    subset = await QUERY_EXECUTOR.run(
+        get_nearest, x, y, k, radius, types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy
+    )
+    return encode_points(subset, accept, columns)
+
+
+@api_router.get("/within")
+async def within(
+    x: float,
+    y: float,
+    radius: float = Query(..., ge=0),
+    limit: int = Query(POINTS_LIMIT, ge=1, le=POINTS_LIMIT),
+    types: str = "",
+    lengthRange: str = "",
+    pLDDT: str = "",
+    supercog: str = "",
+    goterm: str = "",
+    ontology: str = "",
+    taxonomy: str = "",
+    columns: str = "",
+    accept: str = Header(""),
 ):
-    return get_points(x0, x1, y0, y1, types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy)
+    """The points at most ``radius`` from (x, y) that pass the filters,
+    closest first, up to ``limit``"""
+    subset = await QUERY_EXECUTOR.run(
+        get_nearest, x, y, limit, radius, types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy
+    )
+    return encode_points(subset, accept, columns)
+
+# Rows per chunk of an export, about what an export holds in memory
+EXPORT_CHUNK_ROWS = 10000
+
+
+def export_chunks(x0, x1, y0, y1, filters: dict, columns: str = ""):
+    """Every point of a viewport that passes the filters (as ``parse_filters``
+    returns them), ``EXPORT_CHUNK_ROWS`` at a time; at least one chunk"""
+    if filters is None:
+        yield project(point_rows(np.empty(0, dtype=np.int64)), columns)
+    elif POINTS_STORE is not None:
+        for chunk in POINTS_STORE.scan(x0, x1, y0, y1, EXPORT_CHUNK_ROWS, **filters):
+            yield project(chunk, columns)
+    else:
+        # Only the positions are collected up front, rows are read per chunk
+        with STAGE("export_query") as stage:
+            rows = filter_rows(SPATIAL_INDEX.query(x0, x1, y0, y1), **filters)
+            stage.note = f"{len(rows)} rows"
+        for start in range(0, max(len(rows), 1), EXPORT_CHUNK_ROWS):
+            yield project(point_rows(rows[start:start + EXPORT_CHUNK_ROWS]), columns)
+
+
+@api_router.get("/export")
+async def export(
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+    x0: float = -15,
+    x1: float = 15,
+    y0: float = -25,
+    y1: float = 15,
+    types: str = "",
+    lengthRange: str = "",
+    pLDDT: str = "",
+    supercog: str = "",
+    goterm: str = "",
+    ontology: str = "",
+    taxonomy: str = "",
+    columns: str = "",
+):
+    """Every point of a viewport that passes the filters of /points, without
+    its POINTS_LIMIT, streamed as CSV, NDJSON or Parquet"""
+    def encoded():
+        filters = parse_filters(types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy)
+        yield from encode_export(export_chunks(x0, x1, y0, y1, filters, columns), format)
+
+    # Every part is produced in the query pool, the first one before the
+    # response starts so that a busy pool still gets a 503
+    parts = encoded()
+    first = await QUERY_EXECUTOR.run(next, parts, None)
+
+    async def stream():
+        part = first
+        while part is not None:
+            yield part
+            part = await QUERY_EXECUTOR.run(next, parts, None)
+
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="points.{format}"'},
+    )
+
+
+@api_router.get("/density")
+async def density(
+    x0: float = -15,
+    x1: float = 15,
+    y0: float = -25,
+    y1: float = 15,
+    bins_x: int = Query(128, ge=1, le=1024),
+    bins_y: int = Query(128, ge=1, le=1024),
+    split: Literal["origin", "taxonomy"] = None,
+    types: str = "",
+    lengthRange: str = "",
+    pLDDT: str = "",
+    supercog: str = "",
+    goterm: str = "",
+    ontology: str = "",
+    taxonomy: str = "",
+):
+    return await QUERY_EXECUTOR.run(
+        get_density, x0, x1, y0, y1, bins_x, bins_y, split, types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy
+    )
+
+
+# Bins must span this many cells of the density grid to be read from its
+# summed-area tables, and viewports holding fewer rows are counted exactly
+DENSITY_MIN_CELLS = 4
+DENSITY_EXACT_ROWS = 200_000
+
+
+def get_density(x0, x1, y0, y1, bins_x, bins_y, split, types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy):
+    """Point counts of a viewport on a bins_y x bins_x grid, one grid per value
+    of ``split`` (or a single "all" grid)"""
+    with STAGE("density") as stage:
+        filters = parse_filters(types, lengthRange, pLDDT, supercog, goterm, ontology, taxonomy)
+        categories = DENSITY_GRID.categories(
+            origin=(filters or {}).get("types"),
+            taxonomy=(filters or {}).get("taxonomy"),
+        )
+
+        # Origin and taxonomy filters are a choice of tables; anything else needs
+        # the rows themselves
+        from_tables = (
+            filters is not None
+            and set(filters) <= {"types", "taxonomy"}
+            and DENSITY_GRID.cells_per_bin(x0, x1, y0, y1, bins_x, bins_y) >= DENSITY_MIN_CELLS
+        )
+        if from_tables:
+            counts = DENSITY_GRID.table_counts(x0, x1, y0, y1, bins_x, bins_y, categories)
+            from_tables = counts.sum() > DENSITY_EXACT_ROWS
+        if not from_tables:
+            rows = SPATIAL_INDEX.query(x0, x1, y0, y1) if filters is not None else np.empty(0, dtype=np.int64)
+            rows = filter_rows(rows, **(filters or {}))
+            counts = DENSITY_GRID.row_counts(rows, x0, x1, y0, y1, bins_x, bins_y, categories)
+
+        grids = DENSITY_GRID.split(counts, categories, split)
+        stage.note = f"{bins_x}x{bins_y} bins from {'tables' if from_tables else 'rows'}"
+    return {
+        "x0": x0, "x1": x1, "y0": y0, "y1": y1,
+        "bins_x": bins_x, "bins_y": bins_y,
+        "exact": not from_tables,
+        "total": int(counts.sum()),
+        "counts": {str(label) if label is not None else "unknown": grid.tolist() for label, grid in grids.items()},
+    }
 
 @api_router.get("/pdb_loc/{protein:str}")
 async def pdb_loc(protein: str):
-    # return DATA_FULL.loc[protein, "pdb_loc"]
-    row = DATA_FULL[DATA_FULL["protein"] == protein]
-    if len(row) == 0:
-        return None
-    return row["pdb_loc"].values[0]
+    if POINTS_STORE is not None:
+        # May have to read a row group
+        return await QUERY_EXECUTOR.run(protein_value, protein, "pdb_loc")
+    return protein_value(protein, "pdb_loc")
 
 @api_router.get("/pdb/{pdb_id:path}", response_class=FileResponse)
 async def pdb(pdb_id: str):
@@ -247,49 +809,76 @@ async def pdb(pdb_id: str):
         return full_loc
 
     elif full_loc.endswith(".cif"):
-        start_time = time.time()
-        cif_to_pdb(full_loc, full_loc + ".pdb")
-        logger.info(f"CIF to PDB conversion took {time.time() - start_time:.2f}s")
-        return full_loc + ".pdb"
+        # Warm entries are served without touching the conversion pool
+        cached = PDB_CACHE.lookup(full_loc)
+        PDB_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+        with STAGE("conversion") as stage:
+            stage.note = pdb_id
+            # The conversion may run on a copy of the cache in another process,
+            # its bookkeeping is applied here
+            entry = await CONVERSION_EXECUTOR.run(PDB_CACHE.convert_entry, full_loc)
+        if PDB_CACHE.record(entry):
+            # In a thread of this process, so the size it measures is kept
+            await QUERY_EXECUTOR.run(PDB_CACHE.evict)
+        return entry[0]
 
 @api_router.get("/goterm/{protein:str}")
 async def protein_goterm(protein: str):
-    # Check for the protein in both DeepFRI 1.0 (main dataset) and 1.1 (new folds)
-    protein_file = f"{PROTEIN_GOTERM_LOC}/{protein}.csv"
-    
-    if not os.path.exists(protein_file):
-        logger.info(f"No GO term predictions found for protein: {protein}")
-        return []
-    
+    if GOTERM_STORE is not None:
+        # A binary search and a slice of mapped arrays, no need for the executor
+        return read_protein_goterms(protein)
+    return await QUERY_EXECUTOR.run(read_protein_goterms, protein)
+
+
+@api_router.post("/goterms")
+async def protein_goterms(
+    proteins: list[str] = Body(None, embed=True),
+    cluster: str = Body(None, embed=True),
+):
+    """GO term predictions of several proteins, or of every member of a cluster"""
+    proteins = list(proteins or [])
+    if cluster is not None:
+        cluster_id = CLUSTER_INDEX.cluster_id(cluster)
+        if cluster_id is None:
+            return JSONResponse({"error": f"Unknown cluster {cluster}"}, status_code=404)
+        if len(proteins) + CLUSTER_INDEX.size(cluster_id) > GOTERM_BATCH_LIMIT:
+            return JSONResponse({"error": f"At most {GOTERM_BATCH_LIMIT} proteins per request"}, status_code=400)
+        member_ids = CLUSTER_INDEX.member_ids(cluster_id)
+        proteins += CLUSTER_INDEX.members[member_ids.start:member_ids.stop].tolist()
+    if len(proteins) > GOTERM_BATCH_LIMIT:
+        return JSONResponse({"error": f"At most {GOTERM_BATCH_LIMIT} proteins per request"}, status_code=400)
+    return await QUERY_EXECUTOR.run(read_many_protein_goterms, proteins)
+
+
+def read_many_protein_goterms(proteins: list):
+    with STAGE("goterm_batch") as stage:
+        results = {protein: read_protein_goterms(protein) for protein in dict.fromkeys(proteins)}
+        stage.note = f"{len(results)} proteins"
+        return results
+
+
+def read_protein_goterms(protein: str):
     try:
-        # Read the GO term predictions for this protein
-        start_time = time.time()
-        goterms_df = pd.read_csv(protein_file)
-        logger.info(f"Loading protein GO terms for {protein} took {time.time() - start_time:.2f}s")
+        if GOTERM_STORE is not None:
+            predictions = GOTERM_STORE.lookup(protein)
+        else:
+            protein_file = f"{PROTEIN_GOTERM_LOC}/{protein}.csv"
+            predictions = read_predictions(protein_file) if os.path.exists(protein_file) else None
+        
+        if predictions is None:
+            return []
         
         # Format the results to include GO term ID, ontology, name, and score
-        format_start_time = time.time()
-        results = []
-        for _, row in goterms_df.iterrows():
-            go_id = row.get("GO-term", "")
-            ontology = row.get("Ontology", "")
-            score = row.get("Score", 0)
-            
-            # Look up the GO term name if available
-            go_name = ""
-            if go_id in GOTERMS_NAME["GOterm"].values:
-                go_name = GOTERMS_NAME.loc[GOTERMS_NAME["GOterm"] == go_id, "GOname"].values[0]
-            
-            results.append({
-                "go_id": go_id,
-                "ontology": ontology,
-                "name": go_name,
-                "score": score
-            })
+        results = [
+            {"go_id": go_id, "ontology": ontology, "name": GOTERM_NAME_MAP.get(go_id, ""), "score": score}
+            for go_id, ontology, score in zip(*predictions)
+        ]
         
-        # Sort by score (descending)
-        results.sort(key=lambda x: x["score"], reverse=True)
-        logger.info(f"Formatting GO terms data took {time.time() - format_start_time:.2f}s")
+        # Sort by score (descending); the compiled store already is
+        if GOTERM_STORE is None:
+            results.sort(key=lambda x: x["score"], reverse=True)
         return results
     
     except Exception as e:
@@ -298,126 +887,271 @@ async def protein_goterm(protein: str):
 
 
 @api_router.get("/name_search")
-async def name_search(name: str):
-    start_time = time.time()
-    
-    # Use cached regex search for faster matching
-    matching_keys = search_proteins(name)
-    
-    if not matching_keys:
-        return []
-    
-    # Get original indices
-    original_indices = [PROTEIN_INDEX_MAP[key] for key in matching_keys[:10]]
-    
-    # Fast lookup using iloc
-    all_matching = REVERSE_REPRESENTATIVE_MAPPING.loc[original_indices]
-    logger.info(f"Finding matching names took {time.time() - start_time:.2f}s")
+async def name_search(
+    name: str,
+    response: Response,
+    mode: Literal["prefix", "substring", "exact"] = "substring",
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Proteins matching a name. A substring search checks a bounded number
+    of names; when that left names unchecked (see ``NameIndex.find``) the
+    response carries ``X-Search-Truncated: 1``, as matches may be missing."""
+    records, complete = await QUERY_EXECUTOR.run(find_names, name, mode, limit)
+    if not complete:
+        response.headers["X-Search-Truncated"] = "1"
+    return records
+
+
+def find_names(name: str, mode: str = "substring", limit: int = 10):
+    """Records of the proteins matching a name, and whether every name was
+    considered"""
+    with STAGE("name_search") as stage:
+        stage.note = f"{mode} {name!r}"
+        matching, complete = NAME_INDEX.find(name, mode, limit)
     
-    processing_start_time = time.time()
+    if len(matching) == 0:
+        return [], complete
     
     # Use precomputed data instead of filtering DATA again
-    subset = []
-    for found_name, cluster in zip(all_matching.index, all_matching["Cluster"]):
-        cluster_lower = cluster.lower()
-        if cluster_lower in CLUSTER_TO_DATA:
-            data_ = CLUSTER_TO_DATA[cluster_lower].to_dict()
-            data_["representative"] = cluster
-            data_["protein"] = found_name
-            other_protein_names = REPRESENTATIVE_MAPPING.loc[cluster, "Protein"]
-            other_protein_urls = [DATA_FULL.loc[protein, "url"] for protein in other_protein_names]
-            data_["others"] = [({"name": protein, "url": url} for protein, url in zip(other_protein_names, other_protein_urls))]
-            subset.append(data_)
-    
-    logger.info(f"Processing matching names took {time.time() - processing_start_time:.2f}s")
-    return subset
+    with STAGE("name_records") as stage:
+        subset = []
+        for found_name, cluster_id in zip(CLUSTER_INDEX.members[matching], CLUSTER_INDEX.cluster_of(matching)):
+            cluster = CLUSTER_INDEX.names[cluster_id]
+            cluster_lower = cluster.lower()
+            if cluster_lower in CLUSTER_TO_DATA:
+                data_ = point_rows([CLUSTER_TO_DATA[cluster_lower]]).iloc[0].to_dict()
+                data_["representative"] = cluster
+                data_["protein"] = found_name
+                # The first members only, however large the cluster
+                data_["others"] = cluster_member_records(cluster_id, 0, NAME_SEARCH_MEMBERS)
+                data_["others_total"] = CLUSTER_INDEX.size(cluster_id)
+                subset.append(data_)
+        stage.note = f"{len(subset)} records"
+    return subset, complete
+
+
+@api_router.get("/cluster/{cluster:str}/members")
+async def cluster_members(
+    cluster: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=CLUSTER_MEMBERS_LIMIT),
+):
+    """A page of the members of a cluster, with their urls"""
+    cluster_id = CLUSTER_INDEX.cluster_id(cluster)
+    if cluster_id is None:
+        return JSONResponse({"error": f"Unknown cluster {cluster}"}, status_code=404)
+    members = await QUERY_EXECUTOR.run(cluster_member_records, cluster_id, offset, limit)
+    return {"cluster": cluster, "total": CLUSTER_INDEX.size(cluster_id), "offset": offset, "members": members}
 
 
 @api_router.get("/goterm_autocomplete")
-async def goterm_autocomplete(goterm: str):
-    start_time = time.time()
-    subset = GOTERMS_NAME[
-        GOTERMS_NAME["GOname"].str.lower().str.contains(goterm.lower())
-    ][:10]
-    logger.info(f"GO term autocomplete for '{goterm}' took {time.time() - start_time:.2f}s")
-    return subset.to_dict(orient="records")
+async def goterm_autocomplete(goterm: str, ontology: str = None, limit: int = Query(10, ge=1, le=100)):
+    # Served from an in-memory index, no need for the executor
+    return GOTERM_NAMES.search(goterm, ontology, limit)
+
+
+@api_router.get("/executors")
+async def executors():
+    return {"query": QUERY_EXECUTOR.stats(), "conversion": CONVERSION_EXECUTOR.stats()}
+
+
+@api_router.get("/response_cache")
+async def response_cache():
+    return RESPONSE_CACHE.stats()
+
+
+@api_router.get("/metrics")
+async def metrics():
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+async def ws_init(websocket: WebSocket, data: dict):
+    # Handle initial data load - these points stay permanently
+    arrow = data.get("format") == "arrow"
+    columns = data.get("columns", "")
+    key = ("ws_init", tuple(parse_columns(columns)), arrow)
+    entry = RESPONSE_CACHE.get(key)
+    if entry is None:
+        entry = RESPONSE_CACHE.put(key, await QUERY_EXECUTOR.run(
+            lambda: encode_cached(
+                get_initial_points(),
+                arrow,
+                columns,
+                metadata={"type": "init", "is_last": "true"},
+                envelope={"type": "init"},
+            )
+        ))
+    with STAGE("send"):
+        if arrow:
+            await websocket.send_bytes(entry.body)
+        else:
+            await websocket.send_text(entry.body.decode("utf-8"))
+
+
+def ws_filters(data: dict) -> dict:
+    """Filter parameters of a WebSocket message (lists) as the query
+    functions take them (comma separated)"""
+    return {
+        "types": ",".join(data.get("types", [])),
+        "lengthRange": ",".join(map(str, data.get("lengthRange", []))),
+        "pLDDT": ",".join(map(str, data.get("pLDDT", []))),
+        "supercog": ",".join(map(str, data.get("supercog", []))),
+        "goterm": data.get("goTerm", ""),
+        "ontology": data.get("ontology", ""),
+        "taxonomy": ",".join(map(str, data.get("taxonomy", []))),
+    }
+
+
+async def ws_nearest(websocket: WebSocket, data: dict):
+    """Answer a picking query with the points nearest to (x, y), as /nearest"""
+    binary = data.get("format") == "arrow"
+    query_id = data.get("id")
+    try:
+        if data.get("x") is None or data.get("y") is None:
+            raise ValueError("A nearest query needs x and y")
+        radius = data.get("radius")
+        points = await QUERY_EXECUTOR.run(
+            get_nearest,
+            x=float(data["x"]),
+            y=float(data["y"]),
+            k=min(max(int(data.get("k", 1)), 1), POINTS_LIMIT),
+            radius=float(radius) if radius is not None else None,
+            **ws_filters(data),
+        )
+        points = project(points, data.get("columns", ""))
+        with STAGE("send") as stage:
+            stage.note = f"{len(points)} points"
+            if binary:
+                await websocket.send_bytes(encode_arrow(points, {"type": "nearest", "id": query_id, "is_last": "true"}))
+            else:
+                await websocket.send_json({"type": "nearest", "id": query_id, "points": points.to_dict(orient="records"), "is_last": True})
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"WebSocket nearest error: {e}")
+        await websocket.send_json({"type": "error", "id": query_id, "message": str(e)})
+
+
+async def ws_query(websocket: WebSocket, data: dict, held: set):
+    """Answer one viewport query.
+
+    ``held`` holds the ids of the points a delta-mode client already has; it is
+    only updated once the answer has been sent in full.
+    """
+    # Handle regular point queries - these points get updated
+    # Binary clients get a single Arrow message per answer with the
+    # message fields stored in the schema metadata
+    binary = data.get("format") == "arrow"
+    # Echoed back so clients can drop answers to superseded queries
+    query_id = data.get("id")
+    try:
+        points = await QUERY_EXECUTOR.run(
+            get_points,
+            x0=float(data.get("x0", -15)),
+            x1=float(data.get("x1", 15)),
+            y0=float(data.get("y0", -25)),
+            y1=float(data.get("y1", 15)),
+            **ws_filters(data),
+        )
+
+        if data.get("delta"):
+            # Only send what changed since the previous answer
+            if data.get("reset"):
+                held.clear()
+            ids = points["protein"].tolist()
+            added = points[~points["protein"].isin(held)]
+            removed = list(held.difference(ids))
+            added = project(added, data.get("columns", ""))
+            with STAGE("send"):
+                if binary:
+                    await websocket.send_bytes(encode_arrow(added, {"type": "delta", "id": query_id, "remove": json.dumps(removed), "is_last": "true"}))
+                else:
+                    await websocket.send_json({"type": "delta", "id": query_id, "add": added.to_dict(orient="records"), "remove": removed, "is_last": True})
+            held.clear()
+            held.update(ids)
+            WEBSOCKET_QUERIES.inc(outcome="delta")
+            return
+
+        held.clear()
+        points = project(points, data.get("columns", ""))
+
+        if binary:
+            with STAGE("send") as stage:
+                stage.note = f"{len(points)} points"
+                await websocket.send_bytes(encode_arrow(points, {"type": "update", "id": query_id, "is_last": "true"}))
+            WEBSOCKET_QUERIES.inc(outcome="sent")
+            return
+
+        if len(points) == 0:
+            await websocket.send_json({"type": "update", "id": query_id, "points": [], "is_last": True})
+            WEBSOCKET_QUERIES.inc(outcome="sent")
+            return
+
+        # Send points in batches of 100
+        with STAGE("send") as stage:
+            stage.note = f"{len(points)} points"
+            points = points.to_dict(orient="records")
+            for i in range(0, len(points), 100):
+                batch = points[i : i + 100]
+                await websocket.send_json(
+                    {
+                        "type": "update",
+                        "id": query_id,
+                        "points": batch,
+                        "is_last": i + 100 >= len(points),
+                    }
+                )
+                await asyncio.sleep(0.01)  # Small delay between batches
+        WEBSOCKET_QUERIES.inc(outcome="sent")
+
+    except asyncio.CancelledError:
+        WEBSOCKET_QUERIES.inc(outcome="superseded")
+        raise
+    except Exception as e:
+        WEBSOCKET_QUERIES.inc(outcome="error")
+        logger.error(f"WebSocket query error: {e}")
+        await websocket.send_json({"type": "error", "id": query_id, "message": str(e)})
+
 
 @api_router.websocket("/ws/points")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connection established")
 
+    # Latest query wins: a new viewport cancels the one still being computed
+    # or streamed, so dragging the map never queues up obsolete answers
+    query_task = None
+    init_task = None
+    # Picking runs beside the viewport queries; a newer pick supersedes it
+    nearest_task = None
+    held = set()
     try:
         while True:
-            data = await websocket.receive_text()
-            request_time = time.time()
-            data = json.loads(data)
+            data = json.loads(await websocket.receive_text())
+            WEBSOCKET_MESSAGES.inc(type=data.get("type") if data.get("type") in ("init", "nearest") else "query")
 
             if data.get("type") == "init":
-                # Handle initial data load - these points stay permanently
-                points = get_initial_points()
-                await websocket.send_json(
-                    {
-                        "type": "init",
-                        "points": points,
-                    }
-                )
-                logger.info(f"WebSocket init request processed in {time.time() - request_time:.2f}s")
+                init_task = asyncio.create_task(ws_init(websocket, data))
+            elif data.get("type") == "nearest":
+                if nearest_task is not None and not nearest_task.done():
+                    nearest_task.cancel()
+                nearest_task = asyncio.create_task(ws_nearest(websocket, data))
             else:
-                # Handle regular point queries - these points get updated
-                try:
-                    points = get_points(
-                        x0=float(data.get("x0", -15)),
-                        x1=float(data.get("x1", 15)),
-                        y0=float(data.get("y0", -25)),
-                        y1=float(data.get("y1", 15)),
-                        types=",".join(data.get("types", [])),
-                        lengthRange=",".join(map(str, data.get("lengthRange", []))),
-                        pLDDT=",".join(map(str, data.get("pLDDT", []))),
-                        supercog=",".join(map(str, data.get("supercog", []))),
-                        goterm=data.get("goTerm", ""),
-                        ontology=data.get("ontology", ""),
-                        taxonomy=",".join(map(str, data.get("taxonomy", [])))
-                    )
-                    
-                    if len(points) == 0:
-                        await websocket.send_json({"type": "update", "points": [], "is_last": True})
-                        logger.info(f"WebSocket query processed with no results in {time.time() - request_time:.2f}s")
-                        continue
-
-                    # Send points in batches of 100
-                    send_start_time = time.time()
-                    for i in range(0, len(points), 100):
-                        batch = points[i : i + 100]
-                        await websocket.send_json(
-                            {
-                                "type": "update",
-                                "points": batch,
-                                "is_last": i + 100 >= len(points),
-                            }
-                        )
-                        await asyncio.sleep(0.01)  # Small delay between batches
-                    
-                    logger.info(f"WebSocket query processed and sent {len(points)} points in {time.time() - request_time:.2f}s (sending took {time.time() - send_start_time:.2f}s)")
-
-                except Exception as e:
-                    logger.error(f"WebSocket query error: {e}")
-                    await websocket.send_json({"type": "error", "message": str(e)})
+                if query_task is not None and not query_task.done():
+                    query_task.cancel()
+                query_task = asyncio.create_task(ws_query(websocket, data, held))
 
     except WebSocketDisconnect:
         pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         logger.error(traceback.format_exc())
+    finally:
+        for task in (query_task, init_task, nearest_task):
+            if task is not None:
+                task.cancel()
 
 app.include_router(api_router)
 
 if __name__ == "__main__":
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        ws_max_size=1024 * 1024 * 10,  # 10MB max message size
-        ws_ping_interval=None,  # Disable ping/pong
-        ws_ping_timeout=None,
-    )
+    # A single worker; several are started before anything is loaded
+    serve(app)
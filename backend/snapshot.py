@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+"""
+Preprocessed startup snapshot of the point table and cluster mappings.
+
+Building the tables from the raw parquet files (shuffling, cleaning names,
+parsing the JSON cluster member lists) takes minutes on the full dataset. This
+module runs that preprocessing once and writes the result as Arrow IPC and
+NumPy files which the server memory-maps on startup instead. A snapshot is only
+used while its version and the fingerprints of the source files match; the
+server falls back to the raw build otherwise, and writes a fresh snapshot
+under a file lock so that concurrent workers build it only once. Serving out
+of core it does not: the raw build holds the whole table in memory, so the
+snapshot has to be rebuilt offline.
+
+Numeric columns and all index arrays are handed to pandas and numpy without
+copying, so several server processes started from the same snapshot share one
+copy of them through the page cache.
+
+A compact snapshot keeps a single row table instead of two: the points in query
+order followed by the rows without coordinates, with repetitive string columns
+as categoricals, other text as Arrow strings, float32 coordinates and scores,
+and without the name columns derivable from the row index (``expand_rows``
+adds them back to the rows a response returns). It takes a fraction of the
+memory at the cost of float32 precision in returned coordinates.
+
+usage:
+  python snapshot.py [--data PARQUET] [--clusters PARQUET] [--out DIR] [--compact]
+"""
+
+import argparse
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from loguru import logger
+
+from cluster_index import ClusterIndex
+from density import DensityGrid
+from filter_index import FilterIndex
+from fingerprint import source_fingerprint
+from name_index import NameIndex
+from row_lookup import RowLookup
+from spatial_index import GridIndex
+from tile_pyramid import TilePyramid
+
+# Bump whenever build_tables changes what it produces
+SNAPSHOT_VERSION = 7
+META_FILE = "meta.json"
+
+_FRAMES = ["data_full", "data"]
+_ARRAYS = [
+    "full_positions", "full_to_data", "cluster_row_keys", "cluster_row_positions", "protein_row_keys", "protein_row_positions",
+]
+_STRINGS = ["cluster_names", "cluster_members"]
+# Derived from the row index, so compact tables leave them out
+NAME_COLUMNS = ["protein", "clean_name", "representative", "clean_name_lower"]
+# data.parquet calls the taxonomy name "origin" and the source database "database"
+RENAMED_COLUMNS = {"origin": "taxonomy_name", "database": "origin"}
+# pLDDT is only defined for these origins, the other rows get -1
+AFDB_ORIGINS = ["AFDB light clusters", "AFDB dark clusters"]
+
+
+def clean_names(names) -> pd.Series:
+    """Protein names without the AlphaFold prefix and suffixes, as the cluster
+    representatives are named"""
+    return pd.Series(names, dtype=object).str.replace("AF-", "").str.replace("-model_v4", "").str.replace("-F1", "")
+
+
+def compact_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Smaller dtypes for the row table: string columns with few distinct
+    values become categoricals and the rest Arrow strings, floats become
+    float32 and integers int32"""
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_float_dtype(values):
+            values = values.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            values = values.astype(np.int32) if values.abs().max() < 2**31 else values
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            if values.nunique() * 2 < max(len(values), 2):
+                values = values.astype("category")
+            else:
+                values = values.astype(pd.StringDtype("pyarrow"))
+        columns[column] = values
+    return pd.DataFrame(columns, index=frame.index.astype(pd.StringDtype("pyarrow")))
+
+
+def expand_rows(frame: pd.DataFrame) -> pd.DataFrame:
+    """Rows of a compact table in the shape the full table has: plain string
+    columns and the name columns derived from the index"""
+    columns = {
+        column: values.astype(object) if isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)) else values
+        for column, values in frame.items()
+    }
+    frame = pd.DataFrame(columns, index=frame.index.astype(object))
+    frame["protein"] = frame.index.to_numpy()
+    frame["clean_name"] = clean_names(frame.index).to_numpy()
+    frame["representative"] = frame["clean_name"]
+    frame["clean_name_lower"] = frame["clean_name"].str.lower()
+    return frame
+
+
+def point_order(has_coordinates: np.ndarray):
+    """The shuffled order of the points (the rows of data.parquet with
+    coordinates) that DATA keeps them in.
+
+    Shuffles through an explicit permutation (the same one DATA.sample(frac=1)
+    draws) so every row can be traced back to its position in data.parquet.
+
+    Args:
+        has_coordinates (np.ndarray): Whether each row of data.parquet has x and y
+
+    Returns:
+        tuple: ``(full_positions, full_to_data)``, the position in data.parquet
+        of every DATA row and the inverse (-1 for rows without coordinates)
+    """
+    full_positions = np.flatnonzero(has_coordinates)
+    permutation = pd.Series(np.arange(len(full_positions))).sample(frac=1, random_state=42).to_numpy()
+    full_positions = full_positions[permutation]
+    full_to_data = np.full(len(has_coordinates), -1, dtype=np.int64)
+    full_to_data[full_positions] = np.arange(len(full_positions))
+    return full_positions, full_to_data
+
+
+_INDEXES = ["spatial_index", "tile_pyramid", "filter_index", "density_grid", "name_index", "cluster_index"]
+
+
+def build_tables(data_loc: str, clusters_loc: str, compact: bool = False) -> dict:
+    """Run the full preprocessing on the raw files.
+
+    Args:
+        data_loc (str): Path to data.parquet
+        clusters_loc (str): Path to all_clusters_nf.parquet
+        compact (bool): Build a single compact row table (see module docs)
+
+    Returns:
+        dict: ``data_full`` and ``data`` frames, ``full_positions`` (position
+        in data.parquet of every DATA row) and its inverse ``full_to_data``
+        (-1 for rows without coordinates), the cluster names and members
+        (``cluster_names``, ``cluster_members``) with ``cluster_index`` over
+        them, the DATA rows of cluster representatives by lowercase name
+        (``cluster_row_keys``, sorted, and ``cluster_row_positions``), the
+        data_full rows by protein name (``protein_row_keys`` and
+        ``protein_row_positions``), plus the query indexes over ``data`` and
+        ``name_index`` over ``cluster_members``. With ``compact``, ``data`` is
+        the leading part of ``data_full``.
+    """
+    start_time = time.time()
+    data_full = pd.read_parquet(data_loc).drop(columns=["afdb_hq"])
+    if not compact:
+        data_full["protein"] = list(data_full.index)
+    full_positions, full_to_data = point_order(data_full[["x", "y"]].notna().all(axis=1).to_numpy())
+    data = data_full.iloc[full_positions].rename(columns=RENAMED_COLUMNS)
+
+    logger.info(f"Taxonomy: {data['taxonomy'].value_counts()}")
+    logger.info(f"Loading main data took {time.time() - start_time:.2f}s ({len(data)} points)")
+    logger.info(f"Columns: {data.columns}")
+
+    data.loc[~data["origin"].isin(AFDB_ORIGINS), "afdb_pLDDT"] = -1
+    clean_name_lower = clean_names(data.index).str.lower().to_numpy()
+    if compact:
+        # One table: the points in query order, then the rows without coordinates
+        rest = data_full.iloc[np.flatnonzero(full_to_data < 0)]
+        rest = rest.rename(columns=RENAMED_COLUMNS)
+        data_full = compact_frame(pd.concat([data, rest]))
+        data = data_full.iloc[:len(data)]
+    else:
+        data["clean_name"] = clean_names(data.index).to_numpy()
+        data["representative"] = data["clean_name"]
+        data["clean_name_lower"] = clean_name_lower
+
+    start_time = time.time()
+    clusters = pd.read_parquet(clusters_loc)
+    members = [json.loads(m) for m in clusters["Protein"]]
+    offsets = np.zeros(len(members) + 1, dtype=np.int64)
+    np.cumsum([len(m) for m in members], out=offsets[1:])
+    cluster_names = np.asarray(clusters.index, dtype=object)
+    cluster_members = np.array(list(itertools.chain.from_iterable(members)), dtype=object)
+    logger.info(f"Loading representative mapping took {time.time() - start_time:.2f}s")
+
+    # DATA rows whose name is a cluster representative
+    unique_clusters = set(cluster.lower() for cluster in clusters.index)
+    matching = np.flatnonzero(pd.Series(clean_name_lower).isin(unique_clusters).to_numpy())
+    cluster_rows = RowLookup.build(clean_name_lower[matching], matching)
+
+    start_time = time.time()
+    protein_rows = RowLookup.build(data_full.index, np.arange(len(data_full)))
+    cluster_index = ClusterIndex(cluster_names, offsets, cluster_members, protein_rows.positions_of(cluster_members))
+    logger.info(f"Building cluster index took {time.time() - start_time:.2f}s ({len(cluster_members)} members)")
+
+    tables = {
+        "data_full": data_full,
+        "data": data,
+        "full_positions": full_positions,
+        "full_to_data": full_to_data,
+        "cluster_names": cluster_names,
+        "cluster_members": cluster_members,
+        "cluster_index": cluster_index,
+        "cluster_row_keys": cluster_rows.keys,
+        "cluster_row_positions": cluster_rows.positions,
+        "protein_row_keys": protein_rows.keys,
+        "protein_row_positions": protein_rows.positions,
+        "compact": compact,
+    }
+    tables.update(build_indexes(data))
+
+    start_time = time.time()
+    tables["name_index"] = NameIndex(tables["cluster_members"])
+    logger.info(f"Building name index took {time.time() - start_time:.2f}s ({len(tables['name_index'])} names)")
+    return tables
+
+
+def build_indexes(data: pd.DataFrame) -> dict:
+    """Spatial, level-of-detail, filter and density indexes over the point table"""
+    x = data["x"].to_numpy()
+    y = data["y"].to_numpy()
+
+    start_time = time.time()
+    spatial_index = GridIndex(x, y)
+    logger.info(f"Building spatial index took {time.time() - start_time:.2f}s ({spatial_index.side}x{spatial_index.side} cells)")
+
+    start_time = time.time()
+    tile_pyramid = TilePyramid(x, y)
+    logger.info(f"Building tile pyramid took {time.time() - start_time:.2f}s ({tile_pyramid.max_level + 1} zoom levels)")
+
+    start_time = time.time()
+    filter_index = FilterIndex(
+        data,
+        categorical=["origin", "superCOG_v10", "taxonomy"],
+        ranges=["length", "afdb_pLDDT"],
+        # pLDDT is only defined for AFDB clusters, the rest always pass
+        always_pass={"afdb_pLDDT": -1},
+    )
+    logger.info(f"Building filter index took {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    density_grid = DensityGrid(x, y, data, columns=["origin", "taxonomy"])
+    logger.info(f"Building density grid took {time.time() - start_time:.2f}s ({len(density_grid.labels)} categories)")
+
+    return {
+        "spatial_index": spatial_index,
+        "tile_pyramid": tile_pyramid,
+        "filter_index": filter_index,
+        "density_grid": density_grid,
+    }
+
+
+def cluster_mappings(tables: dict):
+    """Lookup structures the endpoints use, over the arrays of the tables.
+
+    Returns:
+        tuple: ``(cluster_index, cluster_to_data, protein_rows)`` where
+        cluster_index (a ``ClusterIndex``) holds the members of every cluster
+        and the cluster of every member, cluster_to_data (a ``RowLookup``)
+        maps a lowercase representative name to its DATA row position and
+        protein_rows (a ``RowLookup``) a protein name to its data_full row
+        position
+    """
+    cluster_to_data = RowLookup(tables["cluster_row_keys"], tables["cluster_row_positions"])
+    protein_rows = RowLookup(tables["protein_row_keys"], tables["protein_row_positions"])
+    return tables["cluster_index"], cluster_to_data, protein_rows
+
+
+def _fingerprints(data_loc: str, clusters_loc: str) -> dict:
+    return {"data": source_fingerprint(data_loc), "clusters": source_fingerprint(clusters_loc)}
+
+
+def snapshot_id(data_loc: str, clusters_loc: str, compact: bool = False) -> str:
+    """Short identifier of the tables built from the raw files; changes with
+    them, with the layout and with ``SNAPSHOT_VERSION``"""
+    key = json.dumps({"version": SNAPSHOT_VERSION, "sources": _fingerprints(data_loc, clusters_loc), "compact": compact}, sort_keys=True)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _write_arrow(table: pa.Table, path: str) -> None:
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_arrow(path: str) -> pa.Table:
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def _save_arrays(path: str, arrays: dict) -> None:
+    """Store arrays as .npy files and every other value in a JSON file"""
+    os.makedirs(path)
+    meta = {}
+    for name, value in arrays.items():
+        if isinstance(value, np.ndarray):
+            np.save(os.path.join(path, f"{name}.npy"), value)
+        else:
+            meta[name] = value
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump(meta, f)
+
+
+def _load_arrays(path: str) -> dict:
+    with open(os.path.join(path, META_FILE)) as f:
+        arrays = json.load(f)
+    for name in os.listdir(path):
+        if name.endswith(".npy"):
+            arrays[name[:-len(".npy")]] = np.load(os.path.join(path, name), mmap_mode="r")
+    return arrays
+
+
+def save_snapshot(tables: dict, out_path: str, fingerprints: dict) -> None:
+    """Write tables produced by build_tables to a snapshot directory.
+
+    The snapshot is written next to the target and swapped in with a rename,
+    so a server starting meanwhile sees either the old or the new one.
+    """
+    tmp_path = out_path.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    compact = tables.get("compact", False)
+    # A compact data frame is a slice of data_full, only the latter is stored
+    for name in _FRAMES[:1] if compact else _FRAMES:
+        _write_arrow(pa.Table.from_pandas(tables[name], preserve_index=True), os.path.join(tmp_path, f"{name}.arrow"))
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), tables[name])
+    for name in _STRINGS:
+        _write_arrow(pa.table({name: pa.array(tables[name], type=pa.large_string())}), os.path.join(tmp_path, f"{name}.arrow"))
+    for name in _INDEXES:
+        _save_arrays(os.path.join(tmp_path, name), tables[name].arrays())
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "sources": fingerprints, "compact": compact, "points": len(tables["data"])}, f)
+
+    old_path = out_path.rstrip("/") + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(out_path):
+        os.rename(out_path, old_path)
+    os.rename(tmp_path, out_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class SnapshotOutOfDate(Exception):
+    """Raised when a snapshot has to be rebuilt but building is not allowed"""
+
+
+def snapshot_is_fresh(snapshot_loc: str, data_loc: str, clusters_loc: str, compact: bool = False) -> bool:
+    """Whether the snapshot matches the raw files and the layout (either
+    layout if ``compact`` is None)"""
+    meta_path = os.path.join(snapshot_loc, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return (
+        meta.get("version") == SNAPSHOT_VERSION
+        and (compact is None or meta.get("compact", False) == compact)
+        and meta.get("sources") == _fingerprints(data_loc, clusters_loc)
+    )
+
+
+def _arrow_strings(data_type: pa.DataType):
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def load_snapshot(snapshot_loc: str, rows: bool = True) -> dict:
+    """Load a snapshot; arrays are memory-mapped rather than read.
+
+    Args:
+        snapshot_loc (str): Snapshot directory
+        rows (bool): Load the row tables; without them ``data_full`` and
+            ``data`` are None and only the indexes are loaded (rows are then
+            served from a ``points_store.PointStore``)
+    """
+    with open(os.path.join(snapshot_loc, META_FILE)) as f:
+        meta = json.load(f)
+    compact = meta.get("compact", False)
+    tables = {"compact": compact, "data_full": None, "data": None}
+    for name in (_FRAMES[:1] if compact else _FRAMES) if rows else []:
+        # One block per column keeps numeric columns backed by the mapped
+        # file; compact tables keep their strings in the mapped Arrow buffers too
+        tables[name] = _read_arrow(os.path.join(snapshot_loc, f"{name}.arrow")).to_pandas(
+            split_blocks=True,
+            types_mapper=_arrow_strings if compact else None,
+        )
+    if compact and rows:
+        tables["data"] = tables["data_full"].iloc[:meta["points"]]
+    for name in _ARRAYS:
+        tables[name] = np.load(os.path.join(snapshot_loc, f"{name}.npy"), mmap_mode="r")
+    for name in _STRINGS:
+        # Backed by the mapped file rather than a Python string per name;
+        # indexes, slices and tolist() like an object array
+        column = _read_arrow(os.path.join(snapshot_loc, f"{name}.arrow")).column(0)
+        tables[name] = pd.arrays.ArrowStringArray(column)
+
+    if rows:
+        x = tables["data"]["x"].to_numpy()
+        y = tables["data"]["y"].to_numpy()
+    else:
+        # Just the coordinate columns, still backed by the mapped file
+        points = _read_arrow(os.path.join(snapshot_loc, f"{_FRAMES[0] if compact else _FRAMES[1]}.arrow"))
+        x = points.column("x").to_numpy()[:meta["points"]]
+        y = points.column("y").to_numpy()[:meta["points"]]
+    tables["spatial_index"] = GridIndex.from_arrays(x, y, _load_arrays(os.path.join(snapshot_loc, "spatial_index")))
+    tables["tile_pyramid"] = TilePyramid.from_arrays(x, y, _load_arrays(os.path.join(snapshot_loc, "tile_pyramid")))
+    tables["filter_index"] = FilterIndex.from_arrays(_load_arrays(os.path.join(snapshot_loc, "filter_index")))
+    tables["density_grid"] = DensityGrid.from_arrays(x, y, _load_arrays(os.path.join(snapshot_loc, "density_grid")))
+    tables["name_index"] = NameIndex.from_arrays(_load_arrays(os.path.join(snapshot_loc, "name_index")))
+    tables["cluster_index"] = ClusterIndex.from_arrays(
+        tables["cluster_names"], tables["cluster_members"], _load_arrays(os.path.join(snapshot_loc, "cluster_index"))
+    )
+    return tables
+
+
+@contextmanager
+def _build_lock(snapshot_loc: str):
+    """Serialize snapshot builds between processes (no-op on a read-only volume)"""
+    try:
+        lock = open(snapshot_loc.rstrip("/") + ".lock", "w")
+    except OSError:
+        yield
+        return
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def load_tables(data_loc: str, clusters_loc: str, snapshot_loc: str, compact: bool = False, rows: bool = True) -> dict:
+    """Load the snapshot if it matches the raw files (and the requested
+    layout), otherwise build from them.
+
+    Without ``rows`` the row tables are left out of a loaded snapshot (see
+    ``load_snapshot``), either layout will do and nothing is built.
+
+    Raises:
+        SnapshotOutOfDate: Without ``rows``, if the snapshot does not match
+            the raw files
+    """
+    start_time = time.time()
+    if snapshot_is_fresh(snapshot_loc, data_loc, clusters_loc, compact if rows else None):
+        tables = load_snapshot(snapshot_loc, rows)
+        logger.info(f"Loading snapshot from {snapshot_loc} took {time.time() - start_time:.2f}s")
+        return tables
+    if not rows:
+        raise SnapshotOutOfDate(f"Snapshot at {snapshot_loc} is missing or older than {data_loc} or {clusters_loc}")
+
+    with _build_lock(snapshot_loc):
+        # Another worker may have written it while we waited for the lock
+        if snapshot_is_fresh(snapshot_loc, data_loc, clusters_loc, compact):
+            tables = load_snapshot(snapshot_loc, rows)
+            logger.info(f"Loading snapshot from {snapshot_loc} took {time.time() - start_time:.2f}s")
+            return tables
+
+        logger.warning(f"No up-to-date snapshot at {snapshot_loc}, preprocessing raw data")
+        fingerprints = _fingerprints(data_loc, clusters_loc)
+        tables = build_tables(data_loc, clusters_loc, compact)
+        logger.info(f"Preprocessing raw data took {time.time() - start_time:.2f}s")
+        try:
+            save_snapshot(tables, snapshot_loc, fingerprints)
+        except OSError as e:
+            logger.warning(f"Could not write snapshot to {snapshot_loc}: {e}")
+            return tables
+        # Reload so this process maps the same files as the other workers
+        return load_snapshot(snapshot_loc, rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess the raw data into a startup snapshot")
+    parser.add_argument("--data", default="/mnt/data/data.parquet", help="Point table")
+    parser.add_argument("--clusters", default="/mnt/data/all_clusters_nf.parquet", help="Cluster membership table")
+    parser.add_argument("--out", default="/mnt/data/snapshot", help="Output directory")
+    parser.add_argument("--compact", action="store_true", help="Single compact row table (as COMPACT_TABLES=1)")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    # Fingerprint before reading so a file replaced mid-build marks the snapshot stale
+    fingerprints = _fingerprints(args.data, args.clusters)
+    tables = build_tables(args.data, args.clusters, args.compact)
+    save_snapshot(tables, args.out, fingerprints)
+    logger.info(f"Wrote snapshot v{SNAPSHOT_VERSION} to {args.out} in {time.time() - start_time:.2f}s")
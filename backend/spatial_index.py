@@ -0,0 +1,174 @@
+"""
+Grid bucket index over the 2D embedding.
+
+Rows are bucketed into a uniform grid of cells and stored sorted by cell, so a
+viewport query only visits the rows of the cells overlapping the rectangle
+instead of testing every point in the dataset. Nearest-neighbour lookups grow
+a block of cells around the query point until it must contain the answer.
+"""
+
+import numpy as np
+
+
+class GridIndex:
+    """Uniform grid over x/y with rows laid out contiguously per cell.
+
+    Args:
+        x (np.ndarray): X coordinates, one per row (no NaNs)
+        y (np.ndarray): Y coordinates, one per row (no NaNs)
+        points_per_cell (int): Average number of rows per cell to aim for
+        max_side (int): Upper bound on the number of cells along each axis
+    """
+
+    def __init__(self, x, y, points_per_cell: int = 64, max_side: int = 4096):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        n = len(self.x)
+
+        self.side = int(min(max_side, max(1, np.ceil(np.sqrt(n / points_per_cell)))))
+        if n:
+            self.xmin, self.xmax = float(self.x.min()), float(self.x.max())
+            self.ymin, self.ymax = float(self.y.min()), float(self.y.max())
+        else:
+            self.xmin = self.xmax = self.ymin = self.ymax = 0.0
+        # Guard against a degenerate (zero-width) extent
+        self.cell_w = max(self.xmax - self.xmin, 1e-12) / self.side
+        self.cell_h = max(self.ymax - self.ymin, 1e-12) / self.side
+
+        cells = self._cell_y(self.y) * self.side + self._cell_x(self.x)
+        # Stable sort keeps rows inside a cell in their original order
+        self.order = np.argsort(cells, kind="stable").astype(np.int32 if n < 2**31 else np.int64)
+        counts = np.bincount(cells, minlength=self.side * self.side)
+        self.starts = np.zeros(self.side * self.side + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.starts[1:])
+
+    def arrays(self) -> dict:
+        """State needed to restore the index with ``from_arrays`` (coordinates excluded)"""
+        return {
+            "order": self.order,
+            "starts": self.starts,
+            "side": self.side,
+            "bounds": [self.xmin, self.xmax, self.ymin, self.ymax, self.cell_w, self.cell_h],
+        }
+
+    @classmethod
+    def from_arrays(cls, x, y, arrays: dict) -> "GridIndex":
+        """Rebuild an index from ``arrays()`` output without re-sorting the rows"""
+        index = cls.__new__(cls)
+        index.x = np.asarray(x)
+        index.y = np.asarray(y)
+        index.order = arrays["order"]
+        index.starts = arrays["starts"]
+        index.side = int(arrays["side"])
+        index.xmin, index.xmax, index.ymin, index.ymax, index.cell_w, index.cell_h = arrays["bounds"]
+        return index
+
+    def __len__(self):
+        return len(self.x)
+
+    def _cell_x(self, x):
+        return np.clip(((x - self.xmin) / self.cell_w).astype(np.int64), 0, self.side - 1)
+
+    def _cell_y(self, y):
+        return np.clip(((y - self.ymin) / self.cell_h).astype(np.int64), 0, self.side - 1)
+
+    def cell_range(self, x0: float, x1: float, y0: float, y1: float):
+        """Return the inclusive cell span (cx0, cx1, cy0, cy1) covering a rectangle,
+        or None when the rectangle misses the data extent."""
+        if len(self) == 0 or x0 > x1 or y0 > y1:
+            return None
+        if x1 < self.xmin or x0 > self.xmax or y1 < self.ymin or y0 > self.ymax:
+            return None
+        cx0, cx1 = self._cell_x(np.array([x0, x1]))
+        cy0, cy1 = self._cell_y(np.array([y0, y1]))
+        return int(cx0), int(cx1), int(cy0), int(cy1)
+
+    def candidates(self, x0: float, x1: float, y0: float, y1: float) -> np.ndarray:
+        """Rows of every cell overlapping the rectangle (a superset of the result)."""
+        span = self.cell_range(x0, x1, y0, y1)
+        if span is None:
+            return np.empty(0, dtype=self.order.dtype)
+        cx0, cx1, cy0, cy1 = span
+        # Cells of one grid row are adjacent, so each grid row is a single slice
+        rows = np.arange(cy0, cy1 + 1) * self.side
+        begins = self.starts[rows + cx0]
+        ends = self.starts[rows + cx1 + 1]
+        return np.concatenate([self.order[b:e] for b, e in zip(begins, ends)])
+
+    def query(self, x0: float, x1: float, y0: float, y1: float) -> np.ndarray:
+        """Return sorted row positions with x0 <= x <= x1 and y0 <= y <= y1.
+
+        Args:
+            x0, x1, y0, y1 (float): Inclusive viewport bounds
+
+        Returns:
+            np.ndarray: Ascending row positions inside the rectangle
+        """
+        rows = self.candidates(x0, x1, y0, y1)
+        if len(rows) == 0:
+            return rows
+        x = self.x[rows]
+        y = self.y[rows]
+        rows = rows[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+        rows.sort()
+        return rows
+
+    def _block(self, cx0: int, cx1: int, cy0: int, cy1: int) -> np.ndarray:
+        """Rows of an inclusive block of cells"""
+        rows = np.arange(cy0, cy1 + 1) * self.side
+        return np.concatenate([self.order[b:e] for b, e in zip(self.starts[rows + cx0], self.starts[rows + cx1 + 1])])
+
+    def nearest(self, x: float, y: float, k: int, max_distance: float = None, keep=None):
+        """The k rows closest to a point, optionally within a distance.
+
+        Searches the block of cells around the point's cell, doubling its
+        size until it holds k rows and none of the cells outside it can hold a
+        closer one, so a lookup only visits the neighbourhood of the point.
+
+        Args:
+            x, y (float): Query point
+            k (int): Number of rows to return at most
+            max_distance (float): Only rows at most this far from the point
+            keep (callable): Filters an array of rows down to those that
+                count, keeping their order (e.g. the query filters)
+
+        Returns:
+            tuple: ``(rows, distances)``, closest first (ties by row)
+        """
+        empty = np.empty(0, dtype=self.order.dtype), np.empty(0, dtype=np.float64)
+        if len(self) == 0 or k <= 0 or (max_distance is not None and max_distance < 0):
+            return empty
+        cx = int(self._cell_x(np.array([x]))[0])
+        cy = int(self._cell_y(np.array([y]))[0])
+        radius = 1
+        while True:
+            cx0, cx1 = max(cx - radius, 0), min(cx + radius, self.side - 1)
+            cy0, cy1 = max(cy - radius, 0), min(cy + radius, self.side - 1)
+            rows = self._block(cx0, cx1, cy0, cy1)
+            if keep is not None:
+                rows = keep(rows)
+            distances = np.hypot(self.x[rows] - x, self.y[rows] - y)
+            if max_distance is not None:
+                rows = rows[distances <= max_distance]
+                distances = distances[distances <= max_distance]
+
+            # Distance to the closest cell outside the block; there are no
+            # cells beyond the edges of the grid
+            gaps = [np.inf]
+            if cx0 > 0:
+                gaps.append(x - (self.xmin + cx0 * self.cell_w))
+            if cx1 < self.side - 1:
+                gaps.append(self.xmin + (cx1 + 1) * self.cell_w - x)
+            if cy0 > 0:
+                gaps.append(y - (self.ymin + cy0 * self.cell_h))
+            if cy1 < self.side - 1:
+                gaps.append(self.ymin + (cy1 + 1) * self.cell_h - y)
+            bound = min(gaps)
+
+            done = bound == np.inf or (max_distance is not None and bound > max_distance)
+            if not done and len(rows) >= k:
+                done = np.partition(distances, k - 1)[k - 1] <= bound
+            if done:
+                order = np.lexsort((rows, distances))[:k]
+                return rows[order], distances[order]
+            radius *= 2
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Synthetic dataset with the layout and schema of the production data.
+
+Writes everything the server reads from its data directory, at any scale from
+a laptop-sized sample to tens of millions of points:
+
+- ``data.parquet``: one row per protein, indexed by name, with the real
+  columns (x, y, origin, database, taxonomy, afdb_pLDDT, afdb_hq, length,
+  superCOG_v10, superCOG_v11, url, pdb_loc); points form clumps of varying
+  size and density like the real embedding, and ~1% have no coordinates
+- ``all_clusters_nf.parquet``: clusters keyed by their representative, with
+  the members as JSON lists
+- ``gonames.csv`` and the DeepFRI predictions, both per GO term
+  (``deepfri_predictions_HQ/<ontology>/<GO term>.csv``) and per protein
+  (``deepfri_predictions_protein_HQ/<protein>.csv``)
+- small mmCIF structures under ``mip-follow-up_clusters/struct`` that the
+  rows' ``pdb_loc`` point to
+
+Rows are generated and written in chunks, so memory stays bounded by the chunk
+size rather than the number of points. Serve the result with
+``DATA_DIR=<out> uvicorn server:app``.
+
+usage:
+  python synthetic_data.py --out DIR [--points N] [--seed N] [--goterms N]
+                           [--protein-goterms N] [--structures N]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+from tqdm import tqdm
+
+DATABASES = ["AFDB light clusters", "AFDB dark clusters", "ESMAtlas clusters", "MIP clusters", "MIP singletons"]
+DATABASE_SHARES = [0.35, 0.25, 0.3, 0.06, 0.04]
+# Protein names and structure pages per database, formatted with the row number
+NAME_FORMATS = ["AF-A{:09d}-F1-model_v4", "AF-B{:09d}-F1-model_v4", "MGYP{:012d}", "MIP_{:08d}", "MIP_{:08d}"]
+URL_FORMATS = [
+    "https://alphafold.ebi.ac.uk/entry/A{:09d}",
+    "https://alphafold.ebi.ac.uk/entry/B{:09d}",
+    "https://esmatlas.com/explore/detail/MGYP{:012d}",
+    "",
+    "",
+]
+ORIGINS = ["Bacteria", "Archaea", "Eukaryota", "Viruses", "Metagenome"]
+TAXONOMIES = [
+    "Bacteria", "Environmental", "Plants and Fungi", "Invertebrates", "Engineered", "Host-associated",
+    "Unknown", "Vertebrates", "Mammals", "Primates", "Rodents",
+]
+TAXONOMY_SHARES = [0.3, 0.2, 0.1, 0.08, 0.02, 0.1, 0.1, 0.04, 0.03, 0.02, 0.01]
+SUPERCOGS = [
+    "general function", "unannotated", "superCOG 1", "superCOG 2", "superCOG 3",
+    "superCOG 1+2", "superCOG 1+3", "superCOG 2+3",
+]
+SUPERCOG_SHARES = [0.15, 0.35, 0.15, 0.12, 0.1, 0.05, 0.05, 0.03]
+ONTOLOGIES = ["BP", "CC", "MF"]
+GO_WORDS = [
+    "activity", "binding", "regulation", "positive", "negative", "process", "transport", "transmembrane",
+    "kinase", "phosphatase", "transferase", "hydrolase", "oxidoreductase", "ligase", "isomerase", "membrane",
+    "nucleus", "cytoplasm", "mitochondrial", "ribosome", "protein", "nucleic", "acid", "dna", "rna", "atp",
+    "metal", "ion", "zinc", "iron", "sulfur", "cluster", "complex", "assembly", "biosynthetic", "catabolic",
+    "metabolic", "signaling", "pathway", "response", "stimulus", "cell", "wall", "organization", "repair",
+    "replication", "transcription", "translation", "folding", "secretion", "receptor", "channel", "sodium",
+    "potassium", "calcium", "glucose", "lipid", "fatty", "amino", "peptidase", "serine", "cysteine", "type",
+]
+RESIDUE_ATOMS = [("N", "N"), ("CA", "C"), ("C", "C"), ("O", "O"), ("CB", "C")]
+ATOM_SITE_FIELDS = [
+    "group_PDB", "id", "type_symbol", "label_atom_id", "label_alt_id", "label_comp_id", "label_asym_id",
+    "label_entity_id", "label_seq_id", "pdbx_PDB_ins_code", "Cartn_x", "Cartn_y", "Cartn_z", "occupancy",
+    "B_iso_or_equiv", "auth_seq_id", "auth_asym_id", "pdbx_PDB_model_num",
+]
+
+
+def protein_names(databases: np.ndarray, start: int) -> list:
+    """Names of rows ``start, start + 1, ...`` from their database codes"""
+    return [NAME_FORMATS[database].format(start + i) for i, database in enumerate(databases.tolist())]
+
+
+def clean_name(name: str) -> str:
+    """Representative form of a protein name, as the server derives it"""
+    return name.replace("AF-", "").replace("-model_v4", "").replace("-F1", "")
+
+
+def clump_centers(seed: int, clumps: int = 96):
+    """Centers, spreads and weights of the point clumps"""
+    rng = np.random.default_rng([seed, 0])
+    centers = np.column_stack([rng.normal(0, 6, clumps), rng.normal(-5, 8, clumps)])
+    spreads = rng.lognormal(-0.5, 0.6, clumps)
+    weights = rng.pareto(1.2, clumps) + 0.05
+    return centers, spreads, weights / weights.sum()
+
+
+def generate_rows(start: int, end: int, databases: np.ndarray, clumps, structures: int, seed: int) -> pd.DataFrame:
+    """One chunk of ``data.parquet`` (rows ``start`` to ``end``)"""
+    rng = np.random.default_rng([seed, 1, start])
+    n = end - start
+    centers, spreads, weights = clumps
+    clump = rng.choice(len(weights), n, p=weights)
+    x = centers[clump, 0] + rng.normal(0, 1, n) * spreads[clump]
+    y = centers[clump, 1] + rng.normal(0, 1, n) * spreads[clump]
+    missing = rng.random(n) < 0.01
+    x[missing] = np.nan
+    y[missing] = np.nan
+
+    afdb = databases <= 1
+    plddt = np.where(afdb, np.clip(rng.normal(75, 12, n), 20, 100), np.nan)
+    names = protein_names(databases, start)
+    return pd.DataFrame(
+        {
+            "x": x,
+            "y": y,
+            "origin": np.array(ORIGINS, dtype=object)[rng.integers(0, len(ORIGINS), n)],
+            "database": np.array(DATABASES, dtype=object)[databases],
+            "taxonomy": np.array(TAXONOMIES, dtype=object)[rng.choice(len(TAXONOMIES), n, p=TAXONOMY_SHARES)],
+            "afdb_pLDDT": plddt,
+            "afdb_hq": afdb & (plddt >= 70),
+            "length": np.clip(rng.lognormal(5.5, 0.7, n), 20, 2700).astype(np.int64),
+            "superCOG_v10": np.array(SUPERCOGS, dtype=object)[rng.choice(len(SUPERCOGS), n, p=SUPERCOG_SHARES)],
+            "superCOG_v11": np.array(SUPERCOGS, dtype=object)[rng.choice(len(SUPERCOGS), n, p=SUPERCOG_SHARES)],
+            "url": [URL_FORMATS[database].format(start + i) for i, database in enumerate(databases.tolist())],
+            # Rows share a small pool of structure files
+            "pdb_loc": [f"synthetic_{i % structures:05d}.cif" for i in range(start, end)],
+        },
+        index=pd.Index(names),
+    )
+
+
+def generate_clusters(start: int, end: int, databases: np.ndarray, seed: int) -> pd.DataFrame:
+    """Clusters of rows ``start`` to ``end``, keyed by the clean name of their
+    first member (most are small, a few are large)"""
+    rng = np.random.default_rng([seed, 2, start])
+    names = protein_names(databases, start)
+    order = rng.permutation(end - start)
+    sizes = np.minimum(rng.zipf(2.0, end - start), 1000)
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+    bounds = bounds[bounds < end - start]
+    clusters = [[names[i] for i in order[a:b].tolist()] for a, b in zip(bounds, np.append(bounds[1:], end - start))]
+    return pd.DataFrame(
+        {"Protein": [json.dumps(members) for members in clusters]},
+        index=pd.Index([clean_name(members[0]) for members in clusters]),
+    )
+
+
+def write_parquet(path: str, chunks) -> None:
+    """Write DataFrame chunks as one Parquet file with pandas metadata"""
+    writer = None
+    try:
+        for frame in chunks:
+            table = pa.Table.from_pandas(frame, preserve_index=True)
+            if writer is None:
+                writer = pq.ParquetWriter(path + ".tmp", table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(path + ".tmp", path)
+
+
+def write_goterms(out: str, databases: np.ndarray, goterms: int, protein_goterms: int, seed: int) -> None:
+    """GO term names and DeepFRI predictions per GO term and per protein"""
+    rng = np.random.default_rng([seed, 3])
+    n = len(databases)
+    ids = [f"GO:{code:07d}" for code in np.sort(rng.choice(10**7, goterms, replace=False)).tolist()]
+    names = [" ".join(rng.choice(GO_WORDS, rng.integers(2, 6)).tolist()) for _ in ids]
+    pd.DataFrame({"index": ids, "GOname": names}).to_csv(os.path.join(out, "gonames.csv"))
+
+    # Each term belongs to one ontology; a few terms are predicted for many
+    # proteins, most for a handful
+    ontologies = rng.integers(0, len(ONTOLOGIES), goterms)
+    sizes = np.clip((n * 0.002 * rng.pareto(1.5, goterms)).astype(np.int64), 10, min(n, 200_000))
+    for ontology in ONTOLOGIES:
+        os.makedirs(os.path.join(out, "deepfri_predictions_HQ", ontology), exist_ok=True)
+    for go_id, ontology, size in tqdm(zip(ids, ontologies.tolist(), sizes.tolist()), total=goterms, desc="GO term predictions"):
+        rows = np.unique(rng.integers(0, n, size))
+        scores = rng.uniform(0.3, 1, len(rows))
+        with open(os.path.join(out, "deepfri_predictions_HQ", ONTOLOGIES[ontology], f"{go_id}.csv"), "w") as f:
+            f.write("Protein,Score\n")
+            f.writelines(
+                f"{NAME_FORMATS[database].format(i)},{score:.4f}\n"
+                for i, database, score in zip(rows.tolist(), databases[rows].tolist(), scores.tolist())
+            )
+
+    protein_loc = os.path.join(out, "deepfri_predictions_protein_HQ")
+    os.makedirs(protein_loc, exist_ok=True)
+    for i in tqdm(np.unique(rng.integers(0, n, min(protein_goterms, n))).tolist(), desc="Protein predictions"):
+        terms = rng.choice(goterms, min(goterms, rng.integers(1, 30)), replace=False)
+        scores = rng.uniform(0.3, 1, len(terms))
+        with open(os.path.join(protein_loc, f"{NAME_FORMATS[databases[i]].format(i)}.csv"), "w") as f:
+            f.write("GO-term,Ontology,Score\n")
+            f.writelines(
+                f"{ids[t]},{ONTOLOGIES[ontologies[t]]},{score:.4f}\n"
+                for t, score in zip(terms.tolist(), scores.tolist())
+            )
+
+
+def write_structure(path: str, rng: np.random.Generator, chains: int, residues: int) -> None:
+    """A small mmCIF model: a random-walk backbone of alanines per chain"""
+    lines = ["data_synthetic", "#", "loop_"] + [f"_atom_site.{field}" for field in ATOM_SITE_FIELDS]
+    serial = 1
+    for chain in range(chains):
+        chain_id = chr(ord("A") + chain)
+        trace = np.cumsum(rng.normal(0, 2.2, (residues, 3)), axis=0)
+        for residue in range(residues):
+            for k, (atom, element) in enumerate(RESIDUE_ATOMS):
+                x, y, z = (trace[residue] + rng.normal(0, 0.8, 3) * (k > 0)).tolist()
+                lines.append(
+                    f"ATOM {serial} {element} {atom} . ALA {chain_id} 1 {residue + 1} ? "
+                    f"{x:.3f} {y:.3f} {z:.3f} 1.00 {rng.uniform(30, 95):.2f} {residue + 1} {chain_id} 1"
+                )
+                serial += 1
+    lines.append("#")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def generate(out: str, points: int, seed: int = 0, goterms: int = 2000, protein_goterms: int = 10000,
+             structures: int = 200, chunk_size: int = 1_000_000) -> None:
+    """Write a complete synthetic data directory.
+
+    Args:
+        out (str): Output directory
+        points (int): Number of proteins
+        seed (int): Random seed; the same seed and chunk size give the same data
+        goterms (int): Number of GO terms with names and predictions
+        protein_goterms (int): Number of proteins with a per-protein
+            prediction file
+        structures (int): Number of distinct structure files
+        chunk_size (int): Rows generated at a time
+    """
+    total_start_time = time.time()
+    os.makedirs(out, exist_ok=True)
+    rng = np.random.default_rng([seed, 4])
+    databases = rng.choice(len(DATABASES), points, p=DATABASE_SHARES).astype(np.uint8)
+    bounds = list(range(0, points, chunk_size)) + [points]
+    spans = list(zip(bounds[:-1], bounds[1:]))
+    clumps = clump_centers(seed)
+
+    start_time = time.time()
+    write_parquet(
+        os.path.join(out, "data.parquet"),
+        (generate_rows(a, b, databases[a:b], clumps, structures, seed) for a, b in tqdm(spans, desc="data.parquet")),
+    )
+    logger.info(f"Writing {points} points took {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    write_parquet(
+        os.path.join(out, "all_clusters_nf.parquet"),
+        (generate_clusters(a, b, databases[a:b], seed) for a, b in tqdm(spans, desc="all_clusters_nf.parquet")),
+    )
+    logger.info(f"Writing clusters took {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    write_goterms(out, databases, goterms, protein_goterms, seed)
+    logger.info(f"Writing GO terms took {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    struct_loc = os.path.join(out, "mip-follow-up_clusters", "struct")
+    os.makedirs(struct_loc, exist_ok=True)
+    structure_rng = np.random.default_rng([seed, 5])
+    for i in range(structures):
+        write_structure(
+            os.path.join(struct_loc, f"synthetic_{i:05d}.cif"),
+            structure_rng,
+            chains=int(structure_rng.integers(1, 4)),
+            residues=int(structure_rng.integers(50, 400)),
+        )
+    logger.info(f"Writing {structures} structures took {time.time() - start_time:.2f}s")
+    logger.info(f"Synthetic dataset in {out} took {time.time() - total_start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset with the production layout")
+    parser.add_argument("--out", required=True, help="Output data directory")
+    parser.add_argument("--points", type=int, default=100_000, help="Number of proteins")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--goterms", type=int, default=2000, help="Number of GO terms")
+    parser.add_argument("--protein-goterms", type=int, default=10000, help="Proteins with a per-protein prediction file")
+    parser.add_argument("--structures", type=int, default=200, help="Number of structure files")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Rows generated at a time")
+    args = parser.parse_args()
+
+    generate(args.out, args.points, args.seed, args.goterms, args.protein_goterms, args.structures, args.chunk_size)
@@ -0,0 +1,33 @@
+"""Checks the size bound and eviction order of ByteLRU."""
+
+from byte_lru import ByteLRU
+
+
+def test_evicts_least_recently_used():
+    cache = ByteLRU(10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"1234")
+    # b was used longest ago
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234" and cache.get("c") == b"1234"
+    assert cache.size == 8 and len(cache) == 2
+
+
+def test_replace_and_oversized():
+    cache = ByteLRU(10)
+    cache.put("a", b"12")
+    cache.put("a", b"123456")
+    assert cache.size == 6
+    assert cache.put("b", b"x" * 11) == b"x" * 11
+    assert cache.get("b") is None and cache.size == 6
+
+
+def test_sizeof_and_stats():
+    cache = ByteLRU(100, sizeof=lambda value: value["bytes"])
+    for i in range(5):
+        cache.put(i, {"bytes": 30})
+    cache.get(0)
+    cache.get(4)
+    assert cache.stats() == {"entries": 3, "bytes": 90, "max_bytes": 100, "hits": 1, "misses": 1}
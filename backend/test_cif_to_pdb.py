@@ -0,0 +1,122 @@
+"""Checks the streaming mmCIF to PDB conversion against the Biopython path."""
+
+import io
+import warnings
+
+import numpy as np
+import pytest
+from Bio.PDB import PDBIO
+from Bio.PDB.MMCIFParser import MMCIFParser
+from Bio.PDB.StructureBuilder import StructureBuilder
+from Bio.PDB.mmcifio import MMCIFIO
+
+from cif_to_pdb import OutOfChainsError, UnsupportedCIFError, cif_to_pdb, rename_chains, stream_cif_to_pdb
+
+BACKBONE = [("N", "N"), ("CA", "C"), ("C", "C"), ("O", "O"), ("CB", "C"), ("HB1", "H")]
+
+
+def write_cif(path, chains, residues=20, models=1, altloc=False, icode=False, quoted=False, water=True, b_scale=100.0):
+    """Write a synthetic structure with MMCIFIO"""
+    rng = np.random.default_rng(0)
+    builder = StructureBuilder()
+    builder.init_structure("test")
+    serial = 1
+    for model in range(models):
+        builder.init_model(model, model + 1)
+        for chain in chains:
+            builder.init_chain(chain)
+            builder.init_seg("    ")
+            for resseq in range(1, residues + 1):
+                builder.init_residue("ALA", " ", resseq, " ")
+                atoms = BACKBONE + ([("O5'", "O")] if quoted else [])
+                for name, element in atoms:
+                    split = altloc and resseq == 3 and name == "CB"
+                    builder.init_atom(name, rng.normal(size=3) * 30, float(rng.random() * b_scale),
+                                      0.5 if split else 1.0, "A" if split else " ", name, serial, element)
+                    serial += 1
+                    if split:
+                        builder.init_atom(name, rng.normal(size=3) * 30, 10.0, 0.5, "B", name, serial, element)
+                        serial += 1
+                if icode and resseq == 5:
+                    builder.init_residue("GLY", " ", resseq, "A")
+                    builder.init_atom("CA", rng.normal(size=3), 5.0, 1.0, " ", "CA", serial, "C")
+                    serial += 1
+            if water:
+                builder.init_residue("HOH", "W", residues + 1, " ")
+                builder.init_atom("O", rng.normal(size=3), 30.0, 1.0, " ", "O", serial, "O")
+                builder.init_residue("ZN", "H", residues + 2, " ")
+                builder.init_atom("ZN", rng.normal(size=3), 30.0, 1.0, " ", "ZN", serial + 1, "ZN")
+                serial += 2
+    writer = MMCIFIO()
+    writer.set_structure(builder.get_structure())
+    writer.save(str(path))
+    return str(path)
+
+
+def biopython_pdb(ciffile) -> str:
+    """The conversion through a Biopython structure"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        structure = MMCIFParser(QUIET=True).get_structure("1xxx", ciffile)
+    rename_chains(structure)
+    out = io.StringIO()
+    writer = PDBIO()
+    writer.set_structure(structure)
+    writer.save(out)
+    return out.getvalue()
+
+
+SUPPORTED = {
+    "plain": dict(chains=["A", "B"]),
+    "long_chain_ids": dict(chains=["AA", "AB", "B", "BA", "C1"]),
+    "quoted_atom_names": dict(chains=["A"], quoted=True),
+    "insertion_codes": dict(chains=["A"], icode=True),
+    "large_b_factors": dict(chains=["A"], b_scale=20000.0),
+    "no_hetero": dict(chains=["A"], water=False),
+}
+
+UNSUPPORTED = {
+    "several_models": dict(chains=["A"], models=2),
+    "altlocs": dict(chains=["A"], altloc=True),
+}
+
+
+@pytest.mark.parametrize("case", SUPPORTED)
+def test_stream_matches_biopython(tmp_path, case):
+    ciffile = write_cif(tmp_path / f"{case}.cif", **SUPPORTED[case])
+    assert stream_cif_to_pdb(ciffile) == biopython_pdb(ciffile)
+
+
+@pytest.mark.parametrize("case", SUPPORTED)
+def test_cif_to_pdb_matches_biopython(tmp_path, case):
+    ciffile = write_cif(tmp_path / f"{case}.cif", **SUPPORTED[case])
+    cif_to_pdb(ciffile, str(tmp_path / "out.pdb"))
+    assert (tmp_path / "out.pdb").read_text() == biopython_pdb(ciffile)
+
+
+@pytest.mark.parametrize("case", UNSUPPORTED)
+def test_unsupported_falls_back(tmp_path, case):
+    ciffile = write_cif(tmp_path / f"{case}.cif", **UNSUPPORTED[case])
+    with pytest.raises(UnsupportedCIFError):
+        stream_cif_to_pdb(ciffile)
+    # cif_to_pdb still converts it, through Biopython
+    cif_to_pdb(ciffile, str(tmp_path / "out.pdb"))
+    assert (tmp_path / "out.pdb").read_text() == biopython_pdb(ciffile)
+
+
+def test_no_atom_site(tmp_path):
+    ciffile = tmp_path / "empty.cif"
+    ciffile.write_text("data_empty\n#\n_entry.id empty\n#\n")
+    with pytest.raises(UnsupportedCIFError):
+        stream_cif_to_pdb(str(ciffile))
+
+
+def test_out_of_chain_ids(tmp_path):
+    # Every chain id shares its first letter, so all but one need a new id
+    ciffile = write_cif(tmp_path / "chains.cif", chains=[f"A{i}" for i in range(70)], residues=1, water=False)
+    with pytest.raises(OutOfChainsError):
+        stream_cif_to_pdb(ciffile)
+    with pytest.raises(OutOfChainsError):
+        biopython_pdb(ciffile)
+    with pytest.raises(SystemExit):
+        cif_to_pdb(ciffile, str(tmp_path / "out.pdb"))
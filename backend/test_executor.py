@@ -0,0 +1,53 @@
+"""Checks BoundedExecutor limits across event loops."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from executor import BoundedExecutor, ExecutorBusy
+
+
+def contend(executor: BoundedExecutor, calls: int, seconds: float = 0.05) -> list:
+    """Run ``calls`` sleeping calls at once in a fresh event loop"""
+    async def main():
+        return await asyncio.gather(*(executor.run(time.sleep, seconds) for _ in range(calls)), return_exceptions=True)
+    return asyncio.run(main())
+
+
+def test_several_event_loops():
+    # Created outside any loop, as the server's executors are at import time
+    executor = BoundedExecutor("test", workers=2, max_queue=8)
+    for _ in range(3):
+        assert contend(executor, 6) == [None] * 6
+    assert executor.completed == 18
+    assert executor.running == executor.queued == 0
+
+
+def test_concurrency_limit():
+    executor = BoundedExecutor("test", workers=2, max_queue=8)
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def work():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(executor.run(work) for _ in range(8)))
+    asyncio.run(main())
+    assert peak[0] == 2
+
+
+def test_busy_and_timeout():
+    executor = BoundedExecutor("test", workers=1, max_queue=1, timeout=0.05)
+    results = contend(executor, 3, seconds=0.2)
+    assert sum(isinstance(result, ExecutorBusy) for result in results) == 1
+    assert sum(isinstance(result, asyncio.TimeoutError) for result in results) == 2
+    assert executor.rejected == 1 and executor.timed_out == 2
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executor.run(time.sleep, 0.2))
@@ -0,0 +1,106 @@
+"""Checks FilterIndex masks against the equivalent pandas boolean masks."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_index import FilterIndex
+
+ORIGINS = ["AFDB light clusters", "AFDB dark clusters", "MIP", "ESMAtlas"]
+
+
+@pytest.fixture(scope="module")
+def frame():
+    rng = np.random.default_rng(0)
+    n = 1000
+    frame = pd.DataFrame({
+        "origin": rng.choice(ORIGINS, n),
+        "taxonomy": rng.choice(["Bacteria", "Archaea", "Eukaryota"], n).astype(object),
+        "length": rng.integers(10, 2000, n),
+        "afdb_pLDDT": rng.uniform(20, 100, n).round(1),
+    })
+    frame.loc[rng.random(n) < 0.1, "taxonomy"] = np.nan
+    frame.loc[~frame["origin"].isin(ORIGINS[:2]), "afdb_pLDDT"] = -1
+    return frame
+
+
+@pytest.fixture(scope="module", params=["built", "restored"])
+def index(request, frame):
+    index = FilterIndex(
+        frame,
+        categorical=["origin", "taxonomy"],
+        ranges=["length", "afdb_pLDDT"],
+        always_pass={"afdb_pLDDT": -1},
+    )
+    return index if request.param == "built" else FilterIndex.from_arrays(index.arrays())
+
+
+def selected(index, **filters) -> np.ndarray:
+    return index.select(np.arange(index.size), index.mask(**filters))
+
+
+def expected(mask: pd.Series) -> np.ndarray:
+    return np.flatnonzero(mask.to_numpy())
+
+
+def test_no_filters(index, frame):
+    assert index.mask() is None
+    assert index.mask(origin=[], length=None) is None
+    np.testing.assert_array_equal(selected(index), np.arange(len(frame)))
+
+
+@pytest.mark.parametrize("origins", [ORIGINS[:1], ORIGINS[1:3], ["unknown"], ["unknown", "MIP"]])
+def test_categorical(index, frame, origins):
+    np.testing.assert_array_equal(selected(index, origin=origins), expected(frame["origin"].isin(origins)))
+
+
+def test_nan_category(index, frame):
+    # Rows without a taxonomy match no selected value
+    taxonomies = ["Bacteria", "Archaea", "Eukaryota"]
+    result = selected(index, taxonomy=taxonomies)
+    np.testing.assert_array_equal(result, expected(frame["taxonomy"].isin(taxonomies)))
+    assert frame["taxonomy"].iloc[result].notna().all()
+    assert frame["taxonomy"].isna().any()
+
+
+@pytest.mark.parametrize("lo, hi", [(100, 500), (10, 2000), (500, 500), (0, 5), (2001, 3000)])
+def test_length_range(index, frame, lo, hi):
+    np.testing.assert_array_equal(selected(index, length=[lo, hi]), expected(frame["length"].between(lo, hi)))
+
+
+def test_inverted_range(index, frame):
+    assert len(selected(index, length=[500, 100])) == 0
+    # Only the sentinel rows pass an inverted pLDDT range
+    np.testing.assert_array_equal(selected(index, afdb_pLDDT=[90, 50]), expected(frame["afdb_pLDDT"] == -1))
+
+
+@pytest.mark.parametrize("lo, hi", [(70, 90), (0, 100), (95, 100), (101, 200)])
+def test_plddt_sentinel(index, frame, lo, hi):
+    pLDDT = frame["afdb_pLDDT"]
+    np.testing.assert_array_equal(
+        selected(index, afdb_pLDDT=[lo, hi]),
+        expected(pLDDT.between(lo, hi) | (pLDDT == -1)),
+    )
+
+
+def test_combined(index, frame):
+    pLDDT = frame["afdb_pLDDT"]
+    mask = (
+        frame["origin"].isin(ORIGINS[:3])
+        & frame["taxonomy"].isin(["Bacteria"])
+        & frame["length"].between(200, 1500)
+        & (pLDDT.between(60, 80) | (pLDDT == -1))
+    )
+    result = selected(index, origin=ORIGINS[:3], taxonomy=["Bacteria"], length=[200, 1500], afdb_pLDDT=[60, 80])
+    np.testing.assert_array_equal(result, expected(mask))
+
+
+def test_select_keeps_order(index, frame):
+    rows = np.random.default_rng(1).permutation(len(frame))
+    result = index.select(rows, index.mask(origin=["MIP"]))
+    np.testing.assert_array_equal(result, rows[frame["origin"].to_numpy()[rows] == "MIP"])
+
+
+def test_unknown_column(index):
+    with pytest.raises(KeyError):
+        index.mask(superCOG_v10=["Information"])
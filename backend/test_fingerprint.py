@@ -0,0 +1,55 @@
+"""Checks which changes to a source tree the fingerprints notice."""
+
+import os
+
+from fingerprint import directory_mtimes, files_fingerprint
+
+
+def tree(tmp_path):
+    for ontology in ("BP", "MF"):
+        (tmp_path / ontology).mkdir()
+        for term in range(3):
+            (tmp_path / ontology / f"GO_{term}.csv").write_text("Protein\nA\n")
+    return str(tmp_path)
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_unchanged(tmp_path):
+    root = tree(tmp_path)
+    assert directory_mtimes(root, depth=1) == directory_mtimes(root, depth=1)
+    assert files_fingerprint(root) == files_fingerprint(root)
+    assert set(directory_mtimes(root, depth=1)) == {".", "BP", "MF"}
+    assert set(directory_mtimes(root)) == {"."}
+
+
+def test_added_file(tmp_path):
+    root = tree(tmp_path)
+    mtimes, files = directory_mtimes(root, depth=1), files_fingerprint(root)
+    (tmp_path / "MF" / "GO_new.csv").write_text("Protein\n")
+    bump_mtime(tmp_path / "MF")
+    assert directory_mtimes(root, depth=1) != mtimes
+    assert files_fingerprint(root) != files
+    # Deeper than the depth looked at
+    assert directory_mtimes(root) == {".": mtimes["."]}
+
+
+def test_rewritten_in_place(tmp_path):
+    root = tree(tmp_path)
+    mtimes, files = directory_mtimes(root, depth=1), files_fingerprint(root)
+    path = tmp_path / "BP" / "GO_1.csv"
+    path.write_text("Protein\nA\nB\n")
+    bump_mtime(path)
+    # Only the full fingerprint notices
+    assert directory_mtimes(root, depth=1) == mtimes
+    assert files_fingerprint(root) != files
+
+
+def test_other_suffixes_ignored(tmp_path):
+    root = tree(tmp_path)
+    files = files_fingerprint(root)
+    (tmp_path / "BP" / "notes.txt").write_text("x")
+    assert files_fingerprint(root) == files
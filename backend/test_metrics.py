@@ -0,0 +1,79 @@
+"""Checks that a shared metrics directory sums the workers' metrics."""
+
+import json
+import os
+import subprocess
+import sys
+
+from metrics import Registry, process_token
+
+
+def registry(shared_dir=None):
+    metrics = Registry(shared_dir, flush_interval=3600)
+    requests = metrics.counter("requests_total", "Requests", ["route"])
+    latency = metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    metrics.callback("cache_bytes", "Cache size", "gauge", (), lambda: {(): 10})
+    return metrics, requests, latency
+
+
+def exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_local_only(tmp_path):
+    metrics, requests, _ = registry()
+    requests.inc(route="/a")
+    assert 'requests_total{route="/a"} 1' in metrics.render()
+    assert not list(tmp_path.iterdir())
+
+
+def test_sums_workers(tmp_path):
+    other, requests, latency = registry(str(tmp_path))
+    requests.inc(2, route="/a")
+    latency.observe(0.5)
+    state = {metric.name: metric.state() for metric in other._metrics}
+    launch = tmp_path / process_token(os.getppid())
+    # One worker that is still running (pid 1) and one that exited
+    (launch / f"{exited_pid()}-1.json").write_text(json.dumps(state))
+    (launch / f"{process_token(1)}.json").write_text(json.dumps(state))
+
+    metrics, requests, latency = registry(str(tmp_path))
+    requests.inc(route="/a")
+    requests.inc(route="/b")
+    latency.observe(0.05)
+    text = metrics.render()
+    assert 'requests_total{route="/a"} 5' in text
+    assert 'requests_total{route="/b"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 3' in text
+    assert "latency_seconds_count 3" in text
+    # The gauge of the exited worker is dropped
+    assert "cache_bytes 20" in text
+
+
+def test_ignores_partial_files(tmp_path):
+    launch = tmp_path / process_token(os.getppid())
+    launch.mkdir()
+    (launch / "123.json.tmp").write_text("{")
+    (launch / "456.json").write_text("{")
+    metrics, requests, _ = registry(str(tmp_path))
+    requests.inc(route="/a")
+    assert 'requests_total{route="/a"} 1' in metrics.render()
+
+
+def test_removes_finished_launches(tmp_path):
+    # An earlier launch, one whose pid was reused and files of the old layout
+    finished = tmp_path / f"{exited_pid()}-1"
+    reused = tmp_path / f"{os.getppid()}-1"
+    running = tmp_path / process_token(1)
+    for launch in (finished, reused, running):
+        launch.mkdir()
+        (launch / "2-1.json").write_text('{"requests_total": [[["/a"], 7]]}')
+    (tmp_path / "3.json").write_text('{"requests_total": [[["/a"], 7]]}')
+
+    metrics, requests, _ = registry(str(tmp_path))
+    requests.inc(route="/a")
+    assert 'requests_total{route="/a"} 1' in metrics.render()
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([running.name, process_token(os.getppid())])
@@ -0,0 +1,67 @@
+"""Checks NameIndex lookups against a brute-force search of the names."""
+
+import numpy as np
+import pytest
+
+from name_index import NameIndex
+
+# Shared by every name, so only a scan finds it
+PREFIX = "af-"
+
+
+@pytest.fixture(scope="module")
+def names():
+    rng = np.random.default_rng(0)
+    letters = np.array(list("ABCDEFGHKLMNPQRSTVWXYZ0123456789"))
+    return np.array([PREFIX + "".join(rng.choice(letters, 8)) for _ in range(5000)], dtype=object)
+
+
+def brute_force(names, query) -> set:
+    query = query.lower()
+    return {i for i, name in enumerate(names) if query in name.lower()}
+
+
+@pytest.mark.parametrize("query", ["AB1", "q9z", "ZZZZ", "af-a"])
+def test_substring_matches(names, query):
+    index = NameIndex(names, max_postings=len(names))
+    found, complete = index.find(query, "substring", limit=len(names))
+    assert complete
+    assert set(found.tolist()) == brute_force(names, query)
+
+
+def test_prefix_and_exact(names):
+    index = NameIndex(names)
+    found, complete = index.find(names[7], "exact")
+    assert complete and found.tolist() == [7]
+    found, complete = index.find(PREFIX + "A", "prefix", limit=len(names))
+    assert complete
+    assert set(found.tolist()) == {i for i, name in enumerate(names) if name.startswith(PREFIX + "A")}
+
+
+def test_scan_reports_unchecked_names(names):
+    index = NameIndex(names, max_verify=1000)
+    # Every name matches; stopping at the limit leaves names unchecked
+    found, complete = index.find(PREFIX, "substring", limit=10)
+    assert len(found) == 10 and not complete
+    # A rare short query: the scan stops at max_verify without the limit
+    query = "9"
+    found, complete = index.find(query, "substring", limit=len(names))
+    assert not complete
+    assert set(found.tolist()) < brute_force(names, query)
+    assert len(index.search(query, "substring", limit=len(names))) == len(found)
+
+
+def test_scan_of_whole_index(names):
+    index = NameIndex(names[:500], max_verify=1000)
+    found, complete = index.find("9", "substring", limit=500)
+    assert complete
+    assert set(found.tolist()) == brute_force(names[:500], "9")
+
+
+def test_capped_candidates(names):
+    index = NameIndex(names, max_postings=len(names), max_verify=50)
+    # About one name in 32 has "f-a"; more candidates than max_verify
+    found, complete = index.find("f-a", "substring", limit=len(names))
+    matches = brute_force(names, "f-a")
+    assert len(matches) > 50 and not complete
+    assert set(found.tolist()) < matches
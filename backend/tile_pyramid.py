@@ -0,0 +1,214 @@
+"""
+Level-of-detail tile pyramid over the 2D embedding.
+
+Level ``z`` splits the data extent into ``2**z x 2**z`` tiles. Every tile keeps a
+fixed budget of representative rows, chosen deterministically and stratified
+by density: at the finest level each tile takes rows round-robin from a grid of
+sub-cells, and every coarser tile takes rows round-robin from the samples of
+its four children. Sparse regions therefore stay visible next to dense ones,
+and a viewport is answered by looking up a handful of tiles at the matching
+zoom instead of scanning every point inside it.
+"""
+
+import numpy as np
+
+
+def _group_starts(sorted_keys):
+    """Start offset of every run of equal values in a sorted array."""
+    if len(sorted_keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([[0], np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1])
+
+
+def _rank_in_group(sorted_keys):
+    """Position of every element inside its run of equal values."""
+    starts = _group_starts(sorted_keys)
+    sizes = np.diff(np.append(starts, len(sorted_keys)))
+    return np.arange(len(sorted_keys)) - np.repeat(starts, sizes)
+
+
+class _Level:
+    """Tiles of one zoom level stored CSR-style: sorted tile keys, offsets into
+    the concatenated sample array and the true number of rows per tile."""
+
+    def __init__(self, keys, starts, samples, totals):
+        self.keys = keys
+        self.starts = starts
+        self.samples = samples
+        self.totals = totals
+
+    def lookup(self, key: int):
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        return i
+
+
+class TilePyramid:
+    """Quadtree of fixed-budget tile samples.
+
+    Args:
+        x (np.ndarray): X coordinates, one per row (no NaNs)
+        y (np.ndarray): Y coordinates, one per row (no NaNs)
+        budget (int): Maximum number of rows kept per tile
+        max_level (int): Finest zoom level; derived from the row count if None
+        strata (int): Sub-cells per axis used to stratify the finest tiles
+    """
+
+    def __init__(self, x, y, budget: int = 256, max_level: int = None, strata: int = 4):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.budget = budget
+        n = len(self.x)
+
+        if max_level is None:
+            max_level = int(np.clip(np.ceil(np.log2(np.sqrt(max(n, 1) / budget))), 0, 12))
+        self.max_level = max_level
+
+        if n:
+            self.xmin, self.xmax = float(self.x.min()), float(self.x.max())
+            self.ymin, self.ymax = float(self.y.min()), float(self.y.max())
+        else:
+            self.xmin = self.xmax = self.ymin = self.ymax = 0.0
+        self.width = max(self.xmax - self.xmin, 1e-12)
+        self.height = max(self.ymax - self.ymin, 1e-12)
+
+        rows = np.arange(n, dtype=np.int64)
+        side = 2 ** max_level
+
+        # Finest level: rank rows inside their sub-cell, then fill every tile
+        # with the lowest ranks first
+        sx, sy = self._tile_xy(self.x, self.y, side * strata)
+        stratum = sy * (side * strata) + sx
+        order = np.argsort(stratum, kind="stable")
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = _rank_in_group(stratum[order])
+        tile = (sy // strata) * side + (sx // strata)
+        totals = np.ones(n, dtype=np.int64)
+
+        levels = [self._select(tile, rank, rows, totals)]
+        for _ in range(max_level):
+            child = levels[-1]
+            side //= 2
+            key = child.keys
+            parent = ((key // (side * 2)) // 2) * side + (key % (side * 2)) // 2
+            counts = np.diff(child.starts)
+            rank = _rank_in_group(np.repeat(np.arange(len(key)), counts))
+            levels.append(self._select(
+                np.repeat(parent, counts),
+                rank,
+                child.samples,
+                # Only the first sample of a child carries its row total
+                np.where(rank == 0, np.repeat(child.totals, counts), 0),
+            ))
+        self.levels = levels[::-1]
+
+    def arrays(self) -> dict:
+        """State needed to restore the pyramid with ``from_arrays`` (coordinates excluded)"""
+        arrays = {
+            "budget": self.budget,
+            "max_level": self.max_level,
+            "bounds": [self.xmin, self.xmax, self.ymin, self.ymax, self.width, self.height],
+        }
+        for z, level in enumerate(self.levels):
+            for name in ("keys", "starts", "samples", "totals"):
+                arrays[f"level{z}_{name}"] = getattr(level, name)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, x, y, arrays: dict) -> "TilePyramid":
+        """Rebuild a pyramid from ``arrays()`` output without resampling"""
+        pyramid = cls.__new__(cls)
+        pyramid.x = np.asarray(x)
+        pyramid.y = np.asarray(y)
+        pyramid.budget = int(arrays["budget"])
+        pyramid.max_level = int(arrays["max_level"])
+        pyramid.xmin, pyramid.xmax, pyramid.ymin, pyramid.ymax, pyramid.width, pyramid.height = arrays["bounds"]
+        pyramid.levels = [
+            _Level(*(arrays[f"level{z}_{name}"] for name in ("keys", "starts", "samples", "totals")))
+            for z in range(pyramid.max_level + 1)
+        ]
+        return pyramid
+
+    def _tile_xy(self, x, y, side: int):
+        tx = np.clip(((x - self.xmin) / self.width * side).astype(np.int64), 0, side - 1)
+        ty = np.clip(((y - self.ymin) / self.height * side).astype(np.int64), 0, side - 1)
+        return tx, ty
+
+    def _select(self, tile, rank, rows, totals) -> _Level:
+        order = np.lexsort((rows, rank, tile))
+        tile_sorted = tile[order]
+        keep = _rank_in_group(tile_sorted) < self.budget
+        starts = _group_starts(tile_sorted)
+        keys = tile_sorted[starts]
+        tile_totals = np.add.reduceat(totals[order], starts) if len(starts) else starts
+        kept_tiles = tile_sorted[keep]
+        return _Level(
+            keys,
+            np.append(_group_starts(kept_tiles), len(kept_tiles)),
+            rows[order][keep],
+            tile_totals,
+        )
+
+    def level_for(self, x0: float, x1: float, y0: float, y1: float) -> int:
+        """Zoom level whose tiles are at least a quarter of the viewport size, so
+        a viewport overlaps at most 5x5 tiles."""
+        span = max((x1 - x0) / self.width, (y1 - y0) / self.height)
+        if span <= 0:
+            return self.max_level + 1
+        return max(0, int(np.floor(np.log2(4 / span))))
+
+    def tile(self, z: int, tx: int, ty: int) -> np.ndarray:
+        """Sample rows of a single tile (empty if the tile holds no data)."""
+        if not 0 <= z <= self.max_level:
+            return np.empty(0, dtype=np.int64)
+        side = 2 ** z
+        if not (0 <= tx < side and 0 <= ty < side):
+            return np.empty(0, dtype=np.int64)
+        level = self.levels[z]
+        i = level.lookup(ty * side + tx)
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return level.samples[level.starts[i]:level.starts[i + 1]]
+
+    def query(self, x0: float, x1: float, y0: float, y1: float, z: int = None):
+        """Representative rows inside a viewport.
+
+        Args:
+            x0, x1, y0, y1 (float): Inclusive viewport bounds
+            z (int): Zoom level to read; ``level_for`` the viewport if None
+
+        Returns:
+            tuple | None: ``(rows, complete)`` where rows are ordered so that any
+            prefix is spread evenly over the overlapping tiles and ``complete``
+            tells whether the tiles hold every row of the viewport. None when the
+            viewport is smaller than the finest tiles.
+        """
+        if z is None:
+            z = self.level_for(x0, x1, y0, y1)
+        if z > self.max_level:
+            return None
+        if x0 > x1 or y0 > y1 or x1 < self.xmin or x0 > self.xmax or y1 < self.ymin or y0 > self.ymax:
+            return np.empty(0, dtype=np.int64), True
+
+        side = 2 ** z
+        level = self.levels[z]
+        (tx0, tx1), (ty0, ty1) = self._tile_xy(np.array([x0, x1]), np.array([y0, y1]), side)
+        parts, complete = [], True
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                i = level.lookup(ty * side + tx)
+                if i is None:
+                    continue
+                parts.append(level.samples[level.starts[i]:level.starts[i + 1]])
+                complete &= bool(level.totals[i] <= self.budget)
+        if not parts:
+            return np.empty(0, dtype=np.int64), True
+
+        rows = np.concatenate(parts)
+        rank = np.concatenate([np.arange(len(p)) for p in parts])
+        order = np.lexsort((rows, rank))
+        rows = rows[order]
+        x = self.x[rows]
+        y = self.y[rows]
+        return rows[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)], complete
@@ -562,7 +562,8 @@ function App() {
     fetch(`${host}/name_search?name=${datum.protein}`)
       .then(res => res.json())
       .then(data => {
-        datum.others = data[0].others[0];
+        datum.others = data[0].others;
+        datum.othersTotal = data[0].others_total;
         if (datum.protein == datum.clean_name)
           setSelectedNonRepresentative(null);
         else
@@ -846,6 +847,11 @@ function App() {
                           </Box>
                         )
                       })}
+                      {data.othersTotal > data.others.length && (
+                        <Typography variant="body2" color="text.secondary" sx={{ p: 0.5 }}>
+                          and {data.othersTotal - data.others.length} more
+                        </Typography>
+                      )}
                     </Box>
                   </Card>
                 ) : <Box sx={{ width: "50%" }}></Box>}